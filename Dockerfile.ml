@@ -20,8 +20,15 @@ RUN mkdir -p models
 # Note: You should train your model and place it in packages/api/src/ai/datasets/models/
 COPY packages/api/src/ai/datasets/models* ./models/
 
-# Copy the server script
+# Copy the server script (plus the rule-based scorer it falls back to and the score store reader)
 COPY packages/api/src/ai/datasets/ml_server_fastapi.py .
+COPY packages/api/src/ai/datasets/build_ml_training_dataset.py .
+COPY packages/api/src/ai/datasets/score_store.py .
+COPY packages/api/src/ai/datasets/dataset_io.py .
+COPY packages/api/src/ai/datasets/dataset_stats.py .
+# Training script for the /admin/retrain job (mount the latest datasets at /app/datasets)
+COPY packages/api/src/ai/datasets/train_model.py .
+COPY packages/api/src/ai/datasets/matrix_cache.py .
 
 # Create non-root user for security
 RUN adduser --disabled-password --gecos '' kovariuser && \
@@ -22,7 +22,8 @@ BACKUP_DIR = Path("models/backups")
 MODEL_FILES = [
     "match_compatibility_model.pkl",
     "model_features.json",
-    "model_metadata.json"
+    "model_metadata.json",
+    "feature_histograms.json"
 ]
 
 def backup_model():
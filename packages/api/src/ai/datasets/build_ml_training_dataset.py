@@ -14,16 +14,28 @@ Strictly follows the specified methodology:
 - Data cleaning and validation
 """
 
+import os
 import sys
+import time
+import argparse
 import json
+import shutil
+import tempfile
 import pandas as pd
 import numpy as np
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 import io
 
-# Fix Windows console encoding
-if sys.platform == 'win32':
+from dataset_io import DatasetWriter, dataset_files, iter_dataset_batches, write_dataset
+from dataset_stats import (
+    HISTOGRAM_BINS, HISTOGRAM_RANGE, compute_dataset_stats, frame_stats, write_stats_report
+)
+
+# Fix Windows console encoding (only when run as a script - the ML server
+# imports the compatibility function from here and wraps the streams itself)
+if sys.platform == 'win32' and __name__ == "__main__":
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
@@ -33,7 +45,7 @@ if sys.platform == 'win32':
 
 TARGET_SAMPLES = 20000  # Between 15,000-30,000
 OUTPUT_DIR = Path("datasets")
-OUTPUT_FILE = OUTPUT_DIR / "ml_training_dataset.csv"
+OUTPUT_FILE = OUTPUT_DIR / "ml_training_dataset.parquet"
 
 # Feature weights (hierarchical compatibility function)
 # Updated: Primary = 75%, Secondary = 25% (increased secondary influence)
@@ -66,11 +78,40 @@ SIGMOID_CENTER = 0.55  # Adjusted to achieve 40-55% positive class balance
 # How often to generate group samples vs solo samples
 GROUP_SAMPLE_PROBABILITY = 0.5
 
+# Cleaning: rows are duplicates when these features agree to DEDUP_DECIMALS
+# decimals (after float32 rounding, as stored); columns are constant when
+# max - min is below CONSTANT_TOLERANCE
+DEDUP_FEATURE_COLUMNS = ['destinationScore', 'dateOverlapScore', 'budgetScore',
+                         'interestScore', 'personalityScore', 'ageScore',
+                         'destination_interest', 'date_budget',
+                         'groupSizeScore', 'groupDiversityScore']  # Include group-only features
+DEDUP_DECIMALS = 6
+CONSTANT_TOLERANCE = 1e-6
+
+# Row hashes kept in memory (8 bytes each) before spilling a sorted run to disk
+DEDUP_MEMORY_HASHES = 50_000_000
+CLEAN_BATCH_ROWS = 1_000_000
+
 # ============================================================================
 # 1. FEATURE GENERATION FUNCTIONS
 # ============================================================================
+# Each function draws `size` samples at once from a numpy Generator.
+
+DESTINATION_TIER_CUTOFFS = [0.40, 0.60, 0.80]
+DESTINATION_TIER_SCORES = np.array([1.0, 0.7, 0.3, 0.0])
+
+DATE_OVERLAP_BIN_CUTOFFS = [0.25, 0.50, 0.80]
+DATE_OVERLAP_BIN_LOW = np.array([0.0, 0.1, 0.3, 0.7])
+DATE_OVERLAP_BIN_HIGH = np.array([0.0, 0.3, 0.7, 1.0])
+
+GROUP_SIZE_EDGES = [6, 12, 20, 40]
+GROUP_SIZE_SCORES = np.array([1.0, 0.8, 0.6, 0.4, 0.2])
+
+# Score by dominant language/nationality count (index = count; 0 unused)
+DIVERSITY_COUNT_SCORES = np.array([0.0, 0.5, 0.7, 1.0, 1.0])
 
-def generate_destination_score():
+
+def generate_destination_score(rng, size):
     """
     PRIMARY FEATURE: Destination Score (Hard Constraint)
     
@@ -80,18 +121,11 @@ def generate_destination_score():
     - 20% same country different region (0.3)
     - 20% different country (0.0)
     """
-    rand = np.random.random()
-    if rand < 0.40:
-        return 1.0
-    elif rand < 0.60:
-        return 0.7
-    elif rand < 0.80:
-        return 0.3
-    else:
-        return 0.0
+    tier = np.searchsorted(DESTINATION_TIER_CUTOFFS, rng.random(size), side='right')
+    return DESTINATION_TIER_SCORES[tier]
 
 
-def generate_date_overlap_score():
+def generate_date_overlap_score(rng, size):
     """
     PRIMARY FEATURE: Date Overlap Score (Hard Feasibility)
     
@@ -101,54 +135,49 @@ def generate_date_overlap_score():
     - 30% → 0.3-0.7
     - 20% → 0.7-1.0
     """
-    rand = np.random.random()
-    if rand < 0.25:
-        return 0.0
-    elif rand < 0.50:
-        return np.random.uniform(0.1, 0.3)
-    elif rand < 0.80:
-        return np.random.uniform(0.3, 0.7)
-    else:
-        return np.random.uniform(0.7, 1.0)
+    bin_idx = np.searchsorted(DATE_OVERLAP_BIN_CUTOFFS, rng.random(size), side='right')
+    low = DATE_OVERLAP_BIN_LOW[bin_idx]
+    high = DATE_OVERLAP_BIN_HIGH[bin_idx]
+    return low + (high - low) * rng.random(size)
 
 
-def generate_budget_score():
+def generate_budget_score(rng, size):
     """
     PRIMARY FEATURE: Budget Score (Soft but Important)
     
     Natural spread across 0-1, no default 0.5
     """
     # Generate realistic budget difference
-    budget_diff_ratio = np.random.beta(2, 3)  # Skewed towards smaller differences
-    budget_score = max(0.0, 1.0 - budget_diff_ratio)
-    return round(budget_score, 3)
+    budget_diff_ratio = rng.beta(2, 3, size)  # Skewed towards smaller differences
+    budget_score = np.maximum(0.0, 1.0 - budget_diff_ratio)
+    return np.round(budget_score, 3)
 
 
-def generate_interest_score():
+def generate_interest_score(rng, size):
     """
     SECONDARY FEATURE: Interest Score
     Use Beta distribution to avoid flat uniform
     """
-    return round(np.random.beta(2, 2), 3)
+    return np.round(rng.beta(2, 2, size), 3)
 
 
-def generate_personality_score():
+def generate_personality_score(rng, size):
     """
     SECONDARY FEATURE: Personality Score
     Use Beta distribution
     """
-    return round(np.random.beta(2, 2), 3)
+    return np.round(rng.beta(2, 2, size), 3)
 
 
-def generate_age_score():
+def generate_age_score(rng, size):
     """
     SECONDARY FEATURE: Age Score
     Use Beta distribution (slightly skewed towards compatibility)
     """
-    return round(np.random.beta(3, 2), 3)
+    return np.round(rng.beta(3, 2, size), 3)
 
 
-def generate_group_size_score():
+def generate_group_size_score(rng, size):
     """
     Synthetic group size signal.
     Mirrors the heuristic thresholds from extractCompatibilityFeatures():
@@ -159,21 +188,12 @@ def generate_group_size_score():
     - else  -> 0.2
     """
     # Use lognormal to bias towards smaller groups, with a long tail.
-    size = int(np.random.lognormal(mean=2.2, sigma=0.6))
-    size = max(1, min(size, 60))
+    group_size = rng.lognormal(mean=2.2, sigma=0.6, size=size).astype(np.int64)
+    group_size = np.clip(group_size, 1, 60)
+    return GROUP_SIZE_SCORES[np.searchsorted(GROUP_SIZE_EDGES, group_size, side='left')]
 
-    if size <= 6:
-        return 1.0
-    if size <= 12:
-        return 0.8
-    if size <= 20:
-        return 0.6
-    if size <= 40:
-        return 0.4
-    return 0.2
 
-
-def generate_group_diversity_score():
+def generate_group_diversity_score(rng, size):
     """
     Synthetic group diversity signal.
     Approximates extractCompatibilityFeatures() logic:
@@ -184,24 +204,12 @@ def generate_group_diversity_score():
     """
     # Sample "count bins" with mild preference for >= 2.
     # Values represent the number of dominant languages/nationalities.
-    lang_count = int(np.random.choice([1, 2, 3, 4], p=[0.25, 0.35, 0.25, 0.15]))
-    nat_count = int(np.random.choice([1, 2, 3, 4], p=[0.30, 0.35, 0.20, 0.15]))
-
-    if lang_count >= 3:
-        lang_score = 1.0
-    elif lang_count == 2:
-        lang_score = 0.7
-    else:
-        lang_score = 0.5
+    lang_count = rng.choice([1, 2, 3, 4], size=size, p=[0.25, 0.35, 0.25, 0.15])
+    nat_count = rng.choice([1, 2, 3, 4], size=size, p=[0.30, 0.35, 0.20, 0.15])
 
-    if nat_count >= 3:
-        nat_score = 1.0
-    elif nat_count == 2:
-        nat_score = 0.7
-    else:
-        nat_score = 0.5
-
-    return round((lang_score + nat_score) / 2.0, 3)
+    lang_score = DIVERSITY_COUNT_SCORES[lang_count]
+    nat_score = DIVERSITY_COUNT_SCORES[nat_count]
+    return np.round((lang_score + nat_score) / 2.0, 3)
 
 
 # ============================================================================
@@ -250,6 +258,53 @@ def calculate_compatibility(features):
     return round(compatibility, 4)
 
 
+def calculate_compatibility_batch(features):
+    """
+    Vectorized calculate_compatibility over whole feature columns
+    
+    Args:
+        features: Dict of equal-length arrays with the same keys as the
+            single-event features dict ('matchType' as an array of strings).
+            The interaction columns are optional and derived when absent.
+    
+    Returns:
+        Array of compatibility scores
+    """
+    destination = features['destinationScore']
+    date_overlap = features['dateOverlapScore']
+    budget = features['budgetScore']
+    interest = features['interestScore']
+    
+    compatibility = (
+        WEIGHTS['destinationScore'] * destination +
+        WEIGHTS['dateOverlapScore'] * date_overlap +
+        WEIGHTS['budgetScore'] * budget +
+        WEIGHTS['interestScore'] * interest +
+        WEIGHTS['personalityScore'] * features['personalityScore'] +
+        WEIGHTS['ageScore'] * features['ageScore']
+    )
+    
+    # Interaction features (nonlinear effects)
+    destination_interest = features.get('destination_interest', destination * interest)
+    date_budget = features.get('date_budget', date_overlap * budget)
+    compatibility = compatibility + INTERACTION_WEIGHTS['destination_interest'] * destination_interest
+    compatibility = compatibility + INTERACTION_WEIGHTS['date_budget'] * date_budget
+    
+    # Group-only adjustments
+    is_group = np.asarray(features['matchType']) == 'user_group'
+    group_bonus = (
+        GROUP_WEIGHTS['groupSizeScore'] * features.get('groupSizeScore', 0.0) +
+        GROUP_WEIGHTS['groupDiversityScore'] * features.get('groupDiversityScore', 0.0)
+    )
+    compatibility = np.where(is_group, compatibility + group_bonus, compatibility)
+    
+    # Hard Rejection Logic
+    rejected = (destination == 0) | (date_overlap == 0)
+    compatibility = np.where(rejected, compatibility * 0.25, compatibility)
+    
+    return np.round(compatibility, 4)
+
+
 def compatibility_to_probability(compatibility):
     """
     Convert Compatibility → Probability using steep sigmoid
@@ -259,45 +314,45 @@ def compatibility_to_probability(compatibility):
     Why: Strong gradient, prevents clustering near 0.5
     """
     prob = 1.0 / (1.0 + np.exp(-SIGMOID_STEEPNESS * (compatibility - SIGMOID_CENTER)))
-    return round(prob, 4)
+    return np.round(prob, 4)
 
 
-def generate_label(probability):
+def generate_label(probability, rng):
     """
-    Generate label using Bernoulli distribution
+    Generate labels using Bernoulli draws
     
     No hard threshold - gives realistic uncertainty
     """
-    return 1 if np.random.random() < probability else 0
+    return (rng.random(len(probability)) < probability).astype(np.int8)
 
 
 # ============================================================================
 # 3. DATA GENERATION
 # ============================================================================
 
-def generate_match_event():
+def generate_match_events(n_samples, rng):
     """
-    Generate a single match interaction event with interaction features
+    Generate n_samples match interaction events with interaction features
+    
+    Returns:
+        Dict of column arrays (flat, no nested structures)
     """
-    match_type = 'user_group' if np.random.random() < GROUP_SAMPLE_PROBABILITY else 'user_user'
+    is_group = rng.random(n_samples) < GROUP_SAMPLE_PROBABILITY
+    match_type = np.where(is_group, 'user_group', 'user_user')
 
     # Generate base features
-    destination_score = generate_destination_score()
-    date_overlap_score = generate_date_overlap_score()
-    budget_score = generate_budget_score()
-    interest_score = generate_interest_score()
+    destination_score = generate_destination_score(rng, n_samples)
+    date_overlap_score = generate_date_overlap_score(rng, n_samples)
+    budget_score = generate_budget_score(rng, n_samples)
+    interest_score = generate_interest_score(rng, n_samples)
     # In the current JS feature extractor, personalityScore is neutral (0.5) for group matching.
-    personality_score = 0.5 if match_type == 'user_group' else generate_personality_score()
-    age_score = generate_age_score()
+    personality_score = np.where(is_group, 0.5, generate_personality_score(rng, n_samples))
+    age_score = generate_age_score(rng, n_samples)
     
     # Generate group-only features
-    group_size_score = generate_group_size_score() if match_type == 'user_group' else 0.0
-    group_diversity_score = generate_group_diversity_score() if match_type == 'user_group' else 0.0
+    group_size_score = np.where(is_group, generate_group_size_score(rng, n_samples), 0.0)
+    group_diversity_score = np.where(is_group, generate_group_diversity_score(rng, n_samples), 0.0)
 
-    # Generate interaction features (nonlinear combinations)
-    destination_interest = destination_score * interest_score
-    date_budget = date_overlap_score * budget_score
-    
     features = {
         'matchType': match_type,
         'destinationScore': destination_score,
@@ -306,65 +361,245 @@ def generate_match_event():
         'interestScore': interest_score,
         'personalityScore': personality_score,
         'ageScore': age_score,
-        'destination_interest': destination_interest,  # Interaction feature
-        'date_budget': date_budget,                    # Interaction feature
+        # Interaction features (nonlinear combinations)
+        'destination_interest': destination_score * interest_score,
+        'date_budget': date_overlap_score * budget_score,
         'groupSizeScore': group_size_score,
         'groupDiversityScore': group_diversity_score,
     }
     
-    # Calculate compatibility
-    compatibility = calculate_compatibility(features)
-    
-    # Convert to probability
+    compatibility = calculate_compatibility_batch(features)
     probability = compatibility_to_probability(compatibility)
+    label = generate_label(probability, rng)
     
-    # Generate label
-    label = generate_label(probability)
-    
-    # Return flat row (no nested structures)
-    row = {
+    return {
         **features,
+        # Categorical: a string column costs more to build than all the draws
+        'matchType': pd.Categorical.from_codes(is_group.astype(np.int8), ['user_user', 'user_group']),
         'compatibility': compatibility,
         'probability': probability,
         'label': label,
     }
-    
-    return row
 
 
-def generate_dataset(n_samples):
+def generate_dataset(n_samples, seed=None):
     """
     Generate complete dataset
+    
+    Args:
+        n_samples: Number of events
+        seed: Seed for a reproducible dataset (default: fresh entropy)
     """
     print(f"🔄 Generating {n_samples:,} match interaction events...")
     print("=" * 80)
     
-    rows = []
-    for i in range(n_samples):
-        row = generate_match_event()
-        rows.append(row)
-        
-        if (i + 1) % 1000 == 0:
-            print(f"   Generated {i + 1:,} / {n_samples:,} events...")
-    
-    print(f"✅ Generated {len(rows):,} events")
+    start = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(generate_match_events(n_samples, rng))
     
-    # Convert to DataFrame
-    df = pd.DataFrame(rows)
+    print(f"✅ Generated {len(df):,} events in {time.perf_counter() - start:.2f}s")
     
     return df
 
 
+def shard_sizes(n_samples, shards):
+    """Rows per shard (the first n_samples % shards shards get one extra)"""
+    return [n_samples // shards + (i < n_samples % shards) for i in range(shards)]
+
+
+def generate_shard(task):
+    """
+    Worker: generate one shard from its own seed and write it as a partition
+    
+    Args:
+        task: (shard index, rows, SeedSequence, output directory)
+    
+    Returns:
+        Tuple of (partition file name, rows, positive labels)
+    """
+    index, n_samples, seed_seq, output_dir = task
+    df = pd.DataFrame(generate_match_events(n_samples, np.random.default_rng(seed_seq)))
+    name = f"part-{index:05d}.parquet"
+    write_dataset(df, Path(output_dir) / name)
+    return name, len(df), int(df['label'].sum())
+
+
+def generate_sharded_dataset(n_samples, output_dir, shards, seed=None, workers=None):
+    """
+    Generate a dataset as independent shards across worker processes
+    
+    Each shard draws from a child of one master SeedSequence, so the same
+    seed and shard count give the same dataset for any number of workers.
+    Shards are written as partitions of output_dir (part-00000.parquet, ...).
+    
+    Args:
+        n_samples: Total number of events
+        output_dir: Dataset directory
+        shards: Number of shards (partitions)
+        seed: Master seed (default: fresh entropy, recorded in the manifest)
+        workers: Worker processes (default: CPU count)
+    
+    Returns:
+        Manifest dict (seed entropy, shard count, partitions)
+    """
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    # Stale partitions from a run with more shards would join the dataset
+    for stale in output_path.glob("part-*.parquet"):
+        stale.unlink()
+    
+    master = np.random.SeedSequence(seed)
+    tasks = [
+        (index, size, child, str(output_path))
+        for index, (size, child) in enumerate(zip(shard_sizes(n_samples, shards), master.spawn(shards)))
+    ]
+    workers = min(workers or os.cpu_count() or 1, shards)
+    
+    print(f"🔄 Generating {n_samples:,} match interaction events in {shards} shards ({workers} workers)...")
+    print("=" * 80)
+    start = time.perf_counter()
+    if workers <= 1:
+        results = [generate_shard(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(generate_shard, tasks))
+    
+    manifest = {
+        "seed_entropy": str(master.entropy),
+        "samples": n_samples,
+        "shards": shards,
+        "partitions": [
+            {"file": name, "rows": rows, "positives": positives}
+            for name, rows, positives in results
+        ],
+    }
+    # Leading underscore: not read as a partition
+    with open(output_path / "_manifest.json", "w") as f:
+        json.dump(manifest, f, indent=2)
+    
+    print(f"✅ Generated {n_samples:,} events in {time.perf_counter() - start:.2f}s")
+    print(f"   Seed entropy: {master.entropy} (pass as --seed to reproduce)")
+    return manifest
+
+
 # ============================================================================
 # 4. DATA CLEANING
 # ============================================================================
 
+def row_hashes(df, columns=None, decimals=DEDUP_DECIMALS):
+    """
+    64-bit hash per row of the quantized feature values
+    
+    Values are rounded to float32 first, so a row hashes the same in memory
+    and after a round trip through a stored dataset.
+    """
+    columns = [col for col in (columns or DEDUP_FEATURE_COLUMNS) if col in df.columns]
+    scale = 10.0 ** decimals
+    quantized = {}
+    for col in columns:
+        values = np.round(df[col].to_numpy(dtype=np.float32).astype(np.float64) * scale)
+        # Missing values get their own bucket (int64 min)
+        quantized[col] = np.where(np.isnan(values), np.iinfo(np.int64).min, values).astype(np.int64)
+    return pd.util.hash_pandas_object(pd.DataFrame(quantized), index=False).to_numpy()
+
+
+class RowHashDeduplicator:
+    """
+    Keeps the first occurrence of each row hash across batches.
+    
+    Seen hashes are a sorted uint64 array; beyond max_memory_hashes it is
+    written to disk as a sorted run and memory-mapped for lookups, so the
+    dataset can be larger than memory. Distinct rows colliding on a 64-bit
+    hash are vanishingly rare (~3% chance at a billion rows) and would
+    drop one row.
+    """
+
+    def __init__(self, max_memory_hashes=DEDUP_MEMORY_HASHES, spill_dir=None):
+        self.max_memory_hashes = max_memory_hashes
+        self.spill_dir = spill_dir
+        self._seen = np.empty(0, dtype=np.uint64)
+        self._runs = []
+        self._tmp_dir = None
+
+    def keep_mask(self, hashes):
+        """Boolean mask of rows whose hash was not seen before (this batch included)"""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        unique, first = np.unique(hashes, return_index=True)
+        new = ~self._contains(unique)
+        keep = np.zeros(len(hashes), dtype=bool)
+        keep[first[new]] = True
+        self._add(unique[new])
+        return keep
+
+    def _contains(self, sorted_hashes):
+        found = np.zeros(len(sorted_hashes), dtype=bool)
+        for run in (self._seen, *self._runs):
+            if len(run):
+                idx = np.minimum(np.searchsorted(run, sorted_hashes), len(run) - 1)
+                found |= run[idx] == sorted_hashes
+        return found
+
+    def _add(self, sorted_new):
+        merged = np.concatenate([self._seen, sorted_new])
+        merged.sort(kind='stable')  # merge of two sorted runs
+        self._seen = merged
+        if len(self._seen) > self.max_memory_hashes:
+            self._spill()
+
+    def _spill(self):
+        if self._tmp_dir is None:
+            self._tmp_dir = tempfile.mkdtemp(prefix="dedup-", dir=self.spill_dir)
+        path = Path(self._tmp_dir) / f"run-{len(self._runs):04d}.npy"
+        np.save(path, self._seen)
+        self._runs.append(np.load(path, mmap_mode='r'))
+        self._seen = np.empty(0, dtype=np.uint64)
+
+    def close(self):
+        self._runs = []
+        if self._tmp_dir is not None:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+            self._tmp_dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def column_ranges(df):
+    """Min/max of each numeric column (mergeable across partitions)"""
+    ranges = {}
+    for col in df.columns:
+        # Only numeric columns can be "constant"; `matchType` is categorical.
+        if not pd.api.types.is_numeric_dtype(df[col]):
+            continue
+        ranges[col] = (float(df[col].min()), float(df[col].max()))
+    return ranges
+
+
+def merge_column_ranges(a, b):
+    """Combine two column_ranges results (NaN bounds of all-missing columns are ignored)"""
+    merged = dict(a)
+    for col, (low, high) in b.items():
+        if col in merged:
+            merged[col] = (float(np.fmin(merged[col][0], low)), float(np.fmax(merged[col][1], high)))
+        else:
+            merged[col] = (low, high)
+    return merged
+
+
+def constant_columns(ranges, tolerance=CONSTANT_TOLERANCE):
+    """Columns whose values span less than tolerance"""
+    return [col for col, (low, high) in ranges.items() if not high - low >= tolerance]
+
+
 def clean_dataset(df):
     """
     Data Cleaning Phase
     
-    1. Remove duplicates
-    2. Remove constant columns
+    1. Remove duplicates (row hashes of the quantized features)
+    2. Remove constant columns (min/max range)
     3. Check missing values
     """
     print("\n🧹 Data Cleaning Phase")
@@ -373,28 +608,19 @@ def clean_dataset(df):
     original_size = len(df)
     
     # 1. Remove duplicates (based on feature columns only)
-    feature_cols = ['destinationScore', 'dateOverlapScore', 'budgetScore', 
-                    'interestScore', 'personalityScore', 'ageScore',
-                    'destination_interest', 'date_budget',
-                    'groupSizeScore', 'groupDiversityScore']  # Include group-only features
-    duplicates = df.duplicated(subset=feature_cols).sum()
+    with RowHashDeduplicator() as dedup:
+        keep = dedup.keep_mask(row_hashes(df))
+    duplicates = int((~keep).sum())
     
     if duplicates > 0:
         print(f"   Found {duplicates} duplicate feature rows")
-        df = df.drop_duplicates(subset=feature_cols, keep='first')
+        df = df[keep]
         print(f"   Removed duplicates: {original_size} → {len(df)} rows")
     else:
         print(f"   ✅ No duplicate feature rows found")
     
     # 2. Remove constant columns
-    constant_cols = []
-    for col in df.columns:
-        # Only numeric columns can be "constant" for std-based checks.
-        # `matchType` is categorical (string), so skip it.
-        if not pd.api.types.is_numeric_dtype(df[col]):
-            continue
-        if df[col].std() < 1e-6:  # Near-zero standard deviation
-            constant_cols.append(col)
+    constant_cols = constant_columns(column_ranges(df))
     
     if constant_cols:
         print(f"   ⚠️  Found constant columns: {constant_cols}")
@@ -417,28 +643,95 @@ def clean_dataset(df):
     return df
 
 
+def clean_partitioned_dataset(input_dir, output_dir=None, spill_dir=None):
+    """
+    Clean a partitioned dataset without loading it whole
+    
+    Same steps as clean_dataset. Pass 1 merges per-partition min/max to find
+    constant columns (duplicates never change a range); pass 2 streams the
+    partitions in order, drops rows whose hash was already seen in any
+    earlier row, and rewrites each partition without the constant columns.
+    
+    Args:
+        input_dir: Dataset directory (part-*.parquet)
+        output_dir: Where to write cleaned partitions (default: in place)
+        spill_dir: Directory for on-disk hash runs (default: system temp)
+    
+    Returns:
+        Dict with rows in/out, duplicates, missing and constant columns
+    """
+    print("\n🧹 Data Cleaning Phase (partitioned)")
+    print("=" * 80)
+    
+    output_path = Path(output_dir or input_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    parts = dataset_files(input_dir)
+    
+    ranges = {}
+    for part in parts:
+        for batch in iter_dataset_batches(part, batch_size=CLEAN_BATCH_ROWS):
+            ranges = merge_column_ranges(ranges, column_ranges(batch))
+    constant_cols = constant_columns(ranges)
+    if constant_cols:
+        print(f"   ⚠️  Found constant columns: {constant_cols} (removed)")
+    else:
+        print(f"   ✅ No constant columns found")
+    
+    summary = {"rows_in": 0, "rows_out": 0, "duplicates": 0, "missing_rows": 0, "constant_columns": constant_cols}
+    with RowHashDeduplicator(spill_dir=spill_dir) as dedup:
+        for part in parts:
+            with DatasetWriter(output_path / part.name) as writer:
+                for batch in iter_dataset_batches(part, batch_size=CLEAN_BATCH_ROWS):
+                    keep = dedup.keep_mask(row_hashes(batch))
+                    batch = batch[keep].drop(columns=constant_cols)
+                    complete = batch.notna().all(axis=1).to_numpy()
+                    summary["rows_in"] += len(keep)
+                    summary["duplicates"] += int((~keep).sum())
+                    summary["missing_rows"] += int((~complete).sum())
+                    if complete.any() or not writer.rows:
+                        # Keeps the schema for a partition left empty
+                        writer.write(batch[complete])
+                    summary["rows_out"] += int(complete.sum())
+    
+    print(f"   {'⚠️ ' if summary['duplicates'] else '✅'} Duplicate feature rows removed: {summary['duplicates']:,}")
+    print(f"   {'⚠️ ' if summary['missing_rows'] else '✅'} Rows with missing values removed: {summary['missing_rows']:,}")
+    print(f"\n   Final dataset size: {summary['rows_out']:,} rows in {len(parts)} partitions")
+    return summary
+
+
 # ============================================================================
 # 5. VALIDATION
 # ============================================================================
 
 def validate_dataset(df):
     """
-    Validate Dataset Quality
+    Validate Dataset Quality (see validate_stats)
+    """
+    return validate_stats(frame_stats(df))
+
+
+def validate_stats(stats):
+    """
+    Validate Dataset Quality from mergeable statistics (dataset_stats.py)
     
     A. Class Balance (40-55% positive)
     B. Correlation Check
     C. Distribution Check
+    
+    Works the same for one in-memory frame and for merged shard stats.
     """
     print("\n📊 Dataset Quality Validation")
     print("=" * 80)
     
     # A. Class Balance
-    label_counts = df['label'].value_counts()
-    positive_pct = (label_counts.get(1, 0) / len(df)) * 100
+    label_counts = stats.value_counts.get('label', {})
+    positives = label_counts.get('1', 0)
+    negatives = label_counts.get('0', 0)
+    positive_pct = (positives / stats.rows) * 100
     
     print(f"\nA. Class Balance:")
-    print(f"   Label 0 (Ignore/Unmatch): {label_counts.get(0, 0):,} ({100-positive_pct:.1f}%)")
-    print(f"   Label 1 (Accept/Chat): {label_counts.get(1, 0):,} ({positive_pct:.1f}%)")
+    print(f"   Label 0 (Ignore/Unmatch): {negatives:,} ({100-positive_pct:.1f}%)")
+    print(f"   Label 1 (Accept/Chat): {positives:,} ({positive_pct:.1f}%)")
     
     if 40 <= positive_pct <= 55:
         print(f"   ✅ Class balance is good (40-55% positive)")
@@ -451,18 +744,17 @@ def validate_dataset(df):
     
     # B. Correlation Check
     print(f"\nB. Feature-Label Correlations:")
-    feature_cols = ['destinationScore', 'dateOverlapScore', 'budgetScore',
-                    'interestScore', 'personalityScore', 'ageScore',
-                    'destination_interest', 'date_budget',
-                    'groupSizeScore', 'groupDiversityScore']  # Include interaction + group-only features
+    feature_cols = [col for col in DEDUP_FEATURE_COLUMNS if col in stats.columns]
+    summaries = {col: stats.column_summary(col) for col in stats.columns}
     
     correlations = {}
     for col in feature_cols:
-        if col in df.columns:
-            corr = df[col].corr(df['label'])
-            correlations[col] = corr
-            strength = "Strong" if abs(corr) > 0.3 else "Moderate" if abs(corr) > 0.15 else "Weak"
-            print(f"   {col:25s} | {corr:7.4f} | {strength}")
+        corr = summaries[col]['label_corr']
+        if corr is None:
+            continue
+        correlations[col] = corr
+        strength = "Strong" if abs(corr) > 0.3 else "Moderate" if abs(corr) > 0.15 else "Weak"
+        print(f"   {col:25s} | {corr:7.4f} | {strength}")
     
     # Check if primary features have stronger correlation
     primary_corrs = [correlations.get('destinationScore', 0),
@@ -482,19 +774,20 @@ def validate_dataset(df):
     
     # C. Distribution Check
     print(f"\nC. Probability Distribution:")
-    prob_min = df['probability'].min()
-    prob_max = df['probability'].max()
-    prob_mean = df['probability'].mean()
-    prob_std = df['probability'].std()
+    probability = summaries['probability']
+    prob_min = probability['min']
+    prob_max = probability['max']
     
     print(f"   Min: {prob_min:.3f}")
     print(f"   Max: {prob_max:.3f}")
-    print(f"   Mean: {prob_mean:.3f}")
-    print(f"   Std: {prob_std:.3f}")
+    print(f"   Mean: {probability['mean']:.3f}")
+    print(f"   Std: {probability['std']:.3f}")
     
-    # Check if clustered around 0.5
-    near_05 = ((df['probability'] > 0.45) & (df['probability'] < 0.55)).sum()
-    near_05_pct = (near_05 / len(df)) * 100
+    # Check if clustered around 0.5 (histogram bins covering 0.45-0.55)
+    histogram = np.asarray(probability['histogram'])
+    edges = np.linspace(HISTOGRAM_RANGE[0], HISTOGRAM_RANGE[1], HISTOGRAM_BINS + 1)
+    near_bins = (edges[:-1] >= 0.45 - 1e-9) & (edges[1:] <= 0.55 + 1e-9)
+    near_05_pct = (histogram[near_bins].sum() / max(probability['count'], 1)) * 100
     
     if near_05_pct < 20:
         print(f"   ✅ Good spread (only {near_05_pct:.1f}% clustered near 0.5)")
@@ -508,23 +801,17 @@ def validate_dataset(df):
         print(f"   ⚠️  Limited span (should be 0.05 → 0.95)")
     
     # Feature statistics
-    print(f"\nD. Feature Statistics:")
+    print(f"\nD. Feature Statistics (Unique ≈ HyperLogLog estimate):")
     print(f"{'Feature':<25s} | {'Min':<8s} | {'Max':<8s} | {'Mean':<8s} | {'Std':<8s} | {'Unique':<8s}")
     print("-" * 80)
     
     for col in feature_cols:
-        if col in df.columns:
-            min_val = df[col].min()
-            max_val = df[col].max()
-            mean_val = df[col].mean()
-            std_val = df[col].std()
-            unique_val = df[col].nunique()
-            print(f"{col:<25s} | {min_val:8.3f} | {max_val:8.3f} | {mean_val:8.3f} | {std_val:8.3f} | {unique_val:8d}")
-    
-    # Check for duplicates
-    feature_df = df[feature_cols]
-    duplicates = feature_df.duplicated().sum()
-    duplicate_pct = (duplicates / len(df)) * 100
+        summary = summaries[col]
+        print(f"{col:<25s} | {summary['min']:8.3f} | {summary['max']:8.3f} | {summary['mean']:8.3f} | {summary['std']:8.3f} | {summary['approx_distinct']:8d}")
+    
+    # Check for duplicates (rows minus distinct feature rows)
+    duplicates = stats.duplicate_rows()
+    duplicate_pct = (duplicates / stats.rows) * 100
     
     print(f"\nE. Duplicate Check:")
     print(f"   Duplicate feature vectors: {duplicates:,} ({duplicate_pct:.1f}%)")
@@ -549,30 +836,89 @@ def main():
     """
     Main execution: Generate, clean, validate, and save dataset
     """
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic ML training dataset"
+    )
+    parser.add_argument(
+        "-n", "--samples",
+        type=int,
+        default=TARGET_SAMPLES,
+        help=f"Number of match events to generate (default: {TARGET_SAMPLES})"
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Random seed for a reproducible dataset (default: random)"
+    )
+    parser.add_argument(
+        "-o", "--output",
+        type=Path,
+        default=None,
+        help=f"Output dataset, .parquet or .csv, or a directory with --shards (default: {OUTPUT_FILE})"
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=0,
+        help="Generate in this many independently seeded shards, one partition each (default: off)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Worker processes for --shards (default: CPU count)"
+    )
+    args = parser.parse_args()
+    
+    if args.shards > 0:
+        output_dir = args.output or OUTPUT_FILE.with_suffix("")
+        print("=" * 80)
+        print("ML TRAINING DATASET BUILDER (sharded)")
+        print("=" * 80)
+        print(f"\nTarget: {args.samples:,} match interaction events")
+        print(f"Output: {output_dir}/")
+        print()
+        manifest = generate_sharded_dataset(args.samples, output_dir, args.shards, args.seed, args.workers)
+        cleaning = clean_partitioned_dataset(output_dir)
+        # Shards are summarized in parallel; the merged stats validate the whole dataset
+        stats = compute_dataset_stats(output_dir, args.workers)
+        validation_results = validate_stats(stats)
+        report_path = write_stats_report(stats, output_dir, {"cleaning": cleaning})
+        print(f"\n✅ Class balance: {validation_results['class_balance']:.1f}% positive")
+        print(f"✅ Output directory: {output_dir} ({args.shards} partitions, {cleaning['rows_out']:,} rows)")
+        print(f"✅ Stats report: {report_path}")
+        print("=" * 80)
+        return
+    
+    output_file = args.output or OUTPUT_FILE
+    
     print("=" * 80)
     print("ML TRAINING DATASET BUILDER")
     print("Strict Specification Implementation")
     print("=" * 80)
-    print(f"\nTarget: {TARGET_SAMPLES:,} match interaction events")
-    print(f"Output: {OUTPUT_FILE}")
+    print(f"\nTarget: {args.samples:,} match interaction events")
+    print(f"Output: {output_file}")
     print()
     
     # Create output directory
-    OUTPUT_DIR.mkdir(exist_ok=True)
+    output_file.parent.mkdir(parents=True, exist_ok=True)
     
     # Generate dataset
-    df = generate_dataset(TARGET_SAMPLES)
+    df = generate_dataset(args.samples, seed=args.seed)
     
     # Clean dataset
     df = clean_dataset(df)
     
     # Validate dataset
-    validation_results = validate_dataset(df)
+    stats = frame_stats(df)
+    validation_results = validate_stats(stats)
     
     # Save dataset
-    print(f"\n💾 Saving dataset to {OUTPUT_FILE}...")
-    df.to_csv(OUTPUT_FILE, index=False)
+    print(f"\n💾 Saving dataset to {output_file}...")
+    write_dataset(df, output_file)
     print(f"✅ Dataset saved: {len(df):,} rows, {len(df.columns)} columns")
+    print(f"✅ Stats report: {write_stats_report(stats, output_file)}")
     
     # Summary
     print("\n" + "=" * 80)
@@ -582,9 +928,9 @@ def main():
     print(f"✅ Class balance: {validation_results['class_balance']:.1f}% positive")
     print(f"✅ Probability range: {validation_results['prob_range'][0]:.3f} - {validation_results['prob_range'][1]:.3f}")
     print(f"✅ Duplicate rate: {validation_results['duplicate_rate']:.1f}%")
-    print(f"✅ Output file: {OUTPUT_FILE}")
+    print(f"✅ Output file: {output_file}")
     print("\nNext steps:")
-    print(f"  1. Review dataset: pandas.read_csv('{OUTPUT_FILE}')")
+    print(f"  1. Review dataset: pandas.read_parquet('{output_file}')")
     print(f"  2. Split into train/val: python src/lib/ai/datasets/split_dataset.py")
     print(f"  3. Train model: python src/lib/ai/datasets/train_model.py")
     print("=" * 80)
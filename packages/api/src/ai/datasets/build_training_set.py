@@ -4,18 +4,33 @@ Dataset Builder for ML Training (Day 2 - Phase 3)
 Offline script to convert match event logs into training datasets.
 
 This script:
-- Reads JSONL logs from console output
+- Reads JSONL logs from console output (chunked, across worker processes;
+  globs, directories and .gz/.zst rotated logs)
 - Filters and labels events
 - Flattens compatibility features
 - Performs time-based train/val split
-- Writes CSV files for ML training
+- Optionally runs incrementally (checkpointed offsets, time partitions)
+- Writes typed Parquet datasets for ML training (CSV as export option)
 """
 
+import os
+import glob
+import gzip
 import json
+import codecs
+import hashlib
+import numpy as np
 import pandas as pd
 import argparse
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Union
+
+from dataset_io import (
+    DATASET_FORMATS, DatasetWriter, dataset_columns, read_dataset, typed_dataset, write_dataset
+)
+from dataset_stats import QuantileSketch
 import sys
 import io
 
@@ -24,55 +39,368 @@ if sys.platform == 'win32':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
+# Optional: faster JSON decoding for large logs (json is the fallback)
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    orjson = None
+    json_loads = json.loads
+
+# Optional: zstd-compressed logs (gzip always works)
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DECOMPRESS_ERRORS = (zstandard.ZstdError,) if zstandard else ()
+
+EVENT_MARKER = b"[ML_MATCH_EVENT]"
+
+# Files picked up when a directory is given
+LOG_SUFFIXES = (".jsonl", ".log", ".gz", ".zst", ".zstd")
+COMPRESSED_SUFFIXES = (".gz", ".zst", ".zstd")
+DECOMPRESS_READ_BYTES = 1024 * 1024
+
+# Bytes of log parsed per task; bounds per-worker memory
+PARSE_CHUNK_BYTES = 64 * 1024 * 1024
+
+# Rows per preallocated feature block in events_to_frame
+FRAME_BLOCK_ROWS = 16384
+
+
+# Known compatibility features (CompatibilityFeatures in utils/ml-types.ts,
+# plus the language/lifestyle/background scores of synthetic events), in
+# output column order
+FEATURE_SCHEMA = [
+    "distanceScore",
+    "dateOverlapScore",
+    "budgetScore",
+    "interestScore",
+    "ageScore",
+    "personalityScore",
+    "languageScore",
+    "lifestyleScore",
+    "backgroundScore",
+    "destination_interest",
+    "date_budget",
+    "groupSizeScore",
+    "groupDiversityScore",
+]
+_FEATURE_INDEX = {name: col for col, name in enumerate(FEATURE_SCHEMA)}
 
-def parse_log_file(log_file: str) -> List[Dict[str, Any]]:
+# Event fields kept next to the features
+EVENT_FIELDS = ["matchType", "outcome", "preset", "timestamp"]
+
+# Outcomes labeled 1 (see create_label_from_outcome)
+POSITIVE_OUTCOMES = ["accept", "chat"]
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def events_to_frame(events: Iterable[Dict[str, Any]]) -> pd.DataFrame:
+    """
+    Flatten events into a columnar batch driven by FEATURE_SCHEMA.
+    
+    Known feature values are written in place into preallocated float32
+    blocks of FRAME_BLOCK_ROWS rows ("features.<name>" columns, NaN where
+    an event lacks them). The EVENT_FIELDS become columns; the matchType
+    copy inside features is not kept. Schema features that occur are
+    listed in frame.attrs["features_seen"], and unknown feature keys are
+    counted in frame.attrs["unknown_features"] rather than widening the
+    frame.
+    
+    Events are consumed one at a time, so a generator never holds more
+    than one decoded event.
     """
-    Parse JSONL log file containing [ML_MATCH_EVENT] entries.
+    n_features = len(FEATURE_SCHEMA)
+    blocks = []
+    block = np.full((FRAME_BLOCK_ROWS, n_features), np.nan, dtype=np.float32)
+    row = 0
+    fields = {field: [] for field in EVENT_FIELDS}
+    seen = [False] * n_features
+    unknown = Counter()
+    for event in events:
+        if row == FRAME_BLOCK_ROWS:
+            blocks.append(block)
+            block = np.full((FRAME_BLOCK_ROWS, n_features), np.nan, dtype=np.float32)
+            row = 0
+        features = event.get("features")
+        if isinstance(features, dict):
+            for key, value in features.items():
+                col = _FEATURE_INDEX.get(key)
+                if col is not None:
+                    try:
+                        block[row, col] = value
+                    except (TypeError, ValueError):
+                        # Not numeric - NaN, like a missing value
+                        block[row, col] = _to_float(value)
+                    seen[col] = True
+                elif key != "matchType":
+                    unknown[key] += 1
+        row += 1
+        for field, values in fields.items():
+            values.append(event.get(field))
+    
+    blocks.append(block[:row])
+    values = np.concatenate(blocks) if len(blocks) > 1 else blocks[0]
+    
+    columns = {f"features.{name}": values[:, col] for col, name in enumerate(FEATURE_SCHEMA)}
+    columns.update(fields)
+    
+    frame = pd.DataFrame(columns)
+    frame.attrs["features_seen"] = [name for name, was_seen in zip(FEATURE_SCHEMA, seen) if was_seen]
+    frame.attrs["unknown_features"] = dict(unknown)
+    return frame
+
+
+def concat_batches(batches: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Concatenate parsed batches, merging their attrs explicitly.
+    
+    pd.concat drops attrs when they differ between the batches, so the
+    union of features_seen and the summed unknown_features counts are set
+    on the result afterwards.
+    """
+    features_seen = {name for batch in batches for name in batch.attrs.get("features_seen", [])}
+    unknown = Counter()
+    for batch in batches:
+        unknown.update(batch.attrs.get("unknown_features", {}))
+    
+    batches = [batch for batch in batches if len(batch)]
+    frame = pd.concat(batches, ignore_index=True) if batches else pd.DataFrame()
+    frame.attrs = {
+        "features_seen": [name for name in FEATURE_SCHEMA if name in features_seen],
+        "unknown_features": dict(unknown),
+    }
+    return frame
+
+
+def report_unknown_features(batches: List[pd.DataFrame]):
+    """Print the feature keys dropped because they are not in FEATURE_SCHEMA."""
+    unknown = Counter()
+    for batch in batches:
+        unknown.update(batch.attrs.get("unknown_features", {}))
+    if unknown:
+        keys = ", ".join(f"{key} ({count})" for key, count in unknown.most_common())
+        print(f"Warning: Dropped feature keys not in FEATURE_SCHEMA: {keys}", file=sys.stderr)
+
+
+def find_chunk_boundaries(
+    log_file: str,
+    chunk_bytes: int = PARSE_CHUNK_BYTES,
+    start: int = 0,
+    end: int = None
+) -> List[tuple]:
+    """Split a file (or its [start, end) range) into byte ranges that end on line boundaries."""
+    size = os.path.getsize(log_file) if end is None else end
+    boundaries = [start]
+    with open(log_file, "rb") as f:
+        while boundaries[-1] < size:
+            target = boundaries[-1] + chunk_bytes
+            if target >= size:
+                boundaries.append(size)
+                break
+            f.seek(target)
+            f.readline()
+            boundaries.append(f.tell())
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def parse_event_lines(data: bytes, source: str) -> Iterator[Dict[str, Any]]:
+    """
+    Parse the [ML_MATCH_EVENT] entries in a block of complete log lines,
+    yielding one event at a time.
+    
+    Handles both formats:
+    1. ... [ML_MATCH_EVENT] {"matchType": ...}
+    2. {"matchType": ...} (pure JSONL)
+    """
+    for line_num, line in enumerate(data.splitlines(), 1):
+        marker = line.find(EVENT_MARKER)
+        payload = line[marker + len(EVENT_MARKER):] if marker >= 0 else line
+        payload = payload.strip()
+        if not payload:
+            continue
+        
+        try:
+            event = json_loads(payload)
+        except ValueError as e:
+            print(f"Warning: Skipping invalid JSON on line {line_num} of {source}: {e}", file=sys.stderr)
+            continue
+        if not isinstance(event, dict):
+            print(f"Warning: Skipping non-object event on line {line_num} of {source}", file=sys.stderr)
+            continue
+        yield event
+
+
+def parse_log_chunk(log_file: str, start: int, end: int) -> pd.DataFrame:
+    """
+    Parse one byte range of an uncompressed log file.
+    
+    Returns:
+        Columnar batch of the parsed events (see events_to_frame)
+    """
+    with open(log_file, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    if start == 0 and data.startswith(codecs.BOM_UTF8):
+        data = data[len(codecs.BOM_UTF8):]
+    
+    return events_to_frame(parse_event_lines(data, f"{log_file} (chunk at byte {start})"))
+
+
+def open_compressed_log(log_file: str):
+    """Open a .gz or .zst log as a stream of decompressed bytes."""
+    if log_file.endswith(".gz"):
+        return gzip.open(log_file, "rb")
+    if zstandard is None:
+        raise ImportError(f"zstandard is required to read {log_file} (pip install zstandard)")
+    raw = open(log_file, "rb")
+    return zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+
+
+def parse_compressed_log(log_file: str, chunk_bytes: int = PARSE_CHUNK_BYTES) -> pd.DataFrame:
+    """
+    Parse a compressed log, decompressing in memory one block at a time.
+    
+    A truncated file (e.g. the hour still being written) is parsed up to
+    the point where it breaks off.
+    """
+    batches = []
+    buffer = bytearray()
+    block_num = 0
+    with open_compressed_log(log_file) as stream:
+        eof = False
+        while not eof:
+            # Small reads, so a truncated file still yields what precedes the break
+            try:
+                piece = stream.read(DECOMPRESS_READ_BYTES)
+            except (EOFError, OSError, *DECOMPRESS_ERRORS) as e:
+                print(f"Warning: {log_file} is truncated, keeping events read so far: {e}", file=sys.stderr)
+                piece = b""
+            eof = not piece
+            buffer += piece
+            if len(buffer) < chunk_bytes and not eof:
+                continue
+            
+            cut = len(buffer) if eof else buffer.rfind(b"\n") + 1
+            if cut == 0:
+                continue
+            block = bytes(buffer[:cut])
+            del buffer[:cut]
+            if block_num == 0 and block.startswith(codecs.BOM_UTF8):
+                block = block[len(codecs.BOM_UTF8):]
+            block_num += 1
+            batches.append(events_to_frame(parse_event_lines(block, f"{log_file} (block {block_num})")))
+    
+    return concat_batches(batches)
+
+
+def expand_log_inputs(inputs: List[str]) -> List[str]:
+    """
+    Resolve log files, directories and glob patterns to a list of files.
+    
+    Directories contribute their .jsonl/.log/.gz/.zst files. Files are sorted
+    by name within each input (hourly rotated logs sort chronologically)
+    and each file is listed once.
+    """
+    files = {}
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = sorted(
+                str(path) for path in Path(item).iterdir()
+                if path.is_file() and path.name.endswith(LOG_SUFFIXES)
+            )
+        elif glob.has_magic(item):
+            matches = sorted(path for path in glob.glob(item, recursive=True) if os.path.isfile(path))
+        else:
+            if not os.path.isfile(item):
+                raise FileNotFoundError(item)
+            matches = [item]
+        
+        if not matches:
+            print(f"Warning: No log files match {item}", file=sys.stderr)
+        for path in matches:
+            files.setdefault(os.path.abspath(path), path)
+    return list(files.values())
+
+
+def parse_log_file(
+    log_file: Union[str, List[str]],
+    workers: int = None,
+    chunk_bytes: int = PARSE_CHUNK_BYTES
+) -> pd.DataFrame:
+    """
+    Parse JSONL log files containing [ML_MATCH_EVENT] entries.
     
     Expected format:
     [ML_MATCH_EVENT] {"matchType": "user_user", "features": {...}, ...}
     
+    Uncompressed files are split on line boundaries into chunks; .gz and
+    .zst files are one task each, decompressed in memory. Tasks run in a
+    process pool and their columnar batches are returned in input order
+    (files by name, chunks by offset), so no process ever holds more than
+    a few chunks of raw lines.
+    
     Args:
-        log_file: Path to log file
+        log_file: Log file, directory or glob pattern, or a list of them
+        workers: Worker processes (default: CPU count)
+        chunk_bytes: Bytes of log per chunk
         
     Returns:
-        List of parsed event dictionaries
+        DataFrame of parsed events, one row per event
     """
-    records = []
-    
+    inputs = [log_file] if isinstance(log_file, str) else list(log_file)
     try:
-        with open(log_file, "r", encoding="utf-8-sig") as f:
-            for line_num, line in enumerate(f, 1):
-                line = line.strip()
-                if not line:
-                    continue
-                
-                # Handle both formats:
-                # 1. [ML_MATCH_EVENT] {"matchType": ...}
-                # 2. {"matchType": ...} (pure JSONL)
-                try:
-                    if "[ML_MATCH_EVENT]" in line:
-                        # Extract JSON payload after [ML_MATCH_EVENT]
-                        payload = line.split("[ML_MATCH_EVENT]", 1)[1].strip()
-                    else:
-                        # Pure JSONL format (no prefix)
-                        payload = line
-                    event = json.loads(payload)
-                    records.append(event)
-                except json.JSONDecodeError as e:
-                    print(f"Warning: Skipping invalid JSON on line {line_num}: {e}", file=sys.stderr)
-                    continue
-                except Exception as e:
-                    print(f"Warning: Error parsing line {line_num}: {e}", file=sys.stderr)
-                    continue
-    except FileNotFoundError:
-        print(f"Error: Log file not found: {log_file}", file=sys.stderr)
+        tasks = []
+        for path in expand_log_inputs(inputs):
+            if path.endswith(COMPRESSED_SUFFIXES):
+                tasks.append((parse_compressed_log, (path, chunk_bytes)))
+            else:
+                tasks.extend((parse_log_chunk, (path, start, end)) for start, end in find_chunk_boundaries(path, chunk_bytes))
+        return run_parse_tasks(tasks, workers)
+    except FileNotFoundError as e:
+        print(f"Error: Log file not found: {e}", file=sys.stderr)
         sys.exit(1)
     except Exception as e:
         print(f"Error reading log file: {e}", file=sys.stderr)
         sys.exit(1)
+
+
+def run_parse_tasks(tasks: List[tuple], workers: int = None) -> pd.DataFrame:
+    """
+    Run (function, args) parse tasks, in a process pool when there is more
+    than one, with at most two tasks per worker in flight.
     
-    return records
+    Returns:
+        The tasks' batches concatenated in task order
+    """
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    
+    batches = []
+    if workers <= 1:
+        batches = [task(*args) for task, args in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            in_flight = deque()
+            for task, args in tasks:
+                in_flight.append(pool.submit(task, *args))
+                if len(in_flight) >= workers * 2:
+                    batches.append(in_flight.popleft().result())
+            while in_flight:
+                batches.append(in_flight.popleft().result())
+    
+    report_unknown_features(batches)
+    frame = concat_batches(batches)
+    # Unknown keys are reported once, here
+    frame.attrs.pop("unknown_features")
+    return frame
 
 
 def create_label_from_outcome(outcome: str) -> int:
@@ -91,28 +419,50 @@ def create_label_from_outcome(outcome: str) -> int:
     Returns:
         Binary label (0 or 1)
     """
-    return 1 if outcome in ["accept", "chat"] else 0
+    return 1 if outcome in POSITIVE_OUTCOMES else 0
+
+
+def drop_incomplete_events(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Drop events missing one of EVENT_FIELDS or carrying no schema feature
+    value (reported on stderr).
+    """
+    usable = np.ones(len(df), dtype=bool)
+    for col in EVENT_FIELDS:
+        usable &= df[col].notna().to_numpy() if col in df.columns else False
+    feature_cols = [f"features.{name}" for name in FEATURE_SCHEMA if f"features.{name}" in df.columns]
+    usable &= df[feature_cols].notna().any(axis=1).to_numpy() if feature_cols else False
+    
+    skipped = int(len(df) - usable.sum())
+    if skipped:
+        print(f"⚠️  Skipping {skipped} events without features or a required field", file=sys.stderr)
+        df = df[usable].reset_index(drop=True)
+    return df
 
 
 def build_training_dataset(
-    records: List[Dict[str, Any]],
-    min_samples: int = 10
+    records: Union[pd.DataFrame, List[Dict[str, Any]]],
+    min_samples: int = 10,
+    skip_incomplete: bool = False
 ) -> pd.DataFrame:
     """
     Build training dataset from parsed event records.
     
     Steps:
-    1. Convert to DataFrame
-    2. Create binary labels from outcomes
-    3. Flatten nested features
+    1. Flatten events (events_to_frame, usually already done by the parser)
+    2. Create binary labels from outcomes (vectorized)
+    3. Keep the schema features present in the data, missing values as 0
     4. Combine features with metadata
     
     Args:
-        records: List of parsed event dictionaries
+        records: Parsed events (from parse_log_file, or a list of event dicts)
         min_samples: Minimum number of samples required
+        skip_incomplete: Drop events missing a required field or every
+            feature instead of raising (an empty DataFrame if none are left)
         
     Returns:
-        Combined dataset DataFrame
+        Combined dataset DataFrame (float32 features, categorical matchType/preset,
+        int64 timestamp, int8 label)
     """
     if len(records) < min_samples:
         raise ValueError(
@@ -121,33 +471,56 @@ def build_training_dataset(
         )
     
     # Convert to DataFrame
-    df = pd.DataFrame(records)
+    if isinstance(records, pd.DataFrame):
+        df = records
+    else:
+        df = events_to_frame(records)
+        report_unknown_features([df])
+    
+    # Served-prediction events (source "ml-server") have no outcome until
+    # they are joined with user feedback - they cannot be labeled yet
+    if "outcome" in df.columns:
+        unlabeled = df["outcome"].isna()
+        if unlabeled.any():
+            print(f"ℹ️  Skipping {unlabeled.sum()} events without an outcome", file=sys.stderr)
+            df = df[~unlabeled].reset_index(drop=True)
+    
+    if skip_incomplete:
+        df = drop_incomplete_events(df)
+        if not len(df):
+            return pd.DataFrame()
     
     # Validate required columns
-    required_cols = ["outcome", "features", "matchType", "preset", "timestamp"]
-    missing_cols = [col for col in required_cols if col not in df.columns]
+    missing_cols = [
+        col for col in EVENT_FIELDS
+        if col not in df.columns or (len(df) and df[col].isna().all())
+    ]
+    # Schema features that occur in the data (even if only as null)
+    if "features_seen" in df.attrs:
+        present_features = df.attrs["features_seen"]
+    else:
+        present_features = [
+            name for name in FEATURE_SCHEMA
+            if f"features.{name}" in df.columns and df[f"features.{name}"].notna().any()
+        ]
+    if len(df) and not present_features:
+        missing_cols.append("features")
     if missing_cols:
         raise ValueError(f"Missing required columns: {missing_cols}")
     
     # Create binary label from outcome (Phase 2 logic)
-    df["label"] = df["outcome"].apply(create_label_from_outcome)
-    
-    # Flatten nested features
-    features_df = pd.json_normalize(df["features"])
+    labels = df["outcome"].isin(POSITIVE_OUTCOMES).to_numpy(dtype=np.int8)
     
     # Fill missing features with 0 (handles different feature sets between real and synthetic events)
     # Real events may have personalityScore, synthetic events have languageScore, lifestyleScore, backgroundScore
-    feature_cols = [col for col in features_df.columns if col != "matchType"]
-    features_df[feature_cols] = features_df[feature_cols].fillna(0)
-    
-    # Combine features with metadata
-    metadata_cols = ["matchType", "preset", "timestamp", "label"]
-    dataset = pd.concat(
-        [features_df, df[metadata_cols]],
-        axis=1
-    )
-    
-    return dataset
+    values = df[[f"features.{name}" for name in present_features]].to_numpy(dtype=np.float32, copy=True)
+    values[np.isnan(values)] = 0
+    
+    # Combine features with metadata, typed as in dataset_io
+    columns = {"matchType": df["matchType"]}
+    columns.update((name, pd.Series(values[:, col], index=df.index)) for col, name in enumerate(present_features))
+    columns.update(preset=df["preset"], timestamp=df["timestamp"], label=pd.Series(labels, index=df.index))
+    return typed_dataset(pd.DataFrame(columns))
 
 
 def time_based_split(
@@ -183,24 +556,26 @@ def time_based_split(
 def save_datasets(
     train: pd.DataFrame,
     val: pd.DataFrame,
-    output_dir: str = "datasets"
+    output_dir: str = "datasets",
+    format: str = "parquet"
 ):
     """
-    Save train and validation datasets to CSV files.
+    Save train and validation datasets.
     
     Args:
         train: Training dataset DataFrame
         val: Validation dataset DataFrame
-        output_dir: Directory to save CSV files
+        output_dir: Directory to save the datasets
+        format: "parquet" (default) or "csv" for export
     """
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
     
-    train_file = output_path / "train.csv"
-    val_file = output_path / "val.csv"
+    train_file = output_path / f"train.{format}"
+    val_file = output_path / f"val.{format}"
     
-    train.to_csv(train_file, index=False)
-    val.to_csv(val_file, index=False)
+    write_dataset(train, train_file)
+    write_dataset(val, val_file)
     
     print(f"✅ Training set saved: {train_file} ({len(train)} samples)")
     print(f"✅ Validation set saved: {val_file} ({len(val)} samples)")
@@ -214,6 +589,265 @@ def save_datasets(
     print(f"  Positive labels (val): {val['label'].sum()} ({val['label'].mean()*100:.1f}%)")
 
 
+# ============================================================================
+# INCREMENTAL BUILDS
+# ============================================================================
+
+CHECKPOINT_FILE = "checkpoint.json"
+PARTITIONS_DIR = "partitions"
+
+# Per-partition timestamp sketch used to place the split cutoff
+TIMESTAMP_QUANTILES = np.linspace(0, 1, 101)
+
+# Leading bytes hashed to tell an appended-to file from a replaced one
+HEAD_FINGERPRINT_BYTES = 1024
+
+
+def _head_sha1(path: str, n_bytes: int) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read(n_bytes)).hexdigest()
+
+
+def file_fingerprint(path: str) -> Dict[str, Any]:
+    """Identity of a log file: device/inode, size and a hash of its first bytes."""
+    stat = os.stat(path)
+    head_bytes = min(stat.st_size, HEAD_FINGERPRINT_BYTES)
+    return {
+        "device": stat.st_dev,
+        "inode": stat.st_ino,
+        "size": stat.st_size,
+        "head_bytes": head_bytes,
+        "head_sha1": _head_sha1(path, head_bytes),
+    }
+
+
+def is_same_log(previous: Dict[str, Any], path: str, fingerprint: Dict[str, Any]) -> bool:
+    """Whether a file is the checkpointed one, unchanged or appended to."""
+    return (
+        (previous["device"], previous["inode"]) == (fingerprint["device"], fingerprint["inode"])
+        and fingerprint["size"] >= previous["offset"]
+        and _head_sha1(path, previous["head_bytes"]) == previous["head_sha1"]
+    )
+
+
+def complete_lines_end(path: str, size: int) -> int:
+    """Offset just past the last newline; a line still being written is left for the next run."""
+    with open(path, "rb") as f:
+        pos = size
+        while pos > 0:
+            step = min(64 * 1024, pos)
+            f.seek(pos - step)
+            newline = f.read(step).rfind(b"\n")
+            if newline >= 0:
+                return pos - step + newline + 1
+            pos -= step
+    return 0
+
+
+def load_checkpoint(path: Path) -> Dict[str, Any]:
+    if not path.exists():
+        return {"files": {}, "partitions": []}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_checkpoint(path: Path, checkpoint: Dict[str, Any]):
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def plan_incremental_parse(
+    files: List[str],
+    previous: Dict[str, Dict[str, Any]],
+    chunk_bytes: int = PARSE_CHUNK_BYTES
+) -> tuple:
+    """
+    Parse tasks covering only what was added to each file since the checkpoint.
+    
+    Uncompressed files resume at their checkpointed offset, also after a
+    rename (matched by inode). Files that were replaced or truncated are read
+    from the start. Compressed files are read once; one that changed since
+    is read again in full.
+    
+    Returns:
+        Tuple of (tasks, checkpoint entries for the files)
+    """
+    by_inode = {(entry["device"], entry["inode"]): entry for entry in previous.values()}
+    tasks = []
+    entries = {}
+    for path in files:
+        fingerprint = file_fingerprint(path)
+        key = os.path.abspath(path)
+        entry = previous.get(key)
+        if entry is None or (entry["device"], entry["inode"]) != (fingerprint["device"], fingerprint["inode"]):
+            # Rotated by rename: continue where the old name left off
+            entry = by_inode.get((fingerprint["device"], fingerprint["inode"]))
+        offset = entry["offset"] if entry and is_same_log(entry, path, fingerprint) else 0
+        if entry and not offset:
+            print(f"ℹ️  {path} was replaced or truncated since the last run, reading it again", file=sys.stderr)
+        
+        if path.endswith(COMPRESSED_SUFFIXES):
+            end = fingerprint["size"]
+            if offset and offset != end:
+                print(f"⚠️  {path} changed since the last run, reading it again (events may repeat)", file=sys.stderr)
+                offset = 0
+            if offset < end:
+                tasks.append((parse_compressed_log, (path, chunk_bytes)))
+        else:
+            end = complete_lines_end(path, fingerprint["size"])
+            if offset < end:
+                tasks.extend(
+                    (parse_log_chunk, (path, start, stop))
+                    for start, stop in find_chunk_boundaries(path, chunk_bytes, start=offset, end=end)
+                )
+        entries[key] = {**fingerprint, "offset": end}
+    return tasks, entries
+
+
+def write_partition(dataset: pd.DataFrame, partitions_dir: Path, seq: int) -> Dict[str, Any]:
+    """Write one increment as a time-sorted partition and describe it."""
+    dataset = dataset.sort_values("timestamp", kind="stable")
+    partitions_dir.mkdir(parents=True, exist_ok=True)
+    name = f"part-{seq:05d}.parquet"
+    write_dataset(dataset, partitions_dir / name)
+    return {
+        "file": name,
+        "rows": len(dataset),
+        "positives": int(dataset["label"].sum()),
+        "min_timestamp": int(dataset["timestamp"].min()),
+        "max_timestamp": int(dataset["timestamp"].max()),
+        "timestamp_quantiles": np.quantile(
+            dataset["timestamp"].to_numpy(), TIMESTAMP_QUANTILES, method="inverted_cdf"
+        ).astype(np.int64).tolist(),
+    }
+
+
+def choose_partition_cutoff(partitions: List[Dict[str, Any]], train_ratio: float) -> int:
+    """
+    Timestamp that puts about train_ratio of the rows at or before it.
+    
+    Estimated from each partition's timestamp quantiles, so no partition
+    has to be read and overlapping partitions (late events) are accounted for.
+    """
+    total = sum(part["rows"] for part in partitions)
+    target = int(total * train_ratio)
+    if target == 0:
+        return min(part["min_timestamp"] for part in partitions) - 1
+    
+    sketch = QuantileSketch()
+    for part in partitions:
+        quantiles = part.get("timestamp_quantiles") or [part["min_timestamp"], part["max_timestamp"]]
+        sketch.add_curve(part["rows"], quantiles)
+    return int(sketch.value_at_rank(target))
+
+
+def save_partitioned_split(
+    partitions: List[Dict[str, Any]],
+    output_dir: str = "datasets",
+    train_ratio: float = 0.8,
+    format: str = "parquet"
+):
+    """
+    Write train/val from time partitions without a global sort.
+    
+    Every row at or before the cutoff timestamp goes to train and every later
+    row to val, so the split stays strictly time-based. Partitions are read
+    one at a time (memory-mapped) and appended in partition order.
+    """
+    output_path = Path(output_dir)
+    partitions_dir = output_path / PARTITIONS_DIR
+    cutoff = choose_partition_cutoff(partitions, train_ratio)
+    
+    # Column union, in order of first appearance (new features show up later)
+    columns = list(dict.fromkeys(
+        col for part in partitions for col in dataset_columns(partitions_dir / part["file"])
+    ))
+    
+    counts = {"train": [0, 0], "val": [0, 0]}
+    outputs = {side: output_path / f"{side}.{format}" for side in counts}
+    with DatasetWriter(outputs["train"], columns) as train_writer, DatasetWriter(outputs["val"], columns) as val_writer:
+        writers = {"train": train_writer, "val": val_writer}
+        for part in sorted(partitions, key=lambda part: (part["min_timestamp"], part["file"])):
+            rows = read_dataset(partitions_dir / part["file"])
+            at_or_before = rows["timestamp"].to_numpy() <= cutoff
+            for side, mask in (("train", at_or_before), ("val", ~at_or_before)):
+                if mask.any():
+                    selected = rows[mask]
+                    writers[side].write(selected)
+                    counts[side][0] += len(selected)
+                    counts[side][1] += int(selected["label"].sum())
+        for writer in writers.values():
+            if not writer.rows:
+                # Keep an empty file with the schema
+                writer.write(rows.iloc[:0])
+    
+    total = counts["train"][0] + counts["val"][0]
+    print(f"✅ Training set saved: {outputs['train']} ({counts['train'][0]} samples)")
+    print(f"✅ Validation set saved: {outputs['val']} ({counts['val'][0]} samples)")
+    print("\n📊 Dataset Summary:")
+    print(f"  Total samples: {total} in {len(partitions)} partitions (cutoff timestamp {cutoff})")
+    for name in ("train", "val"):
+        rows, positives = counts[name]
+        label = "Training" if name == "train" else "Validation"
+        print(f"  {label} samples: {rows} ({rows / total * 100:.1f}%), positive labels: {positives} ({positives / max(rows, 1) * 100:.1f}%)")
+
+
+def build_incremental(
+    log_inputs: List[str],
+    output_dir: str = "datasets",
+    train_ratio: float = 0.8,
+    min_samples: int = 10,
+    workers: int = None,
+    chunk_bytes: int = PARSE_CHUNK_BYTES,
+    format: str = "parquet"
+):
+    """
+    Parse only events added since the last run, append them as a new time
+    partition and rewrite train/val from the partitions.
+    
+    The checkpoint (output_dir/checkpoint.json) records each log file's
+    read offset and fingerprint, and the partitions written so far.
+    """
+    output_path = Path(output_dir)
+    checkpoint_path = output_path / CHECKPOINT_FILE
+    checkpoint = load_checkpoint(checkpoint_path)
+    
+    try:
+        files = expand_log_inputs(log_inputs)
+        tasks, entries = plan_incremental_parse(files, checkpoint["files"], chunk_bytes)
+        print(f"🔍 Parsing new log data ({len(tasks)} chunks in {len(files)} files)...")
+        records = run_parse_tasks(tasks, workers)
+    except FileNotFoundError as e:
+        print(f"Error: Log file not found: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"✅ Parsed {len(records)} new events")
+    
+    partitions = checkpoint["partitions"]
+    if len(records):
+        # A bad increment must not block later runs: unusable events are
+        # skipped and the checkpoint still moves past them
+        dataset = build_training_dataset(records, min_samples=0, skip_incomplete=True)
+        if len(dataset):
+            seq = max((int(part["file"][5:10]) for part in partitions), default=0) + 1
+            partitions.append(write_partition(dataset, output_path / PARTITIONS_DIR, seq))
+            print(f"✅ Partition {partitions[-1]['file']} written ({len(dataset)} samples)")
+    
+    # Only after the partition is on disk, so a crash re-reads the increment
+    checkpoint["files"] = entries
+    output_path.mkdir(parents=True, exist_ok=True)
+    save_checkpoint(checkpoint_path, checkpoint)
+    
+    total = sum(part["rows"] for part in partitions)
+    if total < min_samples:
+        print(f"❌ Insufficient data: {total} samples in partitions, minimum {min_samples} required", file=sys.stderr)
+        sys.exit(1)
+    
+    print("✂️  Splitting on partition boundaries...")
+    save_partitioned_split(partitions, output_dir, train_ratio, format)
+
+
 def main():
     """Main entry point for dataset builder script."""
     parser = argparse.ArgumentParser(
@@ -222,13 +856,20 @@ def main():
     parser.add_argument(
         "log_file",
         type=str,
-        help="Path to JSONL log file containing [ML_MATCH_EVENT] entries"
+        nargs="+",
+        help="JSONL log files containing [ML_MATCH_EVENT] entries (.gz/.zst, directories and globs accepted)"
     )
     parser.add_argument(
         "-o", "--output-dir",
         type=str,
         default="datasets",
-        help="Output directory for CSV files (default: datasets)"
+        help="Output directory for the datasets (default: datasets)"
+    )
+    parser.add_argument(
+        "--format",
+        choices=DATASET_FORMATS,
+        default="parquet",
+        help="Output format (default: parquet; csv for export)"
     )
     parser.add_argument(
         "--train-ratio",
@@ -242,11 +883,45 @@ def main():
         default=10,
         help="Minimum number of samples required (default: 10)"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Worker processes for parsing (default: CPU count)"
+    )
+    parser.add_argument(
+        "--chunk-size-mb",
+        type=int,
+        default=PARSE_CHUNK_BYTES // (1024 * 1024),
+        help=f"Log bytes parsed per task, in MB (default: {PARSE_CHUNK_BYTES // (1024 * 1024)})"
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Parse only log data added since the last run and append it as a new partition"
+    )
     
     args = parser.parse_args()
     
+    if args.incremental:
+        build_incremental(
+            args.log_file,
+            output_dir=args.output_dir,
+            train_ratio=args.train_ratio,
+            min_samples=args.min_samples,
+            workers=args.workers,
+            chunk_bytes=args.chunk_size_mb * 1024 * 1024,
+            format=args.format
+        )
+        print("\n✅ Dataset builder completed successfully!")
+        return
+    
     print("🔍 Parsing log file...")
-    records = parse_log_file(args.log_file)
+    records = parse_log_file(
+        args.log_file,
+        workers=args.workers,
+        chunk_bytes=args.chunk_size_mb * 1024 * 1024
+    )
     print(f"✅ Parsed {len(records)} events")
     
     if len(records) == 0:
@@ -263,7 +938,7 @@ def main():
     train, val = time_based_split(dataset, train_ratio=args.train_ratio)
     
     print("💾 Saving datasets...")
-    save_datasets(train, val, output_dir=args.output_dir)
+    save_datasets(train, val, output_dir=args.output_dir, format=args.format)
     
     print("\n✅ Dataset builder completed successfully!")
 
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Dataset I/O for the ML Pipeline
+
+Typed, columnar storage shared by build_training_set.py,
+build_ml_training_dataset.py, split_dataset.py, verify_dataset.py and
+train_model.py.
+
+Datasets are Parquet files with an explicit schema:
+- Features (and derived scores): float32
+- label: int8
+- matchType, preset: categorical (dictionary-encoded strings)
+- timestamp: int64 (epoch milliseconds)
+
+Reads are memory-mapped and can be limited to the columns a stage needs.
+CSV is still accepted everywhere and can be written as an export format;
+CSV input gets the same dtypes after loading.
+
+A dataset path may also be a directory of part files (part-00000.parquet,
+...), read in name order as one dataset.
+"""
+
+import os
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+METADATA_COLUMNS = ["matchType", "preset", "timestamp", "label"]
+CATEGORICAL_COLUMNS = ["matchType", "preset"]
+
+# Computed by the synthetic generator, not available in production
+DERIVED_COLUMNS = ["compatibility", "probability"]
+
+DATASET_FORMATS = ("parquet", "csv")
+
+# Added before flooring in histogram_bins, so a value on a bin edge
+# (tier scores like 0.7) lands in the same bin whatever its rounding
+HISTOGRAM_EPSILON = 1e-6
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("Parquet datasets require pyarrow: pip install pyarrow")
+
+
+def dataset_format(path: str) -> str:
+    """'csv' for .csv files, otherwise 'parquet'."""
+    return "csv" if str(path).lower().endswith(".csv") else "parquet"
+
+
+def default_dataset_path(stem: str, directory: str = "datasets") -> str:
+    """
+    Default location of a dataset: the Parquet file, a partitioned dataset
+    directory, or an existing CSV from before the switch to Parquet.
+    """
+    parquet_path = Path(directory) / f"{stem}.parquet"
+    if parquet_path.exists():
+        return str(parquet_path)
+    for path in (Path(directory) / stem, Path(directory) / f"{stem}.csv"):
+        if path.exists():
+            return str(path)
+    return str(parquet_path)
+
+
+def dataset_files(path: str) -> List[Path]:
+    """The file itself, or the part files of a dataset directory in name order."""
+    path = Path(path)
+    if not path.is_dir():
+        return [path]
+    return sorted(
+        part for part in path.iterdir()
+        if part.suffix in (".parquet", ".csv") and not part.name.startswith(("_", "."))
+    )
+
+
+def histogram_bins(values, bins: int, value_range=(0.0, 1.0)) -> np.ndarray:
+    """
+    Fixed-width bin index of every value (same shape as values).
+    
+    Shared by training (reference histograms), the dataset statistics and
+    the ML server's drift monitor, so all of them bin alike: values are
+    taken as float32 (the dataset feature dtype), scaled in float64 and
+    floored after adding HISTOGRAM_EPSILON. Values outside the range go to
+    the first/last bin.
+    """
+    low, high = value_range
+    scaled = (np.asarray(values, dtype=np.float32).astype(np.float64) - low) * (bins / (high - low))
+    with np.errstate(invalid="ignore"):
+        return np.clip(np.floor(scaled + HISTOGRAM_EPSILON), 0, bins - 1).astype(np.int64)
+
+
+def typed_dataset(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Apply the dataset schema to a frame.
+
+    Drops the duplicate matchType column older CSVs carry (read back as
+    "matchType.1"), casts features to float32, label to int8, timestamp to
+    int64 and matchType/preset to categoricals.
+    """
+    df = df.loc[:, ~df.columns.duplicated()]
+    if "matchType.1" in df.columns:
+        df = df.drop(columns=["matchType.1"])
+
+    columns = {}
+    for col in df.columns:
+        values = df[col]
+        if col == "label":
+            values = values.astype(np.int8)
+        elif col == "timestamp":
+            if not values.isna().any():
+                values = values.astype(np.int64)
+        elif col in CATEGORICAL_COLUMNS:
+            values = values.astype("category")
+        elif pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+            values = values.astype(np.float32)
+        columns[col] = values
+    return pd.DataFrame(columns, index=df.index)
+
+
+def arrow_schema(df: pd.DataFrame):
+    """Arrow schema of a typed frame (see typed_dataset)."""
+    _require_pyarrow()
+    fields = []
+    for col in df.columns:
+        dtype = df[col].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            arrow_type = pa.dictionary(pa.int32(), pa.string())
+        elif dtype == np.float32:
+            arrow_type = pa.float32()
+        elif dtype == np.int8:
+            arrow_type = pa.int8()
+        elif dtype == np.int64:
+            arrow_type = pa.int64()
+        else:
+            arrow_type = pa.Schema.from_pandas(df[[col]], preserve_index=False).field(col).type
+        fields.append(pa.field(col, arrow_type))
+    return pa.schema(fields)
+
+
+class DatasetWriter:
+    """
+    Append typed frames to one dataset file (Parquet row groups or CSV rows).
+
+    The column set is fixed by the first frame (or `columns`); later frames
+    are aligned to it, with missing numeric columns filled with 0.
+    Output goes to a temporary file that replaces `path` on close().
+    """
+
+    def __init__(self, path: str, columns: Optional[List[str]] = None, format: Optional[str] = None):
+        self.path = Path(path)
+        self.format = format or dataset_format(path)
+        if self.format == "parquet":
+            _require_pyarrow()
+        self.columns = list(columns) if columns else None
+        self.rows = 0
+        self._tmp_path = self.path.with_name(f".{self.path.name}.tmp")
+        self._writer = None
+        self._schema = None
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def write(self, df: pd.DataFrame):
+        df = typed_dataset(df)
+        if self.columns is None:
+            self.columns = list(df.columns)
+        missing = [col for col in self.columns if col not in df.columns]
+        if missing:
+            df = df.assign(**{col: np.float32(0) for col in missing})
+        df = df[self.columns]
+
+        if self.format == "csv":
+            df.to_csv(self._tmp_path, mode="a" if self.rows else "w", header=not self.rows, index=False)
+        else:
+            if self._writer is None:
+                self._schema = arrow_schema(df)
+                self._writer = pq.ParquetWriter(self._tmp_path, self._schema)
+            table = pa.Table.from_pandas(df, preserve_index=False).cast(self._schema)
+            self._writer.write_table(table)
+        self.rows += len(df)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._tmp_path.exists():
+            os.replace(self._tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            if self._writer is not None:
+                self._writer.close()
+            self._tmp_path.unlink(missing_ok=True)
+
+
+def write_dataset(df: pd.DataFrame, path: str, format: Optional[str] = None):
+    """Write a whole dataset (format from the suffix unless given)."""
+    with DatasetWriter(path, format=format) as writer:
+        writer.write(df)
+
+
+def dataset_columns(path: str) -> List[str]:
+    """Column names of a dataset without reading its data."""
+    if Path(path).is_dir():
+        files = dataset_files(path)
+        return dataset_columns(files[0]) if files else []
+    if dataset_format(path) == "csv":
+        df = pd.read_csv(path, nrows=0)
+        return [col for col in df.columns if col != "matchType.1"]
+    _require_pyarrow()
+    return pq.read_schema(path).names
+
+
+def read_dataset(path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Read a dataset with the dataset schema applied.
+
+    Args:
+        path: Parquet (memory-mapped) or CSV file
+        columns: Only read these columns (default: all)
+    """
+    if Path(path).is_dir():
+        parts = [read_dataset(part, columns) for part in dataset_files(path)]
+        if not parts:
+            raise FileNotFoundError(f"No dataset files in {path}")
+        return typed_dataset(pd.concat(parts, ignore_index=True))
+    if dataset_format(path) == "csv":
+        df = pd.read_csv(path, usecols=columns)
+    else:
+        _require_pyarrow()
+        df = pq.read_table(path, columns=columns, memory_map=True).to_pandas()
+    return typed_dataset(df)
+
+
+def iter_dataset_batches(
+    path: str,
+    columns: Optional[List[str]] = None,
+    batch_size: int = 100_000
+) -> Iterator[pd.DataFrame]:
+    """Read a dataset in typed batches of at most batch_size rows."""
+    if Path(path).is_dir():
+        for part in dataset_files(path):
+            yield from iter_dataset_batches(part, columns, batch_size)
+        return
+    if dataset_format(path) == "csv":
+        for chunk in pd.read_csv(path, usecols=columns, chunksize=batch_size):
+            yield typed_dataset(chunk)
+        return
+    _require_pyarrow()
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        yield typed_dataset(batch.to_pandas())
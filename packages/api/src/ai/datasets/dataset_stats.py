@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Mergeable Dataset Statistics
+
+One vectorized pass per chunk collects everything the validation reports
+need: counts, moments, min/max, label correlations, fixed-bin histograms,
+category counts and approximate distinct counts (HyperLogLog). Approximate
+quantiles (QuantileSketch) serve split cutoffs. Stats of
+separate chunks or partitions merge exactly (HyperLogLog: as if counted
+together), so shards are summarized in parallel and combined.
+
+Used by build_ml_training_dataset.py (validation) and verify_dataset.py;
+reports are written as JSON next to the dataset.
+"""
+
+import os
+import json
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from dataset_io import CATEGORICAL_COLUMNS, dataset_files, histogram_bins, iter_dataset_batches
+
+# Fixed bins over [0,1] (all features live there); values outside the range
+# are counted in the first/last bin (dataset_io.histogram_bins, as in train_model.py)
+HISTOGRAM_BINS = 20
+HISTOGRAM_RANGE = (0.0, 1.0)
+
+# HyperLogLog precision: 2^14 registers per column, ~0.8% standard error
+HLL_PRECISION = 14
+
+# Columns summarized as value counts rather than moments
+COUNTED_COLUMNS = CATEGORICAL_COLUMNS + ["label"]
+
+# Columns without a histogram (not in [0,1])
+UNBINNED_COLUMNS = ["timestamp"]
+
+STATS_BATCH_ROWS = 1_000_000
+
+# Quantile sketch: levels kept per batch, and curves kept before compacting
+SKETCH_QUANTILES = np.linspace(0, 1, 1001)
+SKETCH_MAX_CURVES = 64
+
+
+def hll_update(registers: np.ndarray, hashes: np.ndarray):
+    """Add uint64 hashes to HyperLogLog registers (in place)."""
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    index = (hashes >> np.uint64(64 - HLL_PRECISION)).astype(np.int64)
+    rest = hashes & np.uint64((1 << (64 - HLL_PRECISION)) - 1)
+    # Rank = leading zeros in the remaining bits + 1 (bit length via float log2)
+    bit_length = np.zeros(len(rest), dtype=np.int64)
+    nonzero = rest > 0
+    bit_length[nonzero] = np.floor(np.log2(rest[nonzero].astype(np.float64))).astype(np.int64) + 1
+    rank = (64 - HLL_PRECISION - bit_length + 1).astype(np.uint8)
+    np.maximum.at(registers, index, rank)
+
+
+def hll_estimate(registers: np.ndarray) -> int:
+    """Distinct count estimate of HyperLogLog registers."""
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.exp2(-registers.astype(np.float64)))
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros:
+        # Small-range correction (linear counting)
+        estimate = m * np.log(m / zeros)
+    return int(round(estimate))
+
+
+def _sorted_unique(values: np.ndarray) -> np.ndarray:
+    """Sorted distinct values (sort + adjacent compare; faster than np.unique for hashes)."""
+    values = np.sort(values)
+    if len(values) > 1:
+        values = values[np.concatenate(([True], values[1:] != values[:-1]))]
+    return values
+
+
+def _new_registers() -> np.ndarray:
+    return np.zeros(1 << HLL_PRECISION, dtype=np.uint8)
+
+
+class DatasetStats:
+    """
+    Mergeable summary of a dataset.
+
+    Numeric columns keep count, mean and M2 (Chan et al. parallel update),
+    the co-moment with the label, min/max, missing values, a histogram and
+    HyperLogLog registers. COUNTED_COLUMNS keep exact value counts.
+    Duplicate rows are counted exactly from the distinct 64-bit hashes of
+    whole float32 feature rows (8 bytes per distinct row).
+    """
+
+    def __init__(self, label_column: str = "label"):
+        self.label_column = label_column
+        self.rows = 0
+        self.columns: Dict[str, dict] = {}
+        self.value_counts: Dict[str, Dict[str, int]] = {}
+        # Sorted distinct row hashes per chunk, combined on demand
+        self._row_hashes = []
+
+    def update(self, df: pd.DataFrame) -> "DatasetStats":
+        """Add a chunk (one vectorized pass over its numeric block)."""
+        if not len(df):
+            return self
+        self.rows += len(df)
+
+        for col in df.columns:
+            if col in COUNTED_COLUMNS or not pd.api.types.is_numeric_dtype(df[col]):
+                counts = self.value_counts.setdefault(col, {})
+                for value, count in df[col].value_counts().items():
+                    counts[str(value)] = counts.get(str(value), 0) + int(count)
+
+        numeric_cols = [
+            col for col in df.columns
+            if col not in COUNTED_COLUMNS and pd.api.types.is_numeric_dtype(df[col])
+        ]
+        if not numeric_cols:
+            return self
+
+        x = df[numeric_cols].to_numpy(dtype=np.float64)
+        valid = ~np.isnan(x)
+        complete = bool(valid.all())
+        count = valid.sum(axis=0)
+        safe_count = np.maximum(count, 1)
+        # Missing values are zeroed out of every sum (skipped when there are none)
+        x0 = x if complete else np.where(valid, x, 0.0)
+        mean = x0.sum(axis=0) / safe_count
+        dx = x - mean
+        if not complete:
+            dx[~valid] = 0.0
+        m2 = np.einsum("ij,ij->j", dx, dx)
+        low = (x if complete else np.where(valid, x, np.inf)).min(axis=0)
+        high = (x if complete else np.where(valid, x, -np.inf)).max(axis=0)
+
+        # Co-moments with the label over rows where the column is present
+        if self.label_column in df.columns:
+            y = df[self.label_column].to_numpy(dtype=np.float64)
+            if complete:
+                mean_y = np.full(len(numeric_cols), y.mean())
+                dy = (y - y.mean())[:, None]
+                m2_y = np.full(len(numeric_cols), float(dy[:, 0] @ dy[:, 0]))
+                comoment = dy[:, 0] @ dx
+            else:
+                mean_y = (valid * y[:, None]).sum(axis=0) / safe_count
+                dy = np.where(valid, y[:, None] - mean_y, 0.0)
+                m2_y = np.einsum("ij,ij->j", dy, dy)
+                comoment = np.einsum("ij,ij->j", dx, dy)
+        else:
+            mean_y = m2_y = comoment = np.zeros(len(numeric_cols))
+
+        bin_idx = histogram_bins(x0, HISTOGRAM_BINS, HISTOGRAM_RANGE)
+
+        for j, col in enumerate(numeric_cols):
+            chunk = {
+                "count": int(count[j]),
+                "missing": int(len(df) - count[j]),
+                "mean": float(mean[j]),
+                "m2": float(m2[j]),
+                "min": float(low[j]),
+                "max": float(high[j]),
+                "label_mean": float(mean_y[j]),
+                "label_m2": float(m2_y[j]),
+                "comoment": float(comoment[j]),
+                "histogram": None,
+                "registers": _new_registers(),
+            }
+            if col not in UNBINNED_COLUMNS:
+                col_bins = bin_idx[:, j] if complete else bin_idx[valid[:, j], j]
+                chunk["histogram"] = np.bincount(col_bins, minlength=HISTOGRAM_BINS)
+            present = (x[:, j] if complete else x[valid[:, j], j]).astype(np.float32)
+            hll_update(chunk["registers"], pd.util.hash_array(present))
+            self.columns[col] = _merge_column(self.columns.get(col), chunk)
+
+        feature_cols = [col for col in numeric_cols if col not in UNBINNED_COLUMNS]
+        row_hashes = pd.util.hash_pandas_object(df[feature_cols].astype(np.float32), index=False)
+        self._row_hashes.append(_sorted_unique(row_hashes.to_numpy()))
+        return self
+
+    def merge(self, other: "DatasetStats") -> "DatasetStats":
+        """Combine with the stats of another chunk or partition (in place)."""
+        self.rows += other.rows
+        for col, counts in other.value_counts.items():
+            merged = self.value_counts.setdefault(col, {})
+            for value, count in counts.items():
+                merged[value] = merged.get(value, 0) + count
+        for col, column in other.columns.items():
+            self.columns[col] = _merge_column(self.columns.get(col), column)
+        self._row_hashes.extend(other._row_hashes)
+        return self
+
+    def column_summary(self, col: str) -> dict:
+        """Derived statistics of one numeric column."""
+        c = self.columns[col]
+        n = c["count"]
+        std = float(np.sqrt(c["m2"] / (n - 1))) if n > 1 else 0.0
+        denominator = np.sqrt(c["m2"] * c["label_m2"])
+        summary = {
+            "count": n,
+            "missing": c["missing"],
+            "min": c["min"] if n else None,
+            "max": c["max"] if n else None,
+            "mean": c["mean"] if n else None,
+            "std": std,
+            "label_corr": float(c["comoment"] / denominator) if denominator > 0 else None,
+            "approx_distinct": hll_estimate(c["registers"]),
+        }
+        if c["histogram"] is not None:
+            summary["histogram"] = c["histogram"].tolist()
+        return summary
+
+    def distinct_rows(self) -> int:
+        """Number of distinct feature rows."""
+        if len(self._row_hashes) > 1:
+            self._row_hashes = [_sorted_unique(np.concatenate(self._row_hashes))]
+        return len(self._row_hashes[0]) if self._row_hashes else 0
+
+    def duplicate_rows(self) -> int:
+        """Rows repeating an earlier feature row (exact, up to 64-bit hash collisions)."""
+        return self.rows - self.distinct_rows()
+
+    def to_dict(self) -> dict:
+        """JSON-ready report."""
+        return {
+            "generated_at": datetime.now().isoformat(),
+            "rows": self.rows,
+            "histogram_bins": HISTOGRAM_BINS,
+            "histogram_range": list(HISTOGRAM_RANGE),
+            "duplicate_rows": self.duplicate_rows(),
+            "value_counts": self.value_counts,
+            "columns": {col: self.column_summary(col) for col in self.columns},
+        }
+
+
+def _merge_column(a: Optional[dict], b: dict) -> dict:
+    """Merge two per-column sketches (parallel mean/M2/co-moment update)."""
+    if a is None:
+        return {**b, "registers": b["registers"].copy(),
+                "histogram": None if b["histogram"] is None else b["histogram"].copy()}
+    n_a, n_b = a["count"], b["count"]
+    n = n_a + n_b
+    merged = {
+        "count": n,
+        "missing": a["missing"] + b["missing"],
+        "min": min(a["min"], b["min"]),
+        "max": max(a["max"], b["max"]),
+        "registers": np.maximum(a["registers"], b["registers"]),
+        "histogram": None if a["histogram"] is None else a["histogram"] + b["histogram"],
+    }
+    if n == 0:
+        merged.update(mean=0.0, m2=0.0, label_mean=0.0, label_m2=0.0, comoment=0.0)
+        return merged
+    delta = b["mean"] - a["mean"]
+    delta_y = b["label_mean"] - a["label_mean"]
+    weight = n_a * n_b / n
+    merged.update(
+        mean=a["mean"] + delta * n_b / n,
+        m2=a["m2"] + b["m2"] + delta * delta * weight,
+        label_mean=a["label_mean"] + delta_y * n_b / n,
+        label_m2=a["label_m2"] + b["label_m2"] + delta_y * delta_y * weight,
+        comoment=a["comoment"] + b["comoment"] + delta * delta_y * weight,
+    )
+    return merged
+
+
+class QuantileSketch:
+    """
+    Mergeable approximate quantiles of a stream of values.
+
+    Each batch adds its quantile curve (SKETCH_QUANTILES levels) and row
+    count; a rank query interpolates every curve and sums them, so
+    overlapping batches are handled. Past SKETCH_MAX_CURVES curves the
+    sketch is compacted into one, keeping memory bounded.
+    """
+
+    def __init__(self):
+        self.curves = []  # (rows, quantile values)
+
+    @property
+    def rows(self) -> int:
+        return sum(rows for rows, _ in self.curves)
+
+    def update(self, values) -> "QuantileSketch":
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.add_curve(len(values), np.quantile(values, SKETCH_QUANTILES, method="inverted_cdf"))
+        return self
+
+    def add_curve(self, rows: int, quantiles) -> "QuantileSketch":
+        """Add precomputed quantiles (evenly spaced levels from 0 to 1) of `rows` values."""
+        self.curves.append((rows, np.asarray(quantiles, dtype=np.float64)))
+        if len(self.curves) > SKETCH_MAX_CURVES:
+            self.compact()
+        return self
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        for rows, quantiles in other.curves:
+            self.add_curve(rows, quantiles)
+        return self
+
+    def values_at_ranks(self, targets) -> np.ndarray:
+        """Smallest sketched values with about `targets` values at or below them."""
+        curves = [(rows, q, np.linspace(0, 1, len(q))) for rows, q in self.curves]
+        candidates = np.unique(np.concatenate([q for _, q, _ in curves]))
+        rank = sum(rows * np.interp(candidates, q, levels) for rows, q, levels in curves)
+        return candidates[np.minimum(np.searchsorted(rank, targets), len(candidates) - 1)]
+
+    def value_at_rank(self, target: float) -> float:
+        return float(self.values_at_ranks([target])[0])
+
+    def quantile(self, q: float) -> float:
+        return self.value_at_rank(q * self.rows)
+
+    def compact(self):
+        """Replace all curves with one curve of the combined distribution."""
+        rows = self.rows
+        quantiles = self.values_at_ranks(SKETCH_QUANTILES * rows)
+        quantiles[0] = min(q[0] for _, q in self.curves)
+        self.curves = [(rows, quantiles)]
+
+
+def frame_stats(df: pd.DataFrame, batch_size: int = STATS_BATCH_ROWS) -> DatasetStats:
+    """Stats of an in-memory frame, in batches to bound temporaries."""
+    stats = DatasetStats()
+    for start in range(0, len(df), batch_size):
+        stats.update(df.iloc[start:start + batch_size])
+    return stats
+
+
+def file_stats(path: str, batch_size: int = STATS_BATCH_ROWS) -> DatasetStats:
+    """Stats of one dataset file, read in batches."""
+    stats = DatasetStats()
+    for batch in iter_dataset_batches(path, batch_size=batch_size):
+        stats.update(batch)
+    return stats
+
+
+def compute_dataset_stats(path: str, workers: int = None) -> DatasetStats:
+    """
+    Stats of a dataset file or partitioned directory.
+
+    Partitions are summarized in worker processes and merged in order.
+    """
+    files = [str(part) for part in dataset_files(path)]
+    workers = min(workers or os.cpu_count() or 1, len(files))
+    if workers <= 1:
+        results = [file_stats(part) for part in files]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(file_stats, files))
+    stats = DatasetStats()
+    for result in results:
+        stats.merge(result)
+    return stats
+
+
+def stats_report_path(path: str) -> Path:
+    """Report location: <dataset>.stats.json, or _stats.json inside a dataset directory."""
+    path = Path(path)
+    if path.is_dir():
+        return path / "_stats.json"
+    return path.with_name(f"{path.name}.stats.json")
+
+
+def write_stats_report(stats: DatasetStats, path: str, extra: Optional[dict] = None) -> Path:
+    """Write the JSON report of a dataset next to it (atomically)."""
+    report = stats.to_dict()
+    report["dataset"] = str(path)
+    if extra:
+        report.update(extra)
+    report_path = stats_report_path(path)
+    tmp_path = report_path.with_name(f".{report_path.name}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp_path, report_path)
+    return report_path
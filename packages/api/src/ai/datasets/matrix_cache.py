@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Prepared Training Matrix Cache
+
+Stores the output of train_model.prepare_features (features as a float32
+matrix, labels as int8) on disk, keyed by a hash of the dataset file
+contents and the feature preparation config. Later training runs on the
+same data memory-map the cached chunks instead of re-reading and
+re-preparing the dataset.
+
+Layout of an entry (<cache dir>/<key>/):
+- meta.json: feature names, rows, chunk count, config, reference feature
+  histograms
+- features-NNNNN.npy / labels-NNNNN.npy: one pair per prepared batch
+
+Entries are written to a temporary directory and renamed into place, so
+a reader never sees a partial entry. Using an entry refreshes its
+timestamp; eviction drops entries older than max_age_days, then the least
+recently used ones until the cache fits in max_bytes.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import time
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from dataset_io import dataset_files
+
+CACHE_DIR = os.getenv("ML_MATRIX_CACHE_DIR", "datasets/.matrix_cache")
+CACHE_MAX_BYTES = 5 * 1024 ** 3
+CACHE_MAX_AGE_DAYS = 14
+HASH_BLOCK_BYTES = 4 * 1024 * 1024
+
+
+def dataset_fingerprint(path: str, config: dict) -> str:
+    """
+    Cache key of a prepared dataset: hash of every dataset file's name and
+    content plus the preparation config (JSON, sorted keys).
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps(config, sort_keys=True, default=str).encode("utf-8"))
+    for file in dataset_files(path):
+        digest.update(file.name.encode("utf-8"))
+        with open(file, "rb") as f:
+            while True:
+                block = f.read(HASH_BLOCK_BYTES)
+                if not block:
+                    break
+                digest.update(block)
+    return digest.hexdigest()
+
+
+class CachedMatrix:
+    """A cache entry: prepared features/labels as memory-mapped chunks."""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        with open(self.directory / "meta.json") as f:
+            self.meta = json.load(f)
+        self.feature_names = self.meta["feature_names"]
+        self.rows = self.meta["rows"]
+        self.histograms = self.meta.get("histograms")
+
+    def iter_chunks(self) -> Iterator[Tuple[pd.DataFrame, pd.Series]]:
+        for i in range(self.meta["chunks"]):
+            features = np.load(self.directory / f"features-{i:05d}.npy", mmap_mode="r")
+            labels = np.load(self.directory / f"labels-{i:05d}.npy", mmap_mode="r")
+            yield pd.DataFrame(features, columns=self.feature_names), pd.Series(labels, name="label")
+
+    def load(self) -> Tuple[pd.DataFrame, pd.Series]:
+        """All chunks as one features frame and labels series."""
+        chunks = list(self.iter_chunks())
+        if not chunks:
+            return pd.DataFrame(columns=self.feature_names, dtype=np.float32), pd.Series([], dtype=np.int8, name="label")
+        features = np.concatenate([chunk.to_numpy() for chunk, _ in chunks])
+        labels = np.concatenate([chunk.to_numpy() for _, chunk in chunks])
+        return pd.DataFrame(features, columns=self.feature_names), pd.Series(labels, name="label")
+
+
+class MatrixWriter:
+    """Write prepared batches as a new cache entry (committed on close)."""
+
+    def __init__(self, cache: "MatrixCache", key: str, config: dict):
+        self.cache = cache
+        self.key = key
+        self.config = config
+        self.feature_names = None
+        self.rows = 0
+        self.chunks = 0
+        self.histograms = None
+        self._tmp_dir = cache.directory / f".{key}.{os.getpid()}.tmp"
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+        self._tmp_dir.mkdir(parents=True)
+
+    def write(self, features: pd.DataFrame, labels: pd.Series):
+        if self.feature_names is None:
+            self.feature_names = list(features.columns)
+        np.save(self._tmp_dir / f"features-{self.chunks:05d}.npy", features[self.feature_names].to_numpy(dtype=np.float32))
+        np.save(self._tmp_dir / f"labels-{self.chunks:05d}.npy", labels.to_numpy(dtype=np.int8))
+        self.rows += len(features)
+        self.chunks += 1
+
+    def close(self) -> Optional[CachedMatrix]:
+        meta = {
+            "key": self.key,
+            "feature_names": self.feature_names or [],
+            "rows": self.rows,
+            "chunks": self.chunks,
+            "config": self.config,
+            "histograms": self.histograms,
+            "created_at": time.time(),
+        }
+        with open(self._tmp_dir / "meta.json", "w") as f:
+            json.dump(meta, f)
+        entry = self.cache.directory / self.key
+        try:
+            os.rename(self._tmp_dir, entry)
+        except OSError:
+            # Another run committed the same entry first
+            self.abort()
+        self.cache.evict()
+        return self.cache.get(self.key)
+
+    def abort(self):
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+
+
+class MatrixCache:
+    """
+    Directory of prepared training matrices keyed by dataset_fingerprint.
+
+    Args:
+        directory: Cache directory (created on first write)
+        max_bytes: Total size kept after eviction
+        max_age_days: Entries unused for longer are evicted
+    """
+
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES,
+                 max_age_days: float = CACHE_MAX_AGE_DAYS):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+
+    def get(self, key: str) -> Optional[CachedMatrix]:
+        """The entry for key (marked as used), or None."""
+        entry = self.directory / key
+        if not (entry / "meta.json").exists():
+            return None
+        os.utime(entry / "meta.json")
+        return CachedMatrix(entry)
+
+    def writer(self, key: str, config: dict) -> MatrixWriter:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        return MatrixWriter(self, key, config)
+
+    def entries(self) -> List[Tuple[Path, float, int]]:
+        """(entry, last used, size in bytes) of every committed entry."""
+        if not self.directory.exists():
+            return []
+        entries = []
+        for entry in self.directory.iterdir():
+            meta = entry / "meta.json"
+            if entry.name.startswith(".") or not meta.exists():
+                continue
+            size = sum(file.stat().st_size for file in entry.iterdir())
+            entries.append((entry, meta.stat().st_mtime, size))
+        return entries
+
+    def evict(self) -> List[str]:
+        """Drop expired entries, then least recently used ones over max_bytes."""
+        entries = sorted(self.entries(), key=lambda entry: entry[1])
+        cutoff = time.time() - self.max_age_days * 86400
+        total = sum(size for _, _, size in entries)
+        removed = []
+        for entry, last_used, size in entries:
+            if last_used >= cutoff and total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            removed.append(entry.name)
+        return removed
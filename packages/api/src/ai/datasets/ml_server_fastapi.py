@@ -9,10 +9,23 @@ Start with: uvicorn ml_server_fastapi:app --host 0.0.0.0 --port 8001
 """
 
 import sys
+import os
 import json
 import io
+import asyncio
+import hashlib
+import queue
+import random
+import shutil
+import subprocess
+import threading
+import uuid
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import time
 
 # Fix Windows console encoding
@@ -21,24 +34,272 @@ if sys.platform == 'win32':
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
 try:
-    from fastapi import FastAPI, HTTPException
+    from fastapi import FastAPI, HTTPException, Header
     from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.responses import JSONResponse
+    from starlette.datastructures import Headers, MutableHeaders
     from pydantic import BaseModel
     import joblib
     import numpy as np
     import pandas as pd
+    import xgboost as xgb
     import uvicorn
 except ImportError as e:
     print(f"❌ Missing required library: {e}", file=sys.stderr)
     print("📦 Install with: pip install fastapi uvicorn pydantic", file=sys.stderr)
     sys.exit(1)
 
+# Optional: zstd request/response bodies (gzip always works)
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Rule-based compatibility used to generate the synthetic training data,
+# reused as the degraded scorer when no model is available
+from build_ml_training_dataset import calculate_compatibility_batch, compatibility_to_probability
+from score_store import ScoreStore, file_id
+from dataset_io import default_dataset_path, histogram_bins, read_dataset
+
 # Global model cache (loaded once at startup)
 _model_cache = None
 _feature_names_cache = None
 _model_dir_cache = None
+_model_version_cache = None
 _load_time = None
 
+# Thread pool for CPU-bound model work so the event loop stays responsive
+INFERENCE_WORKERS = int(os.environ.get("ML_INFERENCE_WORKERS", os.cpu_count() or 1))
+_inference_executor = ThreadPoolExecutor(
+    max_workers=INFERENCE_WORKERS,
+    thread_name_prefix="ml-inference",
+)
+
+# After a failed model load, serve the rule-based fallback for this long
+# before trying to load the model again
+MODEL_RETRY_SECONDS = float(os.environ.get("ML_MODEL_RETRY_SECONDS", 30))
+_model_failed_at = {}
+
+# Maximum number of per-row explanations kept in memory
+EXPLAIN_CACHE_SIZE = int(os.environ.get("ML_EXPLAIN_CACHE_SIZE", 50000))
+
+# Optional shadow (candidate) model scored off the request path
+SHADOW_MODEL_DIR = os.environ.get("ML_SHADOW_MODEL_DIR")
+SHADOW_SAMPLE_RATE = float(os.environ.get("ML_SHADOW_SAMPLE_RATE", 0.1))
+SHADOW_QUEUE_SIZE = int(os.environ.get("ML_SHADOW_QUEUE_SIZE", 256))
+SHADOW_LOG_FILE = os.environ.get("ML_SHADOW_LOG_FILE", "logs/shadow_scores.jsonl")
+_shadow = None
+_shadow_log = None
+
+# Served predictions, logged as [ML_MATCH_EVENT] lines for the training
+# feedback loop (set ML_PREDICTION_LOG_FILE="" to disable)
+PREDICTION_LOG_FILE = os.environ.get("ML_PREDICTION_LOG_FILE", "logs/predictions.jsonl")
+PREDICTION_LOG_SAMPLE_RATE = float(os.environ.get("ML_PREDICTION_LOG_SAMPLE_RATE", 1.0))
+PREDICTION_LOG_QUEUE_SIZE = int(os.environ.get("ML_PREDICTION_LOG_QUEUE_SIZE", 1024))
+LOG_MAX_BYTES = int(os.environ.get("ML_LOG_MAX_BYTES", 100 * 1024 * 1024))
+LOG_ROTATE_SECONDS = float(os.environ.get("ML_LOG_ROTATE_SECONDS", 3600))
+# Rotated logs kept per writer: the newest LOG_MAX_FILES, none older than
+# LOG_MAX_AGE_DAYS (0 disables either limit)
+LOG_MAX_FILES = int(os.environ.get("ML_LOG_MAX_FILES", 168))
+LOG_MAX_AGE_DAYS = float(os.environ.get("ML_LOG_MAX_AGE_DAYS", 7))
+_prediction_log = None
+
+# Live feature histograms compared against the training reference
+DRIFT_INTERVAL_SECONDS = float(os.environ.get("ML_DRIFT_INTERVAL_SECONDS", 300))
+DRIFT_MIN_ROWS = int(os.environ.get("ML_DRIFT_MIN_ROWS", 1000))
+_drift_monitor = None
+
+# Warm-state snapshot (explanation cache + drift window), restored on
+# startup when the model version matches
+SNAPSHOT_FILE = os.environ.get("ML_SNAPSHOT_FILE", "cache/warm_snapshot.npz")
+SNAPSHOT_INTERVAL_SECONDS = float(os.environ.get("ML_SNAPSHOT_INTERVAL_SECONDS", 600))
+
+# Precomputed top-K candidates (precompute_top_k.py), memory-mapped and
+# re-mapped when the file is replaced
+SCORE_STORE_FILE = os.environ.get("ML_SCORE_STORE_FILE", "scores/top_k_scores.bin")
+SCORE_STORE_CHECK_SECONDS = float(os.environ.get("ML_SCORE_STORE_CHECK_SECONDS", 30))
+_score_store = None
+
+# Admin retrain-and-swap jobs (admin endpoints are disabled without a token)
+ADMIN_TOKEN = os.environ.get("ML_ADMIN_TOKEN")
+TRAIN_SCRIPT = Path(__file__).with_name("train_model.py")
+MODEL_FILES = [
+    "match_compatibility_model.pkl",
+    "model_features.json",
+    "model_metadata.json",
+    "feature_histograms.json",
+]
+_retrain_jobs = {}
+
+# Strong references to fire-and-forget asyncio tasks
+_background_tasks = set()
+
+# Compressed bodies on the batch endpoints
+COMPRESSED_PATHS = {"/predict/batch", "/explain/batch"}
+MAX_DECOMPRESSED_BYTES = int(os.environ.get("ML_MAX_DECOMPRESSED_BYTES", 32 * 1024 * 1024))
+MIN_COMPRESSED_RESPONSE_BYTES = 1024
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware for gzip/zstd request and response bodies.
+
+    Compressed request bodies (Content-Encoding) are decompressed chunk by
+    chunk as the body streams in, and rejected with 413 as soon as the
+    output passes max_body_bytes - so a decompression bomb never gets
+    fully inflated. Responses are compressed with the best encoding the
+    client lists in Accept-Encoding (zstd, then gzip).
+    """
+
+    # zstd has no output limit per call, so input is fed in small slices to
+    # bound how far a single call can overshoot the cap
+    ZSTD_INPUT_SLICE = 256
+
+    def __init__(self, app, paths: set, max_body_bytes: int, min_response_bytes: int = MIN_COMPRESSED_RESPONSE_BYTES):
+        self.app = app
+        self.paths = paths
+        self.max_body_bytes = max_body_bytes
+        self.min_response_bytes = min_response_bytes
+        self.request_encodings = {"gzip", "zstd"} if zstandard else {"gzip"}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        
+        headers = Headers(scope=scope)
+        content_encoding = headers.get("content-encoding", "identity").strip().lower()
+        if content_encoding not in self.request_encodings | {"identity"}:
+            response = JSONResponse(
+                {"success": False, "error": f"Unsupported Content-Encoding: {content_encoding}"},
+                status_code=415,
+            )
+            await response(scope, receive, send)
+            return
+        
+        if content_encoding != "identity":
+            receive = self._decompressing_receive(receive, content_encoding)
+        response_encoding = self._negotiate(headers.get("accept-encoding", ""))
+        if response_encoding:
+            send = self._compressing_send(send, response_encoding)
+        await self.app(scope, receive, send)
+
+    def _negotiate(self, accept_encoding: str) -> Optional[str]:
+        accepted = set()
+        for token in accept_encoding.split(","):
+            name, _, params = token.strip().partition(";")
+            if params.strip().replace(" ", "") in ("q=0", "q=0.0"):
+                continue
+            accepted.add(name.strip().lower())
+        if zstandard and "zstd" in accepted:
+            return "zstd"
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+    def _decompressing_receive(self, receive, encoding: str):
+        if encoding == "gzip":
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            decompressor = zstandard.ZstdDecompressor().decompressobj()
+        total = 0
+        
+        def inflate(data: bytes) -> bytes:
+            nonlocal total
+            limit = self.max_body_bytes - total + 1
+            if encoding == "gzip":
+                out = decompressor.decompress(data, limit)
+            else:
+                parts = []
+                for start in range(0, len(data), self.ZSTD_INPUT_SLICE):
+                    parts.append(decompressor.decompress(data[start:start + self.ZSTD_INPUT_SLICE]))
+                    if sum(map(len, parts)) >= limit:
+                        break
+                out = b"".join(parts)
+            total += len(out)
+            if total > self.max_body_bytes:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Decompressed body exceeds {self.max_body_bytes} bytes",
+                )
+            return out
+        
+        async def wrapped_receive():
+            message = await receive()
+            if message["type"] != "http.request":
+                return message
+            try:
+                body = inflate(message.get("body", b""))
+                if not message.get("more_body", False) and encoding == "gzip":
+                    body += decompressor.flush()
+                    if not decompressor.eof:
+                        raise ValueError("truncated gzip stream")
+            except HTTPException:
+                raise
+            except Exception as e:
+                raise HTTPException(status_code=400, detail=f"Invalid {encoding} body: {e}")
+            return {**message, "body": body}
+        
+        return wrapped_receive
+
+    def _compressing_send(self, send, encoding: str):
+        start_message = None
+        compressor = None
+        
+        def new_compressor():
+            if encoding == "gzip":
+                return zlib.compressobj(3, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            return zstandard.ZstdCompressor(level=3).compressobj()
+        
+        async def wrapped_send(message):
+            nonlocal start_message, compressor
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            
+            if start_message is not None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                small = not more_body and len(body) < self.min_response_bytes
+                if small or "content-encoding" in headers:
+                    await send(start_message)
+                    start_message = None
+                    await send(message)
+                    return
+                
+                compressor = new_compressor()
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    body = compressor.compress(body) + compressor.flush()
+                    headers["Content-Length"] = str(len(body))
+                    await send(start_message)
+                    start_message = None
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(start_message)
+                start_message = None
+            
+            if compressor is None:
+                await send(message)
+                return
+            
+            # Streaming response: compress chunk by chunk
+            data = compressor.compress(body)
+            if not more_body:
+                data += compressor.flush()
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+        
+        return wrapped_send
+
+
 app = FastAPI(title="ML Match Compatibility Server", version="1.0.0")
 
 # Enable CORS for Next.js backend
@@ -50,6 +311,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(
+    CompressionMiddleware,
+    paths=COMPRESSED_PATHS,
+    max_body_bytes=MAX_DECOMPRESSED_BYTES,
+)
+
 
 class PredictionRequest(BaseModel):
     """Single prediction request."""
@@ -70,6 +337,7 @@ class PredictionResponse(BaseModel):
     prediction: int = None
     score: float = None
     error: str = None
+    fallback: bool = False
 
 
 class BatchPredictionResponse(BaseModel):
@@ -77,16 +345,430 @@ class BatchPredictionResponse(BaseModel):
     success: bool
     results: List[PredictionResponse] = None
     error: str = None
+    fallback: bool = False
 
 
-def load_model(model_dir: str = "models"):
-    """Load the trained model and feature names (cached globally)."""
-    global _model_cache, _feature_names_cache, _model_dir_cache, _load_time
+class ExplainBatchRequest(BaseModel):
+    """Batch explanation request (per-feature contributions)."""
+    features_list: List[Dict[str, Any]]
+    model_dir: str = "models"
+    top_n: Optional[int] = None
+
+
+class Explanation(BaseModel):
+    """Per-feature contributions for one candidate, in log-odds space."""
+    score: float
+    bias: float
+    contributions: Dict[str, float]
+
+
+class ExplainBatchResponse(BaseModel):
+    """Batch explanation response."""
+    success: bool
+    model_version: str = None
+    results: List[Explanation] = None
+    error: str = None
+
+
+class ScoresResponse(BaseModel):
+    user_id: str
+    model_version: Optional[str] = None
+    candidates: List[str]
+    scores: List[float]
+
+
+class RetrainRequest(BaseModel):
+    """Retrain job request (field names predate Parquet; CSV paths still work)."""
+    train_csv: str = default_dataset_path("train")
+    val_csv: str = default_dataset_path("val")
+    model_dir: str = "models"
+    # Candidate must reach the current model's validation AUC plus this
+    min_auc_delta: float = 0.0
+
+
+class LRUCache:
+    """Small thread-safe LRU cache shared by the inference threads."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+    def items(self) -> list:
+        """Entries from least to most recently used."""
+        with self._lock:
+            return list(self._data.items())
+
+
+_explain_cache = LRUCache(EXPLAIN_CACHE_SIZE)
+
+
+class BackgroundJsonlWriter:
+    """
+    Append-only JSONL log written by a daemon thread.
+
+    submit() never blocks: items are sampled at `sample_rate`, then go into
+    a bounded queue and are dropped (and counted) when it is full. The
+    thread drains the queue in batches, turns each item into records with
+    `transform` and writes them with a single write call per batch. The
+    file is rotated to a timestamped name once it reaches `max_bytes` or
+    is older than `rotate_seconds`; each rotation then deletes rotated
+    files beyond the newest `max_files` or older than `max_age_days`.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        transform,
+        max_queue: int,
+        batch_size: int = 256,
+        sample_rate: float = 1.0,
+        line_prefix: str = "",
+        max_bytes: int = 0,
+        rotate_seconds: float = 0,
+        max_files: int = 0,
+        max_age_days: float = 0,
+    ):
+        self.path = Path(path)
+        self.transform = transform
+        self.batch_size = batch_size
+        self.sample_rate = sample_rate
+        self.line_prefix = line_prefix
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.max_files = max_files
+        self.max_age_days = max_age_days
+        self.submitted = 0
+        self.sampled_out = 0
+        self.dropped = 0
+        self.written = 0
+        self.rotations = 0
+        self.pruned = 0
+        self.errors = 0
+        self._file = None
+        self._opened_at = None
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name=f"jsonl-{self.path.stem}", daemon=True)
+        self._thread.start()
+
+    def submit(self, item) -> bool:
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self.sampled_out += 1
+            return False
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.submitted += 1
+        return True
+
+    def close(self, timeout: float = 5.0):
+        """Flush what is queued and stop the writer thread."""
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {
+            "path": str(self.path),
+            "sample_rate": self.sample_rate,
+            "queued": self._queue.qsize(),
+            "submitted": self.submitted,
+            "sampled_out": self.sampled_out,
+            "dropped": self.dropped,
+            "written": self.written,
+            "rotations": self.rotations,
+            "pruned": self.pruned,
+            "errors": self.errors,
+        }
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                stopping = True
+                batch = [item for item in batch if item is not None]
+            
+            try:
+                lines = []
+                for item in batch:
+                    lines.extend(self.line_prefix + json.dumps(record) for record in self.transform(item))
+                if lines:
+                    self._write(lines)
+            except Exception as e:
+                self.errors += 1
+                print(f"[ML Server] ⚠️  Failed to write {self.path}: {e}", file=sys.stderr)
+        
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, lines: List[str]):
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+            self._opened_at = time.time()
+        
+        self._file.write("\n".join(lines) + "\n")
+        self._file.flush()
+        self.written += len(lines)
+        
+        too_big = self.max_bytes and self._file.tell() >= self.max_bytes
+        too_old = self.rotate_seconds and time.time() - self._opened_at >= self.rotate_seconds
+        if too_big or too_old:
+            self._rotate()
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        target = self.path.with_name(f"{self.path.stem}.{stamp}{self.path.suffix}")
+        counter = 1
+        while target.exists():
+            target = self.path.with_name(f"{self.path.stem}.{stamp}-{counter}{self.path.suffix}")
+            counter += 1
+        os.replace(self.path, target)
+        self.rotations += 1
+        self._prune()
+
+    def _prune(self):
+        """Delete rotated files over the max_files / max_age_days limits."""
+        if not self.max_files and not self.max_age_days:
+            return
+        rotated = sorted(
+            ((f.stat().st_mtime, f) for f in self.path.parent.glob(f"{self.path.stem}.*{self.path.suffix}")),
+            reverse=True,
+        )
+        cutoff = time.time() - self.max_age_days * 86400
+        for i, (mtime, f) in enumerate(rotated):
+            if (self.max_files and i >= self.max_files) or (self.max_age_days and mtime < cutoff):
+                try:
+                    f.unlink()
+                    self.pruned += 1
+                except OSError as e:
+                    print(f"[ML Server] ⚠️  Failed to delete {f}: {e}", file=sys.stderr)
+
+
+class DriftMonitor:
+    """
+    Streaming feature-drift monitor.
+
+    Keeps fixed-bin histograms of every served feature in one preallocated
+    (n_features, bins) array, updated with a single bincount per batch.
+    compare() scores the current window against the reference histograms
+    saved by train_model.py (PSI and KL divergence) and starts a new window.
+    """
+
+    EPSILON = 1e-4
+
+    def __init__(self, feature_names: list, reference: Optional[dict] = None):
+        self.feature_names = list(feature_names)
+        self.bins = reference['bins'] if reference else 10
+        self.low, self.high = reference['range'] if reference else (0.0, 1.0)
+        self.reference = None
+        if reference:
+            self.reference = np.array(
+                [reference['histograms'].get(name, [0] * self.bins) for name in self.feature_names],
+                dtype=np.float64,
+            )
+        
+        n_features = len(self.feature_names)
+        self.counts = np.zeros((n_features, self.bins), dtype=np.int64)
+        self.window_rows = 0
+        self._offsets = np.arange(n_features, dtype=np.int64) * self.bins
+        self._lock = threading.Lock()
+        self.last_result = None
+
+    def update(self, matrix: np.ndarray):
+        """Add a featurized batch (rows in feature_names order) to the window."""
+        bin_idx = histogram_bins(matrix, self.bins, (self.low, self.high))
+        counts = np.bincount((bin_idx + self._offsets).ravel(), minlength=self.counts.size)
+        with self._lock:
+            self.counts += counts.reshape(self.counts.shape)
+            self.window_rows += len(matrix)
+
+    def compare(self, min_rows: int = 1):
+        """Score the current window against the reference and reset it."""
+        with self._lock:
+            if self.reference is None or self.window_rows < min_rows:
+                return self.last_result
+            live = self.counts.astype(np.float64)
+            window_rows = self.window_rows
+            self.counts[:] = 0
+            self.window_rows = 0
+        
+        live_p = self._normalize(live)
+        reference_p = self._normalize(self.reference)
+        log_ratio = np.log(live_p / reference_p)
+        psi = ((live_p - reference_p) * log_ratio).sum(axis=1)
+        kl = (live_p * log_ratio).sum(axis=1)
+        
+        self.last_result = {
+            "compared_at": int(time.time() * 1000),
+            "window_rows": window_rows,
+            "max_psi": float(psi.max()) if len(psi) else 0.0,
+            "features": {
+                name: {"psi": float(psi[i]), "kl": float(kl[i])}
+                for i, name in enumerate(self.feature_names)
+            },
+        }
+        return self.last_result
+
+    def snapshot(self) -> tuple:
+        with self._lock:
+            return self.counts.copy(), self.window_rows
+
+    def restore(self, counts: np.ndarray, window_rows: int):
+        with self._lock:
+            if counts.shape == self.counts.shape:
+                self.counts[:] = counts
+                self.window_rows = int(window_rows)
+
+    def _normalize(self, counts: np.ndarray) -> np.ndarray:
+        # Smooth empty bins so PSI/KL stay finite
+        smoothed = counts + self.EPSILON
+        return smoothed / smoothed.sum(axis=1, keepdims=True)
+
+    def stats(self) -> dict:
+        return {
+            "has_reference": self.reference is not None,
+            "window_rows": self.window_rows,
+            "last": self.last_result,
+        }
+
+
+def read_feature_histograms(model_dir: str) -> Optional[dict]:
+    """Read the reference histograms saved with the model (if any)."""
+    histograms_path = Path(model_dir) / "feature_histograms.json"
+    if not histograms_path.exists():
+        return None
+    with open(histograms_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_snapshot(path: str = SNAPSHOT_FILE) -> bool:
+    """
+    Write the warm state for the current model to a compact .npz file.
+
+    Explanation rows are stored as a (n, n_features) float32 key matrix and
+    a (n, n_features + 1) float32 value matrix, tagged with the model
+    version and feature names. The file is replaced atomically.
+    """
+    model_version = _model_version_cache
+    feature_names = _feature_names_cache
+    if model_version is None:
+        return False
     
-    # Return cached model if already loaded for this directory
-    if _model_cache is not None and _model_dir_cache == model_dir:
-        return _model_cache, _feature_names_cache
+    n_features = len(feature_names)
+    entries = [(key[1], value) for key, value in _explain_cache.items() if key[0] == model_version]
+    keys = np.frombuffer(b"".join(k for k, _ in entries), dtype=np.float32).reshape(-1, n_features)
+    values = np.array([v for _, v in entries], dtype=np.float32).reshape(-1, n_features + 1)
+    
+    drift_counts, drift_rows = (
+        _drift_monitor.snapshot() if _drift_monitor is not None else (np.zeros((0, 0), dtype=np.int64), 0)
+    )
     
+    target = Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = target.with_name(target.name + ".tmp")
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(
+            f,
+            model_version=np.array(model_version),
+            feature_names=np.array(feature_names),
+            explain_keys=keys,
+            explain_values=values,
+            drift_counts=drift_counts,
+            drift_window_rows=np.array(drift_rows),
+        )
+    os.replace(tmp_path, target)
+    return True
+
+
+def restore_snapshot(path: str = SNAPSHOT_FILE) -> bool:
+    """Reload a snapshot written for the currently loaded model."""
+    if not path or _model_version_cache is None or not Path(path).exists():
+        return False
+    
+    with np.load(path) as snapshot:
+        if str(snapshot["model_version"]) != _model_version_cache:
+            print(f"[ML Server] Snapshot is for model {snapshot['model_version']}, not restoring", file=sys.stderr)
+            return False
+        if list(snapshot["feature_names"]) != list(_feature_names_cache):
+            return False
+        
+        keys = snapshot["explain_keys"]
+        values = snapshot["explain_values"]
+        for key_row, value_row in zip(keys, values):
+            _explain_cache.put((_model_version_cache, key_row.tobytes()), value_row)
+        
+        if _drift_monitor is not None:
+            _drift_monitor.restore(snapshot["drift_counts"], snapshot["drift_window_rows"])
+    
+    print(f"[ML Server] Restored warm snapshot ({len(keys)} cached explanations)", file=sys.stderr)
+    return True
+
+
+def refresh_score_store(path: str = SCORE_STORE_FILE) -> bool:
+    """
+    Map the score store if it is new or has been replaced on disk.
+
+    The previous mapping is only dropped, not closed: lookups that are in
+    flight keep it alive, and the renamed-over file stays readable.
+    """
+    global _score_store
+    current = file_id(path) if path else None
+    if current is None or (_score_store is not None and _score_store.file_id == current):
+        return False
+    store = ScoreStore(path)
+    _score_store = store
+    print(
+        f"[ML Server] ✅ Score store mapped: {path} ({store.n_users:,} users, model {store.model_version})",
+        file=sys.stderr
+    )
+    return True
+
+
+def read_model_files(model_dir: str):
+    """
+    Read a model directory.
+
+    Returns:
+        Tuple of (model, feature_names, model_version); the version is a
+        content hash of the model file
+    """
     model_path = Path(model_dir) / "match_compatibility_model.pkl"
     features_path = Path(model_dir) / "model_features.json"
     
@@ -95,30 +777,129 @@ def load_model(model_dir: str = "models"):
     if not features_path.exists():
         raise FileNotFoundError(f"Features file not found: {features_path}")
     
-    print(f"[ML Server] Loading model from {model_path}...", file=sys.stderr)
-    start_time = time.time()
-    _model_cache = joblib.load(model_path)
-    _load_time = time.time() - start_time
-    print(f"[ML Server] Model loaded in {_load_time:.2f}s", file=sys.stderr)
+    model_bytes = model_path.read_bytes()
+    model = joblib.load(io.BytesIO(model_bytes))
+    model_version = hashlib.sha256(model_bytes).hexdigest()[:12]
     
     with open(features_path, 'r', encoding='utf-8') as f:
         feature_data = json.load(f)
     
     # Handle both list and dict formats
     if isinstance(feature_data, list):
-        _feature_names_cache = feature_data
+        feature_names = feature_data
     elif isinstance(feature_data, dict) and 'features' in feature_data:
-        _feature_names_cache = feature_data['features']
+        feature_names = feature_data['features']
     elif isinstance(feature_data, dict) and 'value' in feature_data:
-        _feature_names_cache = feature_data['value']
+        feature_names = feature_data['value']
     else:
         raise ValueError(f"Unexpected feature names format: {type(feature_data)}")
     
+    return model, feature_names, model_version
+
+
+def read_model_bundle(model_dir: str) -> dict:
+    """
+    Read everything a model needs to serve (blocking; safe to run in an
+    executor): model, feature names, version and a fresh drift monitor.
+    """
+    model_path = Path(model_dir) / "match_compatibility_model.pkl"
+    
+    print(f"[ML Server] Loading model from {model_path}...", file=sys.stderr)
+    start_time = time.time()
+    model, feature_names, model_version = read_model_files(model_dir)
+    load_time = time.time() - start_time
+    print(f"[ML Server] Model loaded in {load_time:.2f}s", file=sys.stderr)
+    
+    reference = read_feature_histograms(model_dir)
+    if reference is None:
+        print(f"[ML Server] No feature_histograms.json - drift scores disabled", file=sys.stderr)
+    return {
+        "model": model,
+        "feature_names": feature_names,
+        "model_version": model_version,
+        "load_time": load_time,
+        "drift_monitor": DriftMonitor(feature_names, reference),
+    }
+
+
+def install_model(model_dir: str, bundle: dict):
+    """Make a read model bundle the served model (only swaps globals)."""
+    global _model_cache, _feature_names_cache, _model_dir_cache, _model_version_cache, _load_time
+    global _drift_monitor
+    
+    _model_cache = bundle["model"]
+    _feature_names_cache = bundle["feature_names"]
+    _model_version_cache = bundle["model_version"]
+    _load_time = bundle["load_time"]
+    _drift_monitor = bundle["drift_monitor"]
     _model_dir_cache = model_dir
     print(f"[ML Server] Ready for predictions (model cached)", file=sys.stderr)
+
+
+def load_model(model_dir: str = "models", force: bool = False):
+    """Load the trained model and feature names (cached globally)."""
+    # Return cached model if already loaded for this directory
+    if not force and _model_cache is not None and _model_dir_cache == model_dir:
+        return _model_cache, _feature_names_cache
+    
+    install_model(model_dir, read_model_bundle(model_dir))
     return _model_cache, _feature_names_cache
 
 
+def get_model_or_none(model_dir: str = "models"):
+    """
+    Load the model, or return None when it is unavailable.
+
+    Failures are remembered for MODEL_RETRY_SECONDS so that requests in
+    the meantime go straight to the fallback scorer instead of retrying
+    the load every time.
+    """
+    if model_retry_pending(model_dir):
+        return None
+    
+    try:
+        model_and_features = load_model(model_dir)
+    except Exception as e:
+        record_model_failure(model_dir, e)
+        return None
+    
+    _model_failed_at.pop(model_dir, None)
+    return model_and_features
+
+
+async def get_model_or_none_async(model_dir: str = "models"):
+    """
+    get_model_or_none for async endpoints: a cold load reads the model
+    files in the executor and only swaps the globals on the event loop.
+    """
+    if _model_cache is not None and _model_dir_cache == model_dir:
+        return _model_cache, _feature_names_cache
+    if model_retry_pending(model_dir):
+        return None
+    
+    loop = asyncio.get_running_loop()
+    try:
+        bundle = await loop.run_in_executor(None, read_model_bundle, model_dir)
+    except Exception as e:
+        record_model_failure(model_dir, e)
+        return None
+    
+    install_model(model_dir, bundle)
+    _model_failed_at.pop(model_dir, None)
+    return _model_cache, _feature_names_cache
+
+
+def model_retry_pending(model_dir: str) -> bool:
+    """True while a failed load of model_dir is within MODEL_RETRY_SECONDS."""
+    failed_at = _model_failed_at.get(model_dir)
+    return failed_at is not None and time.time() - failed_at < MODEL_RETRY_SECONDS
+
+
+def record_model_failure(model_dir: str, error: Exception):
+    _model_failed_at[model_dir] = time.time()
+    print(f"[ML Server] ⚠️  Model unavailable, using rule-based fallback: {error}", file=sys.stderr)
+
+
 def prepare_features(features_dict: dict, feature_names: list) -> pd.DataFrame:
     """Prepare features for prediction."""
     # Handle matchType encoding
@@ -144,11 +925,354 @@ def prepare_features(features_dict: dict, feature_names: list) -> pd.DataFrame:
     return df
 
 
+def build_feature_matrix(features_list: List[dict], feature_names: list) -> np.ndarray:
+    """
+    Prepare a whole batch of features as one float32 matrix.
+
+    Same semantics as prepare_features (matchType encoding, missing and
+    NaN values become 0), but written straight into a preallocated array.
+    """
+    column_index = {name: i for i, name in enumerate(feature_names)}
+    matrix = np.zeros((len(features_list), len(feature_names)), dtype=np.float32)
+    
+    for row, features_dict in enumerate(features_list):
+        for name, value in features_dict.items():
+            if name == 'matchType':
+                name = 'matchType_encoded'
+                value = 0 if value == 'user_user' else 1
+            col = column_index.get(name)
+            if col is not None and value is not None:
+                matrix[row, col] = value
+    
+    return np.nan_to_num(matrix, copy=False)
+
+
+def fallback_probabilities(features_list: List[dict]) -> np.ndarray:
+    """
+    Degraded scoring without a model: the hierarchical rule-based
+    compatibility from build_ml_training_dataset.py plus its sigmoid,
+    computed for the whole batch at once.
+    """
+    def column(name, alias=None):
+        values = [f.get(name, f.get(alias) if alias else None) for f in features_list]
+        return np.array(values, dtype=np.float64)
+    
+    # The backend sends distanceScore where the generator used destinationScore
+    columns = {
+        'destinationScore': column('destinationScore', 'distanceScore'),
+        'dateOverlapScore': column('dateOverlapScore'),
+        'budgetScore': column('budgetScore'),
+        'interestScore': column('interestScore'),
+        'personalityScore': column('personalityScore'),
+        'ageScore': column('ageScore'),
+        'groupSizeScore': column('groupSizeScore'),
+        'groupDiversityScore': column('groupDiversityScore'),
+    }
+    columns = {name: np.nan_to_num(values) for name, values in columns.items()}
+    
+    # Interaction features, derived per row when not sent
+    destination_interest = column('destination_interest')
+    date_budget = column('date_budget')
+    columns['destination_interest'] = np.where(
+        np.isnan(destination_interest),
+        columns['destinationScore'] * columns['interestScore'],
+        destination_interest,
+    )
+    columns['date_budget'] = np.where(
+        np.isnan(date_budget),
+        columns['dateOverlapScore'] * columns['budgetScore'],
+        date_budget,
+    )
+    columns['matchType'] = np.array([f.get('matchType') for f in features_list], dtype=object)
+    
+    return compatibility_to_probability(calculate_compatibility_batch(columns))
+
+
+def load_shadow_model(model_dir: str):
+    """Load the shadow model and start its background score log."""
+    global _shadow, _shadow_log
+    
+    model, feature_names, model_version = read_model_files(model_dir)
+    # One thread is plenty off the request path and leaves the cores to the primary
+    model.set_params(n_jobs=1)
+    _shadow = {
+        "model": model,
+        "feature_names": feature_names,
+        "model_version": model_version,
+    }
+    if _shadow_log is None:
+        _shadow_log = BackgroundJsonlWriter(
+            SHADOW_LOG_FILE,
+            score_shadow_job,
+            SHADOW_QUEUE_SIZE,
+            sample_rate=SHADOW_SAMPLE_RATE,
+            max_bytes=LOG_MAX_BYTES,
+            rotate_seconds=LOG_ROTATE_SECONDS,
+            max_files=LOG_MAX_FILES,
+            max_age_days=LOG_MAX_AGE_DAYS,
+        )
+    print(f"[ML Server] Shadow model {model_version} loaded from {model_dir}", file=sys.stderr)
+
+
+def submit_shadow_job(matrix: np.ndarray, feature_names: list, probabilities: np.ndarray):
+    """Queue an already-scored batch for the shadow model (sampled, never blocks)."""
+    if _shadow is None:
+        return
+    _shadow_log.submit({
+        "timestamp": int(time.time() * 1000),
+        "primary_version": _model_version_cache,
+        "matrix": matrix,
+        "feature_names": feature_names,
+        "probabilities": probabilities,
+    })
+
+
+def score_shadow_job(job: dict) -> List[dict]:
+    """Score a queued batch with the shadow model (runs on the log thread)."""
+    shadow = _shadow
+    matrix = job["matrix"]
+    
+    # Reuse the primary matrix, realigning columns if the feature sets differ
+    if shadow["feature_names"] != job["feature_names"]:
+        primary_index = {name: i for i, name in enumerate(job["feature_names"])}
+        aligned = np.zeros((len(matrix), len(shadow["feature_names"])), dtype=np.float32)
+        for col, name in enumerate(shadow["feature_names"]):
+            if name in primary_index:
+                aligned[:, col] = matrix[:, primary_index[name]]
+        matrix = aligned
+    
+    shadow_probabilities = shadow["model"].predict_proba(matrix)[:, 1]
+    return [
+        {
+            "timestamp": job["timestamp"],
+            "primary_version": job["primary_version"],
+            "shadow_version": shadow["model_version"],
+            "primary": round(float(primary), 6),
+            "shadow": round(float(candidate), 6),
+        }
+        for primary, candidate in zip(job["probabilities"], shadow_probabilities)
+    ]
+
+
+def submit_prediction_log(features_list: List[dict], probabilities: np.ndarray, fallback: bool):
+    """Queue served predictions for the prediction log (sampled, never blocks)."""
+    if _prediction_log is None:
+        return
+    _prediction_log.submit({
+        "timestamp": int(time.time() * 1000),
+        "model_version": "fallback" if fallback else _model_version_cache,
+        "features_list": features_list,
+        "probabilities": probabilities,
+    })
+
+
+def prediction_log_records(job: dict) -> List[dict]:
+    """
+    Turn a logged batch into match events in the shape parse_log_file reads.
+
+    There is no outcome yet - build_training_set skips these events until
+    they are joined with what the user actually did.
+    """
+    return [
+        {
+            "matchType": features.get("matchType"),
+            "features": features,
+            "score": round(float(probability), 6),
+            "modelVersion": job["model_version"],
+            "timestamp": job["timestamp"],
+            "source": "ml-server",
+        }
+        for features, probability in zip(job["features_list"], job["probabilities"])
+    ]
+
+
+def validation_auc(model, feature_names: list, val_csv: str) -> float:
+    """ROC-AUC of a model on a validation dataset (same featurization as serving)."""
+    from sklearn.metrics import roc_auc_score
+    
+    val_df = read_dataset(val_csv)
+    matrix = build_feature_matrix(val_df.to_dict('records'), feature_names)
+    return float(roc_auc_score(val_df['label'], model.predict_proba(matrix)[:, 1]))
+
+
+def run_training(job: dict, request: RetrainRequest):
+    """Train a candidate model in a low-priority subprocess (blocking)."""
+    candidate_dir = Path(job["candidate_dir"])
+    candidate_dir.mkdir(parents=True, exist_ok=True)
+    command = [
+        sys.executable, str(TRAIN_SCRIPT),
+        "--train-csv", request.train_csv,
+        "--val-csv", request.val_csv,
+        "--output-dir", str(candidate_dir),
+    ]
+    
+    # Below-normal priority so training never competes with serving. The
+    # server is multithreaded, so no preexec_fn: nice(1) wraps the command
+    kwargs = {}
+    if sys.platform == 'win32':
+        kwargs["creationflags"] = subprocess.BELOW_NORMAL_PRIORITY_CLASS
+    elif shutil.which("nice"):
+        command = ["nice", "-n", "10"] + command
+    
+    with open(candidate_dir / "train.log", 'w', encoding='utf-8') as log:
+        result = subprocess.run(command, stdout=log, stderr=subprocess.STDOUT, **kwargs)
+    if result.returncode != 0:
+        raise RuntimeError(f"train_model.py exited with code {result.returncode} (see {candidate_dir / 'train.log'})")
+
+
+def validate_candidate(job: dict, request: RetrainRequest) -> dict:
+    """Compare candidate and current model on the same validation set (blocking)."""
+    candidate, candidate_features, candidate_version = read_model_files(job["candidate_dir"])
+    metrics = {
+        "candidate_version": candidate_version,
+        "candidate_auc": validation_auc(candidate, candidate_features, request.val_csv),
+        "current_version": None,
+        "current_auc": None,
+    }
+    try:
+        current, current_features, current_version = read_model_files(request.model_dir)
+    except FileNotFoundError:
+        return metrics
+    metrics["current_version"] = current_version
+    metrics["current_auc"] = validation_auc(current, current_features, request.val_csv)
+    return metrics
+
+
+def promote_candidate(job: dict, request: RetrainRequest) -> str:
+    """
+    Back up the live model files and replace them with the candidate's
+    (blocking). Each file is copied next to its target and renamed over it.
+    """
+    live_dir = Path(request.model_dir)
+    candidate_dir = Path(job["candidate_dir"])
+    
+    existing = [name for name in MODEL_FILES if (live_dir / name).exists()]
+    backup_path = live_dir / "backups" / f"model_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    if existing:
+        backup_path.mkdir(parents=True, exist_ok=True)
+        for name in existing:
+            shutil.copy2(live_dir / name, backup_path / name)
+    
+    live_dir.mkdir(parents=True, exist_ok=True)
+    for name in MODEL_FILES:
+        if not (candidate_dir / name).exists():
+            continue
+        tmp_path = live_dir / f".{name}.tmp"
+        shutil.copy2(candidate_dir / name, tmp_path)
+        os.replace(tmp_path, live_dir / name)
+    
+    return str(backup_path) if existing else None
+
+
+async def retrain_job(job: dict, request: RetrainRequest):
+    """Train, validate and hot-swap a new model without blocking serving."""
+    loop = asyncio.get_running_loop()
+    start_time = time.time()
+    try:
+        job["status"] = "training"
+        await loop.run_in_executor(None, run_training, job, request)
+        
+        job["status"] = "validating"
+        metrics = await loop.run_in_executor(None, validate_candidate, job, request)
+        job["metrics"] = metrics
+        
+        current_auc = metrics["current_auc"]
+        if current_auc is not None and metrics["candidate_auc"] < current_auc + request.min_auc_delta:
+            job["status"] = "rejected"
+            return
+        
+        job["status"] = "swapping"
+        job["backup_dir"] = await loop.run_in_executor(None, promote_candidate, job, request)
+        # Read the new model in the executor, then swap the globals on the
+        # event loop thread: requests see either the old or the new model,
+        # never a mix of the two, and serving is not blocked while it loads
+        bundle = await loop.run_in_executor(None, read_model_bundle, request.model_dir)
+        install_model(request.model_dir, bundle)
+        _model_failed_at.pop(request.model_dir, None)
+        job["status"] = "swapped"
+        print(f"[ML Server] ✅ Model swapped to {_model_version_cache} (job {job['id']})", file=sys.stderr)
+    except Exception as e:
+        job["status"] = "failed"
+        job["error"] = str(e)
+        print(f"[ML Server] ❌ Retrain job {job['id']} failed: {e}", file=sys.stderr)
+    finally:
+        job["finished_at"] = datetime.now().isoformat()
+        job["duration_seconds"] = round(time.time() - start_time, 2)
+
+
+def start_background_task(coro):
+    """Run a coroutine in the background, keeping it referenced until done."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+def require_admin(token: Optional[str]):
+    """Admin endpoints need ML_ADMIN_TOKEN to be set and sent as X-Admin-Token."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ML_ADMIN_TOKEN not set)")
+    if token != ADMIN_TOKEN:
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+def _iteration_range(model) -> tuple:
+    """Trees used by predict_proba (honours early stopping)."""
+    best_iteration = getattr(model, 'best_iteration', None)
+    return (0, best_iteration + 1) if best_iteration is not None else (0, 0)
+
+
+def explain_matrix(model, feature_names: list, model_version: str, matrix: np.ndarray) -> np.ndarray:
+    """
+    Compute per-feature contributions (TreeSHAP) for every row of a matrix.
+
+    Rows already explained for this model version are served from the
+    cache; only the remaining rows go through the booster.
+
+    Returns:
+        Array of shape (n_rows, n_features + 1); the last column is the bias
+    """
+    contributions = np.empty((len(matrix), len(feature_names) + 1), dtype=np.float32)
+    keys = [(model_version, row.tobytes()) for row in matrix]
+    
+    missing = []
+    for i, key in enumerate(keys):
+        cached = _explain_cache.get(key)
+        if cached is None:
+            missing.append(i)
+        else:
+            contributions[i] = cached
+    
+    if missing:
+        dmatrix = xgb.DMatrix(matrix[missing], feature_names=feature_names)
+        computed = model.get_booster().predict(
+            dmatrix,
+            pred_contribs=True,
+            iteration_range=_iteration_range(model),
+        )
+        for i, row in zip(missing, computed):
+            contributions[i] = row
+            _explain_cache.put(keys[i], row)
+    
+    return contributions
+
+
 def predict_single(features_dict: dict, model_dir: str = "models") -> PredictionResponse:
     """Make a single prediction."""
     try:
         # Load model (cached after first call)
-        model, feature_names = load_model(model_dir)
+        model_and_features = get_model_or_none(model_dir)
+        if model_and_features is None:
+            probability = float(fallback_probabilities([features_dict])[0])
+            submit_prediction_log([features_dict], [probability], fallback=True)
+            return PredictionResponse(
+                success=True,
+                probability=probability,
+                prediction=int(probability > 0.5),
+                score=probability,
+                fallback=True
+            )
+        model, feature_names = model_and_features
         
         # Prepare features
         features_df = prepare_features(features_dict, feature_names)
@@ -156,6 +1280,7 @@ def predict_single(features_dict: dict, model_dir: str = "models") -> Prediction
         # Make prediction
         probability = model.predict_proba(features_df)[0, 1]
         prediction = model.predict(features_df)[0]
+        submit_prediction_log([features_dict], [probability], fallback=False)
         
         return PredictionResponse(
             success=True,
@@ -173,14 +1298,96 @@ def predict_single(features_dict: dict, model_dir: str = "models") -> Prediction
 @app.on_event("startup")
 async def startup_event():
     """Load model at server startup."""
+    global _prediction_log
     print("[ML Server] FastAPI server starting...", file=sys.stderr)
+    if PREDICTION_LOG_FILE:
+        _prediction_log = BackgroundJsonlWriter(
+            PREDICTION_LOG_FILE,
+            prediction_log_records,
+            PREDICTION_LOG_QUEUE_SIZE,
+            sample_rate=PREDICTION_LOG_SAMPLE_RATE,
+            line_prefix="[ML_MATCH_EVENT] ",
+            max_bytes=LOG_MAX_BYTES,
+            rotate_seconds=LOG_ROTATE_SECONDS,
+            max_files=LOG_MAX_FILES,
+            max_age_days=LOG_MAX_AGE_DAYS,
+        )
     try:
         # Pre-load model with default directory
         load_model("models")
         print("[ML Server] ✅ Server ready", file=sys.stderr)
+        try:
+            restore_snapshot()
+        except Exception as e:
+            print(f"[ML Server] ⚠️  Warning: Could not restore snapshot: {e}", file=sys.stderr)
     except Exception as e:
         print(f"[ML Server] ⚠️  Warning: Could not pre-load model: {e}", file=sys.stderr)
         print("[ML Server] Model will be loaded on first request", file=sys.stderr)
+    
+    if SHADOW_MODEL_DIR:
+        try:
+            load_shadow_model(SHADOW_MODEL_DIR)
+        except Exception as e:
+            print(f"[ML Server] ⚠️  Warning: Could not load shadow model: {e}", file=sys.stderr)
+    
+    if SCORE_STORE_FILE:
+        try:
+            refresh_score_store()
+        except Exception as e:
+            print(f"[ML Server] ⚠️  Warning: Could not map score store: {e}", file=sys.stderr)
+        start_background_task(score_store_loop())
+    
+    start_background_task(drift_loop())
+    if SNAPSHOT_FILE and SNAPSHOT_INTERVAL_SECONDS > 0:
+        start_background_task(snapshot_loop())
+
+
+async def snapshot_loop():
+    """Periodically write the warm-state snapshot off the event loop."""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL_SECONDS)
+        try:
+            await loop.run_in_executor(None, save_snapshot)
+        except Exception as e:
+            print(f"[ML Server] ⚠️  Warning: Could not write snapshot: {e}", file=sys.stderr)
+
+
+async def score_store_loop():
+    """Pick up a replaced score store file."""
+    while True:
+        await asyncio.sleep(SCORE_STORE_CHECK_SECONDS)
+        try:
+            refresh_score_store()
+        except Exception as e:
+            print(f"[ML Server] ⚠️  Warning: Could not map score store: {e}", file=sys.stderr)
+
+
+async def drift_loop():
+    """Periodically compare live feature histograms with the reference."""
+    while True:
+        await asyncio.sleep(DRIFT_INTERVAL_SECONDS)
+        monitor = _drift_monitor
+        if monitor is None:
+            continue
+        result = monitor.compare(DRIFT_MIN_ROWS)
+        if result and result["max_psi"] > 0.25:
+            print(f"[ML Server] ⚠️  Feature drift detected (max PSI {result['max_psi']:.3f})", file=sys.stderr)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Write the warm-state snapshot and flush background logs."""
+    if SNAPSHOT_FILE:
+        try:
+            if save_snapshot():
+                print(f"[ML Server] Warm snapshot saved to {SNAPSHOT_FILE}", file=sys.stderr)
+        except Exception as e:
+            print(f"[ML Server] ⚠️  Warning: Could not write snapshot: {e}", file=sys.stderr)
+    if _shadow_log is not None:
+        _shadow_log.close()
+    if _prediction_log is not None:
+        _prediction_log.close()
 
 
 @app.get("/health")
@@ -189,10 +1396,31 @@ async def health_check():
     return {
         "status": "healthy",
         "model_loaded": _model_cache is not None,
+        "model_version": _model_version_cache,
         "load_time_seconds": _load_time
     }
 
 
+@app.get("/metrics")
+async def metrics():
+    """Counters for the background parts of the server."""
+    return {
+        "model_version": _model_version_cache,
+        "explain_cache": {
+            "size": len(_explain_cache),
+            "hits": _explain_cache.hits,
+            "misses": _explain_cache.misses,
+        },
+        "shadow": {
+            "model_version": _shadow["model_version"] if _shadow else None,
+            "log": _shadow_log.stats() if _shadow_log else None,
+        },
+        "prediction_log": _prediction_log.stats() if _prediction_log else None,
+        "drift": _drift_monitor.stats() if _drift_monitor else None,
+        "score_store": _score_store.stats() if _score_store else None,
+    }
+
+
 @app.post("/predict", response_model=PredictionResponse)
 async def predict(request: PredictionRequest):
     """Single prediction endpoint."""
@@ -204,20 +1432,25 @@ async def predict_batch(request: BatchPredictionRequest):
     """Batch prediction endpoint - process multiple candidates at once."""
     try:
         # Load model (cached after first call)
-        model, feature_names = load_model(request.model_dir)
+        model_and_features = get_model_or_none(request.model_dir)
+        fallback = model_and_features is None
         
-        # Prepare all features
-        features_list = []
-        for features_dict in request.features_list:
-            features_df = prepare_features(features_dict, feature_names)
-            features_list.append(features_df)
+        if fallback:
+            probabilities = fallback_probabilities(request.features_list)
+        else:
+            model, feature_names = model_and_features
+            # Prepare all features as one matrix
+            matrix = build_feature_matrix(request.features_list, feature_names)
+            # Batch prediction (much faster than individual calls)
+            probabilities = model.predict_proba(matrix)[:, 1]
+            # Shadow model scores the same matrix on its own thread later
+            submit_shadow_job(matrix, feature_names, probabilities)
+            if _drift_monitor is not None:
+                _drift_monitor.update(matrix)
         
-        # Combine into single DataFrame for batch prediction
-        batch_df = pd.concat(features_list, ignore_index=True)
-        
-        # Batch prediction (much faster than individual calls)
-        probabilities = model.predict_proba(batch_df)[:, 1]
-        predictions = model.predict(batch_df)
+        # Binary prediction uses the same 0.5 threshold as model.predict
+        predictions = probabilities > 0.5
+        submit_prediction_log(request.features_list, probabilities, fallback)
         
         # Format results
         results = [
@@ -225,14 +1458,16 @@ async def predict_batch(request: BatchPredictionRequest):
                 success=True,
                 probability=float(prob),
                 prediction=int(pred),
-                score=float(prob)
+                score=float(prob),
+                fallback=fallback
             )
             for prob, pred in zip(probabilities, predictions)
         ]
         
         return BatchPredictionResponse(
             success=True,
-            results=results
+            results=results,
+            fallback=fallback
         )
     except Exception as e:
         return BatchPredictionResponse(
@@ -241,6 +1476,119 @@ async def predict_batch(request: BatchPredictionRequest):
         )
 
 
+@app.post("/explain/batch", response_model=ExplainBatchResponse)
+async def explain_batch(request: ExplainBatchRequest):
+    """
+    Explain a batch of candidates - per-feature contributions to the score.
+
+    Contributions are in log-odds space and sum (with the bias) to the
+    model's margin; use top_n to keep only the largest by magnitude.
+    Responds 503 while no model is available (there is no fallback to
+    explain).
+    """
+    model_and_features = await get_model_or_none_async(request.model_dir)
+    if model_and_features is None:
+        raise HTTPException(status_code=503, detail=f"Model unavailable: {request.model_dir}")
+    
+    try:
+        model, feature_names = model_and_features
+        model_version = _model_version_cache
+        matrix = build_feature_matrix(request.features_list, feature_names)
+        
+        loop = asyncio.get_running_loop()
+        contributions = await loop.run_in_executor(
+            _inference_executor,
+            explain_matrix, model, feature_names, model_version, matrix
+        )
+        
+        results = []
+        for row in contributions:
+            feature_contribs = row[:-1]
+            order = np.argsort(-np.abs(feature_contribs), kind='stable')
+            if request.top_n is not None:
+                order = order[:max(request.top_n, 0)]
+            margin = float(row.sum())
+            results.append(Explanation(
+                score=float(1.0 / (1.0 + np.exp(-margin))),
+                bias=float(row[-1]),
+                contributions={feature_names[i]: float(feature_contribs[i]) for i in order},
+            ))
+        
+        return ExplainBatchResponse(
+            success=True,
+            model_version=model_version,
+            results=results
+        )
+    except Exception as e:
+        return ExplainBatchResponse(
+            success=False,
+            error=str(e)
+        )
+
+
+@app.get("/scores/{user_id}", response_model=ScoresResponse)
+async def get_scores(user_id: str, limit: Optional[int] = None):
+    """Precomputed top candidates for a user, best first."""
+    store = _score_store
+    if store is None:
+        raise HTTPException(status_code=503, detail="No precomputed scores loaded")
+    
+    result = store.lookup(user_id, limit)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"No precomputed scores for user: {user_id}")
+    
+    candidate_ids, scores = result
+    return ScoresResponse(
+        user_id=user_id,
+        model_version=store.model_version,
+        candidates=[c.decode("utf-8") for c in candidate_ids.tolist()],
+        # float32 on disk; round so JSON does not show float32 noise
+        scores=np.round(scores.astype(np.float64), 6).tolist()
+    )
+
+
+@app.post("/admin/retrain")
+async def start_retrain(request: RetrainRequest, x_admin_token: Optional[str] = Header(None)):
+    """Start a background retrain-and-swap job (one at a time)."""
+    require_admin(x_admin_token)
+    running = [job for job in _retrain_jobs.values() if job["finished_at"] is None]
+    if running:
+        raise HTTPException(status_code=409, detail=f"Retrain job {running[0]['id']} is still running")
+    
+    job_id = uuid.uuid4().hex[:12]
+    job = {
+        "id": job_id,
+        "status": "queued",
+        "started_at": datetime.now().isoformat(),
+        "finished_at": None,
+        "duration_seconds": None,
+        "candidate_dir": str(Path(request.model_dir) / "candidates" / job_id),
+        "metrics": None,
+        "backup_dir": None,
+        "error": None,
+    }
+    _retrain_jobs[job_id] = job
+    start_background_task(retrain_job(job, request))
+    return job
+
+
+@app.get("/admin/retrain")
+async def list_retrain_jobs(x_admin_token: Optional[str] = Header(None)):
+    """All retrain jobs since the server started."""
+    require_admin(x_admin_token)
+    return list(_retrain_jobs.values())
+
+
+@app.get("/admin/retrain/{job_id}")
+async def get_retrain_job(job_id: str, x_admin_token: Optional[str] = Header(None)):
+    """Status, duration and validation metrics of a retrain job."""
+    require_admin(x_admin_token)
+    job = _retrain_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown retrain job: {job_id}")
+    return job
+
+
 if __name__ == "__main__":
     # Run with: python ml_server_fastapi.py
     uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+"""
+Precompute Top-K Candidate Scores per User
+
+Offline all-pairs scoring with the serving model, so that discovery can
+look up each user's best candidates instead of scoring them per request.
+
+This script:
+- Loads a snapshot of per-user attributes (JSONL, CSV or Parquet)
+- Computes user_user compatibility features for blocks of pairs
+  (vectorized port of extractCompatibilityFeatures in compatibility-features.ts)
+- Scores each block with the trained model
+- Keeps a bounded top-K per user, merging block by block
+- Writes a score store (see score_store.py) for the ML server
+
+Memory is O(users x K + block size), never O(users^2). User blocks are
+scored in parallel across a process pool.
+
+Usage:
+    python precompute_top_k.py users.jsonl --top-k 200 -o scores/top_k_scores.bin
+"""
+
+import sys
+import os
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import io
+
+# Fix Windows console encoding for emojis
+if sys.platform == 'win32':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+try:
+    import numpy as np
+    import pandas as pd
+except ImportError as e:
+    print(f"❌ Missing required library: {e}")
+    print("📦 Please install dependencies: pip install -r requirements.txt")
+    sys.exit(1)
+
+from predict import load_model
+from score_store import write_score_store
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+NEUTRAL_SCORE = 0.5
+EARTH_RADIUS_KM = 6371.0
+MS_PER_DAY = 1000 * 60 * 60 * 24
+
+PERSONALITIES = ['introvert', 'ambivert', 'extrovert']
+# Rows/cols: introvert, ambivert, extrovert, unknown value
+PERSONALITY_MATRIX = np.array([
+    [1.0, 0.7, 0.4, 0.0],
+    [0.7, 1.0, 0.7, 0.0],
+    [0.4, 0.7, 1.0, 0.0],
+    [0.0, 0.0, 0.0, 0.0],
+])
+
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+# ============================================================================
+# 1. USER SNAPSHOT
+# ============================================================================
+
+def load_user_snapshot(path: str) -> pd.DataFrame:
+    """
+    Load per-user attributes.
+
+    Records are shaped like a solo session (userId, destination {lat, lon},
+    startDate, endDate, budget, static_attributes {age, interests,
+    personality}); nested fields may also be given as flat columns
+    (destination.lat, static_attributes.age, ...).
+    """
+    suffix = Path(path).suffix.lower()
+    if suffix == '.csv':
+        df = pd.read_csv(path)
+    elif suffix in ('.parquet', '.pq'):
+        df = pd.read_parquet(path)
+    else:
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            df = pd.json_normalize([json.loads(line) for line in f if line.strip()])
+
+    if 'userId' not in df.columns:
+        raise ValueError("User snapshot needs a userId column")
+    return df
+
+
+def build_user_arrays(df: pd.DataFrame) -> dict:
+    """Convert the snapshot into the flat arrays used for pair scoring."""
+    def numeric(col):
+        if col not in df.columns:
+            return np.full(len(df), np.nan)
+        return pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64)
+
+    def date_ms(col):
+        if col not in df.columns:
+            return np.full(len(df), np.nan)
+        dates = pd.to_datetime(df[col], utc=True, errors='coerce')
+        ms = dates.astype('int64').to_numpy() / 1e6
+        return np.where(dates.isna().to_numpy(), np.nan, ms).astype(np.float64)
+
+    # Interests as bitsets over the snapshot's vocabulary
+    interests = df.get('static_attributes.interests', pd.Series([None] * len(df)))
+    interests = [
+        item if isinstance(item, (list, tuple, np.ndarray))
+        else (str(item).split(';') if isinstance(item, str) and item else [])
+        for item in interests
+    ]
+    vocabulary = {name: i for i, name in enumerate(sorted({x for item in interests for x in item}))}
+    n_words = max(1, (len(vocabulary) + 63) // 64)
+    interest_bits = np.zeros((len(df), n_words), dtype=np.uint64)
+    for row, item in enumerate(interests):
+        for name in set(item):
+            bit = vocabulary[name]
+            interest_bits[row, bit // 64] |= np.uint64(1) << np.uint64(bit % 64)
+
+    personality = df.get('static_attributes.personality', pd.Series([None] * len(df)))
+    personality_code = np.array([
+        PERSONALITIES.index(p) if p in PERSONALITIES else (-1 if not isinstance(p, str) or not p else 3)
+        for p in personality
+    ], dtype=np.int8)
+
+    return {
+        'lat': numeric('destination.lat'),
+        'lon': numeric('destination.lon'),
+        'start': date_ms('startDate'),
+        'end': date_ms('endDate'),
+        'budget': numeric('budget'),
+        'age': numeric('static_attributes.age'),
+        'interest_bits': interest_bits,
+        'interest_count': popcount64(interest_bits).sum(axis=1),
+        'personality': personality_code,
+    }
+
+
+# ============================================================================
+# 2. VECTORIZED PAIR FEATURES (user_user)
+# ============================================================================
+
+def popcount64(x: np.ndarray) -> np.ndarray:
+    """Number of set bits per uint64 element."""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(x).astype(np.int64)
+    counts = _POPCOUNT_TABLE[np.ascontiguousarray(x).view(np.uint8)]
+    return counts.reshape(*x.shape, 8).sum(axis=-1, dtype=np.int64)
+
+
+def _take(arrays: dict, idx: slice) -> dict:
+    return {name: values[idx] for name, values in arrays.items()}
+
+
+def distance_score(u: dict, c: dict) -> np.ndarray:
+    lat1 = np.radians(u['lat'])[:, None]
+    lat2 = np.radians(c['lat'])[None, :]
+    d_lat = lat2 - lat1
+    d_lon = np.radians(c['lon'])[None, :] - np.radians(u['lon'])[:, None]
+    h = np.sin(d_lat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(d_lon / 2) ** 2
+    d = EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(h), np.sqrt(1 - h))
+
+    score = np.select(
+        [d <= 25, d <= 50, d <= 100, d <= 150, d <= 200],
+        [1.0, 0.95, 0.85, 0.75, 0.6],
+        default=0.0
+    )
+    return np.where(np.isnan(d), NEUTRAL_SCORE, score)
+
+
+def date_overlap_score(u: dict, c: dict) -> np.ndarray:
+    s_a, e_a = u['start'][:, None], u['end'][:, None]
+    s_b, e_b = c['start'][None, :], c['end'][None, :]
+
+    overlap_ms = np.maximum(0, np.minimum(e_a, e_b) - np.maximum(s_a, s_b))
+    denom = np.maximum(e_a - s_a, e_b - s_b)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = overlap_ms / denom
+
+    score = np.select(
+        [ratio >= 0.8, ratio >= 0.5, ratio >= 0.3, ratio >= 0.2, ratio >= 0.1],
+        [1.0, 0.9, 0.8, 0.6, 0.3],
+        default=0.1
+    )
+    invalid = np.isnan(overlap_ms) | (overlap_ms / MS_PER_DAY < 1) | ~(denom > 0)
+    return np.where(invalid, 0.0, score)
+
+
+def budget_score(u: dict, c: dict) -> np.ndarray:
+    a, b = u['budget'][:, None], c['budget'][None, :]
+    max_budget = np.maximum(a, b)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.abs(a - b) / max_budget
+
+    score = np.select(
+        [ratio <= 0.1, ratio <= 0.25, ratio <= 0.5, ratio <= 1.0, ratio <= 2.0],
+        [1.0, 0.8, 0.6, 0.4, 0.2],
+        default=0.1
+    )
+    score = np.where(max_budget == 0, 1.0, score)
+    return np.where(np.isnan(a) | np.isnan(b), NEUTRAL_SCORE, score)
+
+
+def interest_score(u: dict, c: dict) -> np.ndarray:
+    common = popcount64(u['interest_bits'][:, None, :] & c['interest_bits'][None, :, :]).sum(axis=-1)
+    union = u['interest_count'][:, None] + c['interest_count'][None, :] - common
+    with np.errstate(divide='ignore', invalid='ignore'):
+        score = common / union
+    # Solo matching adds a bonus for any shared interest
+    score = np.where(common > 0, np.minimum(1.0, score + 0.2), score)
+    empty = (u['interest_count'][:, None] == 0) | (c['interest_count'][None, :] == 0)
+    return np.where(empty, NEUTRAL_SCORE, score)
+
+
+def age_score(u: dict, c: dict) -> np.ndarray:
+    diff = np.abs(u['age'][:, None] - c['age'][None, :])
+    score = np.select(
+        [diff <= 2, diff <= 5, diff <= 10, diff <= 15, diff <= 25, diff <= 40],
+        [1.0, 0.9, 0.7, 0.5, 0.3, 0.1],
+        default=0.05
+    )
+    return np.where(np.isnan(diff), NEUTRAL_SCORE, score)
+
+
+def personality_score(u: dict, c: dict) -> np.ndarray:
+    a, b = u['personality'][:, None], c['personality'][None, :]
+    score = PERSONALITY_MATRIX[np.maximum(a, 0), np.maximum(b, 0)]
+    return np.where((a < 0) | (b < 0), NEUTRAL_SCORE, score)
+
+
+FEATURE_FUNCTIONS = {
+    'distanceScore': distance_score,
+    'dateOverlapScore': date_overlap_score,
+    'budgetScore': budget_score,
+    'interestScore': interest_score,
+    'ageScore': age_score,
+    'personalityScore': personality_score,
+}
+
+
+def pair_feature_matrix(u: dict, c: dict, feature_names: list) -> np.ndarray:
+    """
+    Feature matrix for every (user, candidate) pair of two blocks, rows in
+    user-major order. Features the extractor does not produce are 0, as in
+    the serving payload (languageScore, lifestyleScore, backgroundScore).
+    """
+    n_users, n_candidates = len(u['lat']), len(c['lat'])
+    matrix = np.zeros((n_users * n_candidates, len(feature_names)), dtype=np.float32)
+
+    computed = {}
+    def feature(name):
+        if name not in computed:
+            computed[name] = np.clip(FEATURE_FUNCTIONS[name](u, c), 0, 1)
+        return computed[name]
+
+    for col, name in enumerate(feature_names):
+        if name in FEATURE_FUNCTIONS:
+            values = feature(name)
+        elif name == 'destination_interest':
+            values = feature('distanceScore') * feature('interestScore')
+        elif name == 'date_budget':
+            values = feature('dateOverlapScore') * feature('budgetScore')
+        else:
+            # matchType_encoded is 0 for user_user
+            continue
+        matrix[:, col] = values.ravel()
+
+    return matrix
+
+
+# ============================================================================
+# 3. BLOCKED TOP-K SCORING
+# ============================================================================
+
+# Per-process state (set once by the pool initializer)
+_worker_model = None
+_worker_feature_names = None
+_worker_users = None
+
+
+def _init_worker(model_dir: str, users: dict, threads: int):
+    global _worker_model, _worker_feature_names, _worker_users
+    _worker_model, _worker_feature_names = load_model(model_dir)
+    _worker_model.set_params(n_jobs=threads)
+    _worker_users = users
+
+
+def score_user_block(start: int, stop: int, top_k: int, candidate_block: int) -> tuple:
+    """
+    Top-K candidates for users [start, stop) against all users.
+
+    Each candidate block is scored and merged into a running (users, K)
+    table with argpartition - a vectorized bounded heap per user.
+    """
+    users = _worker_users
+    n_total = len(users['lat'])
+    block_users = _take(users, slice(start, stop))
+    n_users = stop - start
+
+    best_scores = np.full((n_users, top_k), -np.inf, dtype=np.float32)
+    best_idx = np.full((n_users, top_k), -1, dtype=np.int32)
+    user_idx = np.arange(start, stop)[:, None]
+
+    for c_start in range(0, n_total, candidate_block):
+        c_stop = min(c_start + candidate_block, n_total)
+        matrix = pair_feature_matrix(block_users, _take(users, slice(c_start, c_stop)), _worker_feature_names)
+        scores = _worker_model.predict_proba(matrix)[:, 1].astype(np.float32).reshape(n_users, -1)
+
+        candidate_idx = np.broadcast_to(np.arange(c_start, c_stop, dtype=np.int32), scores.shape)
+        # A user is never their own candidate
+        scores[candidate_idx == user_idx] = -np.inf
+
+        merged_scores = np.concatenate([best_scores, scores], axis=1)
+        merged_idx = np.concatenate([best_idx, candidate_idx], axis=1)
+        keep = np.argpartition(-merged_scores, top_k - 1, axis=1)[:, :top_k]
+        best_scores = np.take_along_axis(merged_scores, keep, axis=1)
+        best_idx = np.take_along_axis(merged_idx, keep, axis=1)
+
+    # Best first; padding (fewer than K candidates) marked with index -1
+    order = np.argsort(-best_scores, axis=1, kind='stable')
+    best_scores = np.take_along_axis(best_scores, order, axis=1)
+    best_idx = np.take_along_axis(best_idx, order, axis=1)
+    best_idx[np.isneginf(best_scores)] = -1
+    best_scores[np.isneginf(best_scores)] = 0
+    return start, best_idx, best_scores
+
+
+def precompute_top_k(
+    users_df: pd.DataFrame,
+    model_dir: str = "models",
+    top_k: int = 200,
+    user_block: int = 256,
+    candidate_block: int = 2048,
+    workers: int = None
+) -> tuple:
+    """
+    Score all user pairs and keep each user's top K candidates.
+
+    Returns:
+        Tuple of (candidate_idx, scores), both shaped (n_users, top_k)
+    """
+    workers = workers or os.cpu_count() or 1
+    users = build_user_arrays(users_df)
+    n_users = len(users_df)
+    top_k = min(top_k, max(n_users - 1, 1))
+
+    candidate_idx = np.full((n_users, top_k), -1, dtype=np.int32)
+    scores = np.zeros((n_users, top_k), dtype=np.float32)
+
+    blocks = [(start, min(start + user_block, n_users)) for start in range(0, n_users, user_block)]
+    done = 0
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(model_dir, users, 1)
+    ) as pool:
+        futures = [pool.submit(score_user_block, start, stop, top_k, candidate_block) for start, stop in blocks]
+        for future in as_completed(futures):
+            start, block_idx, block_scores = future.result()
+            candidate_idx[start:start + len(block_idx)] = block_idx
+            scores[start:start + len(block_idx)] = block_scores
+            done += len(block_idx)
+            print(f"   Scored {done:,} / {n_users:,} users...")
+
+    return candidate_idx, scores
+
+
+def model_version(model_dir: str) -> str:
+    """Content hash of the model file (same as the ML server reports)."""
+    model_path = Path(model_dir) / "match_compatibility_model.pkl"
+    return hashlib.sha256(model_path.read_bytes()).hexdigest()[:12]
+
+
+def save_top_k(
+    output_file: str,
+    user_ids: np.ndarray,
+    candidate_idx: np.ndarray,
+    scores: np.ndarray,
+    version: str
+):
+    """Save the top-K table as a score store (served by ml_server_fastapi.py)."""
+    entries = write_score_store(output_file, user_ids, candidate_idx, scores, version)
+    print(f"✅ Score store saved: {output_file} ({len(user_ids):,} users, {entries:,} candidates)")
+
+
+def main():
+    """Main entry point for the top-K precompute job."""
+    parser = argparse.ArgumentParser(
+        description="Precompute each user's top-K candidate scores with the serving model"
+    )
+    parser.add_argument(
+        "users_file",
+        type=str,
+        help="Snapshot of per-user attributes (JSONL, CSV or Parquet)"
+    )
+    parser.add_argument(
+        "-o", "--output",
+        type=str,
+        default="scores/top_k_scores.bin",
+        help="Output file (default: scores/top_k_scores.bin)"
+    )
+    parser.add_argument(
+        "--model-dir",
+        type=str,
+        default="models",
+        help="Directory containing model files (default: models)"
+    )
+    parser.add_argument(
+        "--top-k",
+        type=int,
+        default=200,
+        help="Candidates kept per user (default: 200)"
+    )
+    parser.add_argument(
+        "--user-block",
+        type=int,
+        default=256,
+        help="Users per task (default: 256)"
+    )
+    parser.add_argument(
+        "--candidate-block",
+        type=int,
+        default=2048,
+        help="Candidates scored at once per task (default: 2048)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Worker processes (default: CPU count)"
+    )
+
+    args = parser.parse_args()
+
+    print("📂 Loading user snapshot...")
+    users_df = load_user_snapshot(args.users_file)
+    print(f"✅ Loaded {len(users_df):,} users")
+
+    if len(users_df) < 2:
+        print("❌ Need at least 2 users to score pairs. Exiting.", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"🔄 Scoring {len(users_df) * (len(users_df) - 1):,} pairs...")
+    start_time = time.time()
+    candidate_idx, scores = precompute_top_k(
+        users_df,
+        model_dir=args.model_dir,
+        top_k=args.top_k,
+        user_block=args.user_block,
+        candidate_block=args.candidate_block,
+        workers=args.workers
+    )
+    elapsed = time.time() - start_time
+    pairs = len(users_df) * (len(users_df) - 1)
+    print(f"✅ Scored in {elapsed:.2f}s ({pairs / elapsed:,.0f} pairs/s)")
+
+    save_top_k(
+        args.output,
+        users_df['userId'].astype(str).to_numpy(),
+        candidate_idx,
+        scores,
+        model_version(args.model_dir)
+    )
+
+
+if __name__ == "__main__":
+    main()
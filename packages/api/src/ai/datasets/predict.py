@@ -4,16 +4,24 @@ ML Model Prediction Service
 
 This script loads the trained XGBoost model and makes predictions on compatibility features.
 Can be called via command line (stdin/stdout) or HTTP API.
+
+Bulk mode (--input) scores a whole JSONL, CSV or Parquet file of feature
+records in fixed-size chunks across a process pool:
+    python predict.py --input features.jsonl --output scores.csv
 """
 
 import sys
+import os
 import json
+import time
 import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import io
 
 # Fix Windows console encoding
-if sys.platform == 'win32':
+if sys.platform == 'win32' and __name__ == "__main__":
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
@@ -87,6 +95,162 @@ def prepare_features(features_dict: dict, feature_names: list) -> pd.DataFrame:
     return df
 
 
+def prepare_feature_matrix(df: pd.DataFrame, feature_names: list) -> np.ndarray:
+    """
+    Vectorized prepare_features for a whole DataFrame of feature records.
+    
+    Args:
+        df: One feature record per row (columns named like the feature dict keys)
+        feature_names: List of expected feature names in order
+        
+    Returns:
+        float32 matrix with features in the correct order, missing values as 0
+    """
+    # Handle matchType encoding (0 for user_user, 1 for user_group)
+    if 'matchType' in df.columns:
+        match_type = df['matchType']
+        encoded = (match_type.notna() & (match_type != 'user_user')).astype(np.int8)
+        df = df.assign(matchType_encoded=encoded)
+    
+    # Missing columns become NaN, NaN becomes 0
+    matrix = df.reindex(columns=feature_names).to_numpy(dtype=np.float32, na_value=0)
+    return np.nan_to_num(matrix, copy=False)
+
+
+def iter_input_chunks(input_path: str, chunk_size: int):
+    """
+    Stream feature records from a JSONL, CSV or Parquet file as DataFrames
+    of at most chunk_size rows.
+    
+    JSONL lines may be plain feature dicts or full match events
+    ([ML_MATCH_EVENT] prefix and/or a nested "features" dict).
+    """
+    suffix = Path(input_path).suffix.lower()
+    
+    if suffix == '.csv':
+        yield from pd.read_csv(input_path, chunksize=chunk_size)
+        return
+    
+    if suffix in ('.parquet', '.pq'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Reading Parquet requires pyarrow: pip install pyarrow")
+        for batch in pq.ParquetFile(input_path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+        return
+    
+    records = []
+    with open(input_path, 'r', encoding='utf-8-sig') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if "[ML_MATCH_EVENT]" in line:
+                line = line.split("[ML_MATCH_EVENT]", 1)[1].strip()
+            record = json.loads(line)
+            if isinstance(record.get('features'), dict):
+                record = record['features']
+            records.append(record)
+            if len(records) >= chunk_size:
+                yield pd.DataFrame.from_records(records)
+                records = []
+    if records:
+        yield pd.DataFrame.from_records(records)
+
+
+# Per-process model for bulk scoring (loaded once by the pool initializer)
+_worker_model = None
+_worker_feature_names = None
+
+
+def _init_bulk_worker(model_dir: str):
+    global _worker_model, _worker_feature_names
+    _worker_model, _worker_feature_names = load_model(model_dir)
+    # Parallelism comes from the process pool
+    _worker_model.set_params(n_jobs=1)
+
+
+def _score_chunk(df: pd.DataFrame) -> np.ndarray:
+    matrix = prepare_feature_matrix(df, _worker_feature_names)
+    return _worker_model.predict_proba(matrix)[:, 1]
+
+
+def _write_scores(out, probabilities: np.ndarray, output_format: str, first_chunk: bool):
+    scores = pd.DataFrame({
+        'probability': probabilities,
+        'prediction': (probabilities > 0.5).astype(np.int8),
+    })
+    if output_format == 'csv':
+        scores.to_csv(out, index=False, header=first_chunk)
+    else:
+        scores.to_json(out, orient='records', lines=True)
+
+
+def predict_bulk(
+    input_path: str,
+    output_path: str,
+    model_dir: str = "models",
+    chunk_size: int = 10000,
+    workers: int = None
+) -> int:
+    """
+    Score a whole file of feature records, writing results in input order.
+    
+    Chunks are fanned out to a process pool with at most 2 chunks per
+    worker in flight, so memory stays bounded regardless of input size.
+    
+    Args:
+        input_path: JSONL, CSV or Parquet file of feature records
+        output_path: Output file (.csv for CSV, otherwise JSONL; "-" for stdout)
+        model_dir: Directory containing the model files
+        chunk_size: Rows per chunk
+        workers: Worker processes (default: CPU count)
+        
+    Returns:
+        Number of rows scored
+    """
+    workers = workers or os.cpu_count() or 1
+    output_format = 'csv' if output_path.lower().endswith('.csv') else 'jsonl'
+    out = sys.stdout if output_path == '-' else open(output_path, 'w', encoding='utf-8', newline='')
+    
+    start_time = time.time()
+    total_rows = 0
+    first_chunk = True
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_bulk_worker,
+            initargs=(model_dir,)
+        ) as pool:
+            in_flight = deque()
+            
+            def drain_one():
+                nonlocal total_rows, first_chunk
+                probabilities = in_flight.popleft().result()
+                _write_scores(out, probabilities, output_format, first_chunk)
+                first_chunk = False
+                total_rows += len(probabilities)
+            
+            for chunk in iter_input_chunks(input_path, chunk_size):
+                in_flight.append(pool.submit(_score_chunk, chunk))
+                if len(in_flight) >= workers * 2:
+                    drain_one()
+            while in_flight:
+                drain_one()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    
+    elapsed = time.time() - start_time
+    rate = total_rows / elapsed if elapsed > 0 else 0
+    print(
+        f"Scored {total_rows:,} rows in {elapsed:.2f}s ({rate:,.0f} rows/s, {workers} workers)",
+        file=sys.stderr
+    )
+    return total_rows
+
+
 def predict(features_dict: dict, model_dir: str = "models"):
     """
     Make a prediction using the trained model.
@@ -139,9 +303,36 @@ def main():
             type=str,
             help="JSON string with features (alternative to stdin)"
         )
+        parser.add_argument(
+            "--input",
+            type=str,
+            help="Bulk mode: JSONL, CSV or Parquet file of feature records"
+        )
+        parser.add_argument(
+            "--output",
+            type=str,
+            default="-",
+            help="Bulk mode output (.csv for CSV, otherwise JSONL; default: stdout)"
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=10000,
+            help="Bulk mode rows per chunk (default: 10000)"
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Bulk mode worker processes (default: CPU count)"
+        )
         
         args = parser.parse_args()
         
+        if args.input:
+            predict_bulk(args.input, args.output, args.model_dir, args.chunk_size, args.workers)
+            return
+        
         # Read features from stdin or --features argument
         if args.features:
             features_json = args.features
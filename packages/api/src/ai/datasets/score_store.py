@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Precomputed Score Store
+
+Fixed-record binary file for per-user candidate rankings, written by
+precompute_top_k.py and memory-mapped by ml_server_fastapi.py.
+
+Layout (little-endian, sections 8-byte aligned):
+- Header (64 bytes): magic, user count, entry count, user id width,
+  model version, creation time
+- User ids: fixed-width UTF-8, sorted (binary search, no index to build)
+- Offsets: users + 1 uint64, user i owns entries [offsets[i], offsets[i + 1])
+- Candidates: uint32 rows into the user id table, best first
+- Scores: float32, parallel to candidates
+
+Files are written to a temporary name and renamed into place, so readers
+never see a partial file and an open mapping stays valid after a refresh.
+"""
+
+import os
+import mmap
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+MAGIC = b"KVTOPK01"
+
+HEADER_DTYPE = np.dtype([
+    ("magic", "S8"),
+    ("n_users", "<u8"),
+    ("n_entries", "<u8"),
+    ("id_width", "<u4"),
+    ("reserved", "<u4"),
+    ("model_version", "S16"),
+    ("created_at", "<f8"),
+    ("padding", "V8"),
+])
+assert HEADER_DTYPE.itemsize == 64
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) // 8 * 8
+
+
+def _section_offsets(n_users: int, n_entries: int, id_width: int) -> dict:
+    ids = HEADER_DTYPE.itemsize
+    offsets = _align(ids + n_users * id_width)
+    candidates = offsets + (n_users + 1) * 8
+    scores = _align(candidates + n_entries * 4)
+    return {
+        "ids": ids,
+        "offsets": offsets,
+        "candidates": candidates,
+        "scores": scores,
+        "end": scores + n_entries * 4,
+    }
+
+
+def write_score_store(
+    path: str,
+    user_ids: np.ndarray,
+    candidate_idx: np.ndarray,
+    scores: np.ndarray,
+    model_version: str = ""
+) -> int:
+    """
+    Write a score store atomically.
+
+    Args:
+        path: Output file
+        user_ids: (n_users,) user ids
+        candidate_idx: (n_users, k) rows into user_ids, best first, -1 = padding
+        scores: (n_users, k) scores parallel to candidate_idx
+
+    Returns:
+        Number of candidate entries written
+    """
+    encoded = np.array([str(u).encode("utf-8") for u in user_ids], dtype=object)
+    id_width = max(1, max((len(u) for u in encoded), default=1))
+    ids = encoded.astype(f"S{id_width}")
+    if len(np.unique(ids)) != len(ids):
+        raise ValueError("User ids must be unique")
+
+    # Store users sorted by id; remap candidate rows to the sorted order
+    order = np.argsort(ids, kind="stable")
+    rank = np.empty(len(ids), dtype=np.int64)
+    rank[order] = np.arange(len(ids))
+
+    candidate_idx = np.asarray(candidate_idx)[order]
+    scores = np.asarray(scores, dtype=np.float32)[order]
+    valid = candidate_idx >= 0
+    counts = valid.sum(axis=1)
+
+    offsets = np.zeros(len(ids) + 1, dtype="<u8")
+    np.cumsum(counts, out=offsets[1:])
+    flat_candidates = rank[candidate_idx[valid]].astype("<u4")
+    flat_scores = scores[valid].astype("<f4")
+
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header["magic"] = MAGIC
+    header["n_users"] = len(ids)
+    header["n_entries"] = len(flat_scores)
+    header["id_width"] = id_width
+    header["model_version"] = str(model_version).encode("ascii")[:16]
+    header["created_at"] = time.time()
+
+    sections = _section_offsets(len(ids), len(flat_scores), id_width)
+    output_path = Path(path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_name(f".{output_path.name}.tmp")
+    with open(tmp_path, "wb") as f:
+        for name, array in (
+            (None, header),
+            ("ids", ids[order]),
+            ("offsets", offsets),
+            ("candidates", flat_candidates),
+            ("scores", flat_scores),
+        ):
+            if name:
+                f.write(b"\0" * (sections[name] - f.tell()))
+            f.write(array.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, output_path)
+    return len(flat_scores)
+
+
+class ScoreStore:
+    """Read-only, memory-mapped view of a score store file."""
+
+    def __init__(self, path: str):
+        self.path = str(path)
+        with open(self.path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # Identifies the file that was mapped (a rename swaps the inode)
+        self.file_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+        header = np.frombuffer(self._mmap, dtype=HEADER_DTYPE, count=1)[0]
+        if header["magic"] != MAGIC:
+            raise ValueError(f"Not a score store file: {self.path}")
+        self.n_users = int(header["n_users"])
+        self.n_entries = int(header["n_entries"])
+        self.model_version = header["model_version"].decode("ascii") or None
+        self.created_at = float(header["created_at"])
+        self.id_width = int(header["id_width"])
+
+        sections = _section_offsets(self.n_users, self.n_entries, self.id_width)
+        if len(self._mmap) < sections["end"]:
+            raise ValueError(f"Truncated score store file: {self.path}")
+        self.user_ids = np.frombuffer(
+            self._mmap, dtype=f"S{self.id_width}", count=self.n_users, offset=sections["ids"]
+        )
+        self.offsets = np.frombuffer(
+            self._mmap, dtype="<u8", count=self.n_users + 1, offset=sections["offsets"]
+        )
+        self.candidates = np.frombuffer(
+            self._mmap, dtype="<u4", count=self.n_entries, offset=sections["candidates"]
+        )
+        self.scores = np.frombuffer(
+            self._mmap, dtype="<f4", count=self.n_entries, offset=sections["scores"]
+        )
+
+    def __len__(self) -> int:
+        return self.n_users
+
+    def find(self, user_id: str) -> Optional[int]:
+        """Row of a user in the store, or None."""
+        key = user_id.encode("utf-8")
+        if not key or len(key) > self.id_width:
+            return None
+        row = int(np.searchsorted(self.user_ids, key))
+        if row < self.n_users and self.user_ids[row] == key:
+            return row
+        return None
+
+    def lookup(self, user_id: str, limit: Optional[int] = None) -> Optional[tuple]:
+        """
+        Ranked candidates of a user.
+
+        Returns:
+            Tuple of (candidate_ids, scores) or None for unknown users. Scores
+            are a view into the mapped file.
+        """
+        row = self.find(user_id)
+        if row is None:
+            return None
+        start, stop = int(self.offsets[row]), int(self.offsets[row + 1])
+        if limit is not None:
+            stop = min(stop, start + max(limit, 0))
+        candidate_ids = self.user_ids[self.candidates[start:stop]]
+        return candidate_ids, self.scores[start:stop]
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "users": self.n_users,
+            "entries": self.n_entries,
+            "model_version": self.model_version,
+            "created_at": self.created_at,
+        }
+
+
+def file_id(path: str) -> Optional[tuple]:
+    """(inode, mtime, size) of a file, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
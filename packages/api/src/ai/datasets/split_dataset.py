@@ -2,67 +2,255 @@
 """
 Split ML Training Dataset into Train/Validation Sets
 
-Time-based split to prevent future data leakage
+Streams the dataset in batches (bounded memory, works on datasets larger
+than RAM and on partitioned dataset directories) and routes each row to
+train or val in one pass:
+
+- hash: deterministic assignment from a hash of key columns. The same row
+  always lands on the same side, and duplicates never straddle the split.
+- time: every row at or before a cutoff timestamp goes to train, later
+  rows to val (prevents future data leakage). The cutoff is taken from a
+  timestamp quantile sketch.
+
+With --stratify (e.g. label matchType) every stratum of a hash split is
+split at its own threshold, so each one keeps the train ratio. Thresholds
+come from a first pass over only the key and strata columns. Time splits
+cannot be stratified: per-stratum cutoffs would put validation rows
+before training rows.
 """
 
 import sys
+import argparse
+import numpy as np
 import pandas as pd
 from pathlib import Path
 import io
 
+from dataset_io import DATASET_FORMATS, DERIVED_COLUMNS, DatasetWriter, dataset_columns, default_dataset_path, iter_dataset_batches
+from dataset_stats import QuantileSketch
+
 # Fix Windows console encoding
 if sys.platform == 'win32':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
-INPUT_FILE = Path("datasets/ml_training_dataset.csv")
-TRAIN_FILE = Path("datasets/train.csv")
-VAL_FILE = Path("datasets/val.csv")
+INPUT_FILE = Path(default_dataset_path("ml_training_dataset"))
+OUTPUT_DIR = Path("datasets")
 TRAIN_RATIO = 0.8
+SPLIT_BATCH_ROWS = 1_000_000
+
+# Default hash key: every column except these (label must not decide the side)
+NON_KEY_COLUMNS = ["label"] + DERIVED_COLUMNS
+
+
+def hash_fractions(df, key_columns, seed=0):
+    """Deterministic value in [0, 1) per row from a hash of its key columns."""
+    hash_key = f"{seed:016d}"[-16:]
+    hashes = pd.util.hash_pandas_object(df[key_columns], index=False, hash_key=hash_key).to_numpy()
+    return (hashes >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+
+
+def stratum_ids(df, strata):
+    """uint64 id per row of its stratum (all rows share one id without strata)."""
+    if not strata:
+        return np.zeros(len(df), dtype=np.uint64)
+    return pd.util.hash_pandas_object(df[strata], index=False).to_numpy()
+
+
+def split_values(df, mode, key_columns, seed):
+    """The value compared against the threshold: hash fraction or timestamp."""
+    if mode == "hash":
+        return hash_fractions(df, key_columns, seed)
+    return df["timestamp"].to_numpy(dtype=np.float64)
+
+
+def find_thresholds(path, mode, key_columns, strata, train_ratio, seed=0):
+    """
+    Per-stratum thresholds: rows with value <= threshold go to train.
+
+    Unstratified hash splits need no pass (threshold = train_ratio).
+    Otherwise a first pass sketches the value distribution per stratum.
+
+    Returns:
+        Tuple of ({stratum id: threshold}, {stratum id: stratum values})
+    """
+    if mode == "hash" and not strata:
+        return {np.uint64(0): train_ratio}, {np.uint64(0): ()}
+
+    columns = list(dict.fromkeys((key_columns if mode == "hash" else ["timestamp"]) + strata))
+    sketches, labels = {}, {}
+    for batch in iter_dataset_batches(path, columns, SPLIT_BATCH_ROWS):
+        values = split_values(batch, mode, key_columns, seed)
+        ids = stratum_ids(batch, strata)
+        unique_ids, first = np.unique(ids, return_index=True)
+        for stratum, row in zip(unique_ids, first):
+            sketches.setdefault(stratum, QuantileSketch()).update(values[ids == stratum])
+            labels.setdefault(stratum, tuple(str(batch[col].iloc[row]) for col in strata))
+
+    thresholds = {}
+    for stratum, sketch in sketches.items():
+        target = int(sketch.rows * train_ratio)
+        # Below the minimum when nothing goes to train
+        thresholds[stratum] = sketch.value_at_rank(target) if target else -np.inf
+    return thresholds, labels
+
+
+def split_stream(path, output_dir, mode="hash", train_ratio=TRAIN_RATIO, key_columns=None,
+                 strata=None, seed=0, format="parquet"):
+    """
+    Route every row of a dataset to train or val in one streaming pass.
+
+    Args:
+        path: Dataset file or directory
+        output_dir: Directory for train.<format> and val.<format>
+        mode: "hash" or "time"
+        train_ratio: Share of rows (per stratum) for training
+        key_columns: Hash key (default: all columns except label/derived)
+        strata: Columns to stratify by (e.g. ["label", "matchType"]), hash mode only
+        seed: Changes the hash assignment (hash mode)
+
+    Returns:
+        Dict of per-side and per-stratum counts and the thresholds used
+    """
+    strata = list(strata or [])
+    columns = dataset_columns(path)
+    if mode == "hash":
+        key_columns = list(key_columns or [col for col in columns if col not in NON_KEY_COLUMNS])
+    elif strata:
+        raise ValueError("Time splits use one global cutoff and cannot be stratified")
+    elif "timestamp" not in columns:
+        raise ValueError(f"Time split needs a timestamp column: {path}")
+
+    thresholds, labels = find_thresholds(path, mode, key_columns, strata, train_ratio, seed)
+
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    counts = {stratum: [0, 0] for stratum in thresholds}
+    sides = {"train": [0, 0], "val": [0, 0]}
+    with DatasetWriter(output_path / f"train.{format}") as train_writer, \
+            DatasetWriter(output_path / f"val.{format}") as val_writer:
+        for batch in iter_dataset_batches(path, batch_size=SPLIT_BATCH_ROWS):
+            values = split_values(batch, mode, key_columns, seed)
+            ids = stratum_ids(batch, strata)
+            unique_ids, inverse = np.unique(ids, return_inverse=True)
+            limit = np.array([thresholds[stratum] for stratum in unique_ids])[inverse]
+            to_train = values <= limit
+
+            for side, writer, mask in (("train", train_writer, to_train), ("val", val_writer, ~to_train)):
+                if mask.any() or not writer.rows:
+                    # An empty first write still fixes the schema
+                    writer.write(batch[mask])
+                sides[side][0] += int(mask.sum())
+                if "label" in batch.columns:
+                    sides[side][1] += int(batch["label"].to_numpy()[mask].sum())
+            train_counts = np.bincount(inverse, weights=to_train, minlength=len(unique_ids))
+            stratum_rows = np.bincount(inverse, minlength=len(unique_ids))
+            for stratum, train, rows in zip(unique_ids, train_counts, stratum_rows):
+                counts[stratum][0] += int(train)
+                counts[stratum][1] += int(rows - train)
+
+    return {
+        "train_rows": sides["train"][0],
+        "train_positives": sides["train"][1],
+        "val_rows": sides["val"][0],
+        "val_positives": sides["val"][1],
+        "strata": [
+            {"values": labels.get(stratum, ()), "train": train, "val": val, "threshold": float(thresholds.get(stratum, np.nan))}
+            for stratum, (train, val) in counts.items()
+        ],
+    }
+
 
 def main():
+    parser = argparse.ArgumentParser(
+        description="Split a dataset into train/val in one streaming pass"
+    )
+    parser.add_argument(
+        "input",
+        nargs="?",
+        default=str(INPUT_FILE),
+        help=f"Dataset file or directory (default: {INPUT_FILE})"
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["hash", "time"],
+        default="hash",
+        help="hash: deterministic by key columns; time: cutoff timestamp (default: hash)"
+    )
+    parser.add_argument(
+        "--train-ratio",
+        type=float,
+        default=TRAIN_RATIO,
+        help=f"Training share, per stratum with --stratify (default: {TRAIN_RATIO})"
+    )
+    parser.add_argument(
+        "--key",
+        nargs="+",
+        default=None,
+        help="Hash key columns (default: all columns except label and derived scores)"
+    )
+    parser.add_argument(
+        "--stratify",
+        nargs="+",
+        default=[],
+        help="Columns to stratify a hash split by, e.g. label matchType (default: none)"
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Hash seed; change it for a different hash split (default: 0)"
+    )
+    parser.add_argument(
+        "-o", "--output-dir",
+        default=str(OUTPUT_DIR),
+        help=f"Output directory for train/val (default: {OUTPUT_DIR})"
+    )
+    parser.add_argument(
+        "--format",
+        choices=DATASET_FORMATS,
+        default="parquet",
+        help="Output format (default: parquet)"
+    )
+    args = parser.parse_args()
+    if args.mode == "time" and args.stratify:
+        parser.error("--stratify cannot be used with --mode time (the cutoff must be global to avoid future leakage)")
+
     print("=" * 80)
     print("SPLIT DATASET INTO TRAIN/VAL")
     print("=" * 80)
-    
-    if not INPUT_FILE.exists():
-        print(f"❌ Input file not found: {INPUT_FILE}")
+
+    if not Path(args.input).exists():
+        print(f"❌ Input file not found: {args.input}")
         print(f"   Run: python src/lib/ai/datasets/build_ml_training_dataset.py")
         sys.exit(1)
-    
-    # Load dataset
-    print(f"\n📂 Loading dataset from {INPUT_FILE}...")
-    df = pd.read_csv(INPUT_FILE)
-    print(f"   Loaded {len(df):,} samples")
-    
-    # Shuffle to randomize (since we don't have timestamps in generated data)
-    # In real scenario, would use time-based split
-    df = df.sample(frac=1, random_state=42).reset_index(drop=True)
-    
-    # Split
-    split_idx = int(len(df) * TRAIN_RATIO)
-    train_df = df[:split_idx]
-    val_df = df[split_idx:]
-    
+
+    strata_note = f", stratified by {', '.join(args.stratify)}" if args.stratify else ""
+    print(f"\n📂 Streaming {args.input} ({args.mode} split{strata_note})...")
+    result = split_stream(
+        args.input, args.output_dir, mode=args.mode, train_ratio=args.train_ratio,
+        key_columns=args.key, strata=args.stratify, seed=args.seed, format=args.format
+    )
+    total = result["train_rows"] + result["val_rows"]
+
     print(f"\n📊 Split Results:")
-    print(f"   Training set: {len(train_df):,} samples ({TRAIN_RATIO*100:.0f}%)")
-    print(f"   Validation set: {len(val_df):,} samples ({(1-TRAIN_RATIO)*100:.0f}%)")
-    
+    print(f"   Training set: {result['train_rows']:,} samples ({result['train_rows'] / max(total, 1) * 100:.1f}%)")
+    print(f"   Validation set: {result['val_rows']:,} samples ({result['val_rows'] / max(total, 1) * 100:.1f}%)")
+
     # Check class balance
-    train_pos = (train_df['label'] == 1).sum() / len(train_df) * 100
-    val_pos = (val_df['label'] == 1).sum() / len(val_df) * 100
-    
     print(f"\n📈 Class Balance:")
-    print(f"   Train: {train_pos:.1f}% positive")
-    print(f"   Val: {val_pos:.1f}% positive")
-    
-    # Save
-    print(f"\n💾 Saving splits...")
-    train_df.to_csv(TRAIN_FILE, index=False)
-    val_df.to_csv(VAL_FILE, index=False)
-    
-    print(f"   ✅ Training set: {TRAIN_FILE}")
-    print(f"   ✅ Validation set: {VAL_FILE}")
+    print(f"   Train: {result['train_positives'] / max(result['train_rows'], 1) * 100:.1f}% positive")
+    print(f"   Val: {result['val_positives'] / max(result['val_rows'], 1) * 100:.1f}% positive")
+
+    if args.stratify:
+        print(f"\n🧮 Strata ({', '.join(args.stratify)}):")
+        for stratum in sorted(result["strata"], key=lambda s: s["values"]):
+            rows = stratum["train"] + stratum["val"]
+            print(f"   {'/'.join(stratum['values']):30s} train={stratum['train']:,} val={stratum['val']:,} ({stratum['train'] / max(rows, 1) * 100:.1f}% train)")
+
+    output_path = Path(args.output_dir)
+    print(f"\n   ✅ Training set: {output_path / f'train.{args.format}'}")
+    print(f"   ✅ Validation set: {output_path / f'val.{args.format}'}")
     print("\n✅ Split complete!")
     print("=" * 80)
 
@@ -7,17 +7,38 @@ This script:
 - Trains an XGBoost classifier for binary match prediction
 - Evaluates model performance
 - Saves the trained model for deployment
+
+With --memory-mode quantile or external, datasets are streamed in batches
+through an XGBoost data iterator instead of being loaded into pandas:
+"quantile" builds a quantized in-memory matrix (QuantileDMatrix, about a
+byte per value), "external" keeps the quantized pages on disk
+(ExtMemQuantileDMatrix). Hyperparameters are the same in every mode.
 """
 
 import pandas as pd
 import numpy as np
 import argparse
+import os
 from pathlib import Path
 import sys
 import io
 import json
+import tempfile
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from dataset_io import (
+    DERIVED_COLUMNS, dataset_columns, default_dataset_path, histogram_bins, iter_dataset_batches, read_dataset
+)
+from matrix_cache import CACHE_DIR, CACHE_MAX_AGE_DAYS, CACHE_MAX_BYTES, MatrixCache, dataset_fingerprint
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Not available on Windows
+
 # Fix Windows console encoding for emojis
 if sys.platform == 'win32':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
@@ -28,7 +49,6 @@ try:
         accuracy_score, precision_score, recall_score, 
         f1_score, roc_auc_score, classification_report, confusion_matrix
     )
-    from sklearn.preprocessing import LabelEncoder
     import xgboost as xgb
     import joblib
 except ImportError as e:
@@ -36,24 +56,54 @@ except ImportError as e:
     print("📦 Please install dependencies: pip install -r requirements.txt")
     sys.exit(1)
 
+# XGBoost parameters optimized for binary classification (shared by all memory modes)
+TRAINING_PARAMS = {
+    'objective': 'binary:logistic',
+    'eval_metric': 'auc',
+    'max_depth': 6,
+    'learning_rate': 0.1,
+    'n_estimators': 100,
+    'subsample': 0.8,
+    'colsample_bytree': 0.8,
+    'random_state': 42,
+    'n_jobs': -1,
+    'verbosity': 0
+}
+EARLY_STOPPING_ROUNDS = 10
 
-def load_datasets(train_path: str, val_path: str) -> tuple[pd.DataFrame, pd.DataFrame]:
-    """Load training and validation datasets."""
-    print("📂 Loading datasets...")
-    
-    train_df = pd.read_csv(train_path)
-    val_df = pd.read_csv(val_path)
-    
-    print(f"✅ Training set: {len(train_df)} samples")
-    print(f"✅ Validation set: {len(val_df)} samples")
-    
-    return train_df, val_df
+MEMORY_MODES = ("in-memory", "quantile", "external")
+TRAIN_BATCH_ROWS = 1_000_000
+
+# Hyperparameter search (--search): every combination is a grid trial;
+# random and halving sample --trials of them. Rounds are capped at
+# SEARCH_MAX_ROUNDS and cut short by early stopping.
+SEARCH_STRATEGIES = ("grid", "random", "halving")
+SEARCH_SPACE = {
+    'max_depth': [4, 6, 8],
+    'learning_rate': [0.05, 0.1, 0.2],
+    'subsample': [0.8, 1.0],
+    'colsample_bytree': [0.8, 1.0],
+    'min_child_weight': [1, 5]
+}
+SEARCH_TRIALS = 20
+SEARCH_MAX_ROUNDS = 300
+# Successive halving keeps the best 1/HALVING_FACTOR of the trials per rung
+HALVING_FACTOR = 3
+HALVING_RUNGS = 3
+# Single-row predictions timed per trial
+LATENCY_CALLS = 200
+
+# Part of the prepared matrix cache key: bump when prepare_features changes
+FEATURE_PREP_VERSION = 2
 
 
 def prepare_features(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.Series]:
     """
     Prepare features and labels from dataset.
     
+    Args:
+        df: Dataset (or one batch of it)
+    
     Returns:
         features_df: DataFrame with feature columns
         labels: Series with binary labels
@@ -70,10 +120,12 @@ def prepare_features(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.Series]:
     exclude_cols = metadata_cols + derived_cols
     feature_cols = [col for col in df.columns if col not in exclude_cols]
     
-    # Handle matchType as categorical feature
+    # Handle matchType as categorical feature: fixed encoding shared with
+    # the ML server and predict.py (user_user=0, anything else 1), so every
+    # batch and dataset is encoded the same way
     if 'matchType' in df.columns:
-        le = LabelEncoder()
-        df['matchType_encoded'] = le.fit_transform(df['matchType'])
+        match_type = df['matchType']
+        df['matchType_encoded'] = (match_type.notna() & (match_type != 'user_user')).astype(np.int8)
         feature_cols.append('matchType_encoded')
     
     features = df[feature_cols].copy()
@@ -107,26 +159,12 @@ def train_model(
     """
     print("\n🤖 Training XGBoost classifier...")
     
-    # XGBoost parameters optimized for binary classification
-    params = {
-        'objective': 'binary:logistic',
-        'eval_metric': 'auc',
-        'max_depth': 6,
-        'learning_rate': 0.1,
-        'n_estimators': 100,
-        'subsample': 0.8,
-        'colsample_bytree': 0.8,
-        'random_state': 42,
-        'n_jobs': -1,
-        'verbosity': 0
-    }
-    
     # Create and train model
-    model = xgb.XGBClassifier(**params)
+    model = xgb.XGBClassifier(**TRAINING_PARAMS)
     
     # Train with early stopping on validation set
     # Note: In XGBoost 2.0+, early_stopping_rounds is passed in __init__
-    model.set_params(early_stopping_rounds=10)
+    model.set_params(early_stopping_rounds=EARLY_STOPPING_ROUNDS)
     model.fit(
         X_train, y_train,
         eval_set=[(X_val, y_val)],
@@ -138,6 +176,323 @@ def train_model(
     return model
 
 
+def preparation_config() -> dict:
+    """Everything besides the data that changes prepare_features output (cache key)."""
+    return {
+        'version': FEATURE_PREP_VERSION,
+        'derived_columns': DERIVED_COLUMNS
+    }
+
+
+class PreparedDataset:
+    """
+    A dataset after prepare_features, read batch by batch or whole.
+    
+    With a MatrixCache, the prepared matrix is stored on the first complete
+    read and memory-mapped from the cache afterwards (also by later runs on
+    the same data). Row count and reference feature histograms are known
+    after the first read.
+    """
+
+    def __init__(self, path: str, batch_rows: int = TRAIN_BATCH_ROWS, cache: MatrixCache = None):
+        self.path = path
+        self.batch_rows = batch_rows
+        self.cache = cache
+        self.columns = [c for c in dataset_columns(path) if c not in DERIVED_COLUMNS]
+        self.key = dataset_fingerprint(path, preparation_config()) if cache else None
+        self.cached = cache.get(self.key) if cache else None
+        self.rows = self.cached.rows if self.cached else None
+        self.histograms = self.cached.histograms if self.cached else None
+
+    def _writer(self):
+        return self.cache.writer(self.key, preparation_config()) if self.cache else None
+
+    def _commit(self, writer, rows, histograms):
+        self.rows, self.histograms = rows, histograms
+        if writer is not None:
+            writer.histograms = histograms
+            self.cached = writer.close()
+
+    def batches(self):
+        """(features, labels) per batch."""
+        if self.cached is not None:
+            yield from self.cached.iter_chunks()
+            return
+        writer = self._writer()
+        rows, histograms = 0, None
+        try:
+            for batch in iter_dataset_batches(self.path, self.columns, self.batch_rows):
+                features, labels = prepare_features(batch)
+                rows += len(features)
+                histograms = add_feature_histograms(histograms, compute_feature_histograms(features))
+                if writer is not None:
+                    writer.write(features, labels)
+                yield features, labels
+        except BaseException:
+            # Incomplete read (including an abandoned generator): nothing is cached
+            if writer is not None:
+                writer.abort()
+            raise
+        self._commit(writer, rows, histograms)
+
+    def load(self) -> tuple[pd.DataFrame, pd.Series]:
+        """The whole prepared dataset."""
+        if self.cached is not None:
+            return self.cached.load()
+        features, labels = prepare_features(read_dataset(self.path, self.columns))
+        writer = self._writer()
+        if writer is not None:
+            writer.write(features, labels)
+        self._commit(writer, len(features), compute_feature_histograms(features))
+        return features, labels
+
+
+class DatasetBatchIter(xgb.DataIter):
+    """Feed the batches of a PreparedDataset to XGBoost."""
+
+    def __init__(self, data: PreparedDataset, cache_prefix: str = None):
+        self.data = data
+        self._batches = None
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data) -> bool:
+        if self._batches is None:
+            self._batches = self.data.batches()
+        batch = next(self._batches, None)
+        if batch is None:
+            return False
+        features, labels = batch
+        input_data(data=features, label=labels)
+        return True
+
+    def reset(self):
+        self._batches = None
+
+
+def train_model_streaming(
+    train_data: PreparedDataset,
+    val_data: PreparedDataset,
+    memory_mode: str = "quantile",
+    pages_dir: str = None
+) -> xgb.XGBClassifier:
+    """
+    Train with the same parameters as train_model, streaming the datasets.
+    
+    Args:
+        train_data: Training dataset
+        val_data: Validation dataset
+        memory_mode: "quantile" (QuantileDMatrix) or "external"
+            (ExtMemQuantileDMatrix, pages under pages_dir)
+        pages_dir: Directory for external memory pages
+        
+    Returns:
+        Trained model (as XGBClassifier, like train_model)
+    """
+    print(f"\n🤖 Training XGBoost classifier ({memory_mode} mode, {train_data.batch_rows:,} rows per batch)...")
+    
+    dtrain, dval = training_matrices(train_data, val_data, memory_mode, pages_dir)
+    booster = xgb.train(
+        booster_params(TRAINING_PARAMS), dtrain,
+        num_boost_round=TRAINING_PARAMS['n_estimators'],
+        evals=[(dval, 'validation')],
+        early_stopping_rounds=EARLY_STOPPING_ROUNDS,
+        verbose_eval=False
+    )
+    model = classifier_from_booster(booster, TRAINING_PARAMS)
+    
+    print("✅ Model training complete!")
+    
+    return model
+
+
+def booster_params(params: dict, nthread: int = None) -> dict:
+    """xgb.train parameters for XGBClassifier-style params (as in TRAINING_PARAMS)."""
+    names = {'learning_rate': 'eta', 'random_state': 'seed', 'n_jobs': 'nthread'}
+    converted = {names.get(key, key): value for key, value in params.items() if key != 'n_estimators'}
+    if nthread is not None:
+        converted['nthread'] = nthread
+    converted['tree_method'] = 'hist'
+    return converted
+
+
+def classifier_from_booster(booster: xgb.Booster, params: dict) -> xgb.XGBClassifier:
+    """Wrap a booster so the saved model is used like the in-memory one."""
+    model = xgb.XGBClassifier(**params)
+    model.load_model(booster.save_raw('ubj'))
+    return model
+
+
+def training_matrices(
+    train_data: PreparedDataset,
+    val_data: PreparedDataset,
+    memory_mode: str = "quantile",
+    pages_dir: str = None
+) -> tuple:
+    """
+    Quantized training and validation matrices (validation shares the
+    training bins). "in-memory" loads the prepared datasets first; the
+    streaming modes feed them batch by batch.
+    """
+    if memory_mode == "in-memory":
+        X_train, y_train = train_data.load()
+        X_val, y_val = val_data.load()
+        dtrain = xgb.QuantileDMatrix(X_train, y_train)
+        dval = xgb.QuantileDMatrix(X_val, y_val, ref=dtrain)
+    elif memory_mode == "external":
+        train_iter = DatasetBatchIter(train_data, str(Path(pages_dir) / "train"))
+        val_iter = DatasetBatchIter(val_data, str(Path(pages_dir) / "val"))
+        if hasattr(xgb, 'ExtMemQuantileDMatrix'):
+            dtrain = xgb.ExtMemQuantileDMatrix(train_iter)
+            dval = xgb.ExtMemQuantileDMatrix(val_iter, ref=dtrain)
+        else:
+            # XGBoost < 3.0: external memory through a paged DMatrix
+            dtrain = xgb.DMatrix(train_iter)
+            dval = xgb.DMatrix(val_iter)
+    else:
+        dtrain = xgb.QuantileDMatrix(DatasetBatchIter(train_data))
+        dval = xgb.QuantileDMatrix(DatasetBatchIter(val_data), ref=dtrain)
+    return dtrain, dval
+
+
+def predict_dataset(model: xgb.XGBClassifier, data: PreparedDataset) -> tuple[np.ndarray, np.ndarray]:
+    """Labels and predicted probabilities of a dataset, scored batch by batch."""
+    labels, probabilities = [], []
+    for features, batch_labels in data.batches():
+        labels.append(batch_labels.to_numpy())
+        probabilities.append(model.predict_proba(features)[:, 1])
+    return np.concatenate(labels), np.concatenate(probabilities)
+
+
+def search_candidates(strategy: str, trials: int = SEARCH_TRIALS, seed: int = 42) -> list:
+    """Parameter sets to try: the whole SEARCH_SPACE grid, or a random sample of it."""
+    names = list(SEARCH_SPACE)
+    grid = [dict(zip(names, values)) for values in itertools.product(*(SEARCH_SPACE[name] for name in names))]
+    if strategy == "grid" or trials >= len(grid):
+        return grid
+    rng = np.random.default_rng(seed)
+    return [grid[i] for i in sorted(rng.choice(len(grid), size=trials, replace=False))]
+
+
+def run_trial(trial: dict, dtrain, dval, rounds: int, nthread: int) -> dict:
+    """
+    Train (or continue training) one trial up to `rounds` boosting rounds
+    with early stopping on the validation set.
+    """
+    start = time.perf_counter()
+    params = booster_params({**TRAINING_PARAMS, **trial['params']}, nthread)
+    booster = trial.get('booster')
+    done = booster.num_boosted_rounds() if booster is not None else 0
+    booster = xgb.train(
+        params, dtrain,
+        num_boost_round=rounds - done,
+        evals=[(dval, 'validation')],
+        early_stopping_rounds=EARLY_STOPPING_ROUNDS,
+        verbose_eval=False,
+        xgb_model=booster
+    )
+    trial['booster'] = booster
+    trial['rounds'] = booster.num_boosted_rounds()
+    trial['best_iteration'] = int(booster.best_iteration)
+    trial['val_auc'] = float(booster.best_score)
+    trial['stopped_early'] = trial['rounds'] < rounds
+    trial['train_seconds'] = trial.get('train_seconds', 0.0) + time.perf_counter() - start
+    return trial
+
+
+def measure_latency(booster: xgb.Booster, rows: np.ndarray) -> dict:
+    """Single-row prediction latency in ms (one thread, as served)."""
+    booster = booster.copy()
+    booster.set_param({'nthread': 1})
+    iteration_range = (0, booster.best_iteration + 1)
+    timings = []
+    for i in range(LATENCY_CALLS):
+        row = rows[i % len(rows):i % len(rows) + 1]
+        start = time.perf_counter()
+        booster.inplace_predict(row, iteration_range=iteration_range)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {'p50': float(np.percentile(timings, 50)), 'p99': float(np.percentile(timings, 99))}
+
+
+def hyperparameter_search(
+    dtrain,
+    dval,
+    latency_rows: np.ndarray,
+    strategy: str = "random",
+    trials: int = SEARCH_TRIALS,
+    parallel: int = None,
+    seed: int = 42,
+    memory_mode: str = "in-memory"
+) -> list:
+    """
+    Run trials concurrently on shared, already built matrices.
+    
+    Trials run in threads (XGBoost releases the GIL while boosting), with
+    CPU count / parallel threads each so the total matches the machine.
+    "halving" trains every trial for a small budget, keeps the best
+    1/HALVING_FACTOR and continues those on a larger budget, up to
+    SEARCH_MAX_ROUNDS. External memory matrices cannot be shared between
+    threads, so in "external" mode trials run one at a time with all
+    threads.
+    
+    Returns:
+        Trials (params, val_auc, best_iteration, train_seconds, latency_ms,
+        booster), best first
+    """
+    candidates = search_candidates(strategy, trials, seed)
+    cpus = os.cpu_count() or 1
+    if memory_mode == "external":
+        if parallel and parallel > 1:
+            print("⚠️  External memory matrices cannot be shared between trials; running one trial at a time")
+        parallel = 1
+    parallel = max(1, min(parallel or cpus, len(candidates)))
+    nthread = max(1, cpus // parallel)
+    print(f"\n🔎 {strategy} search: {len(candidates)} trials, {parallel} at a time x {nthread} threads")
+    
+    all_trials = [{'trial': i, 'params': params} for i, params in enumerate(candidates)]
+    if strategy == "halving":
+        budgets = [max(1, SEARCH_MAX_ROUNDS // HALVING_FACTOR ** k) for k in reversed(range(HALVING_RUNGS))]
+    else:
+        budgets = [SEARCH_MAX_ROUNDS]
+    
+    active = all_trials
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        for rung, budget in enumerate(budgets):
+            running = [trial for trial in active if not trial.get('stopped_early')]
+            list(pool.map(lambda trial: run_trial(trial, dtrain, dval, budget, nthread), running))
+            for trial in active:
+                trial['rung'] = rung
+            active = sorted(active, key=lambda trial: -trial['val_auc'])
+            if rung < len(budgets) - 1:
+                active = active[:max(1, len(active) // HALVING_FACTOR)]
+                print(f"   Rung {rung} ({budget} rounds): best AUC {active[0]['val_auc']:.4f}, {len(active)} trials continue")
+    
+    # Latency after training, so trials do not compete for the CPU while timed
+    for trial in all_trials:
+        trial['latency_ms'] = measure_latency(trial['booster'], latency_rows)
+    return sorted(all_trials, key=lambda trial: (-trial['rung'], -trial['val_auc'], trial['train_seconds']))
+
+
+def write_leaderboard(leaderboard: list, output_dir: str, strategy: str) -> Path:
+    """Save the search results (without boosters) as leaderboard.json."""
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    rows = [{key: value for key, value in trial.items() if key != 'booster'} for trial in leaderboard]
+    leaderboard_path = output_path / "leaderboard.json"
+    with open(leaderboard_path, 'w') as f:
+        json.dump({'strategy': strategy, 'created_at': datetime.now().isoformat(), 'trials': rows}, f, indent=2)
+    return leaderboard_path
+
+
+def print_leaderboard(leaderboard: list, top: int = 10):
+    print("\n" + "=" * 60)
+    print("🏆 Leaderboard (validation AUC):")
+    print("=" * 60)
+    for rank, trial in enumerate(leaderboard[:top], 1):
+        params = ", ".join(f"{key}={value}" for key, value in trial['params'].items())
+        print(f"  {rank:2d}. AUC {trial['val_auc']:.4f}  {trial['train_seconds']:6.1f}s  "
+              f"{trial['latency_ms']['p50']:.3f}ms  rounds={trial['best_iteration'] + 1}  {params}")
+
+
 def evaluate_model(
     model: xgb.XGBClassifier,
     X_train: pd.DataFrame,
@@ -146,15 +501,27 @@ def evaluate_model(
     y_val: pd.Series
 ):
     """Evaluate model performance on training and validation sets."""
+    return evaluate_predictions(
+        model, list(X_train.columns),
+        y_train, model.predict_proba(X_train)[:, 1],
+        y_val, model.predict_proba(X_val)[:, 1]
+    )
+
+
+def evaluate_predictions(
+    model: xgb.XGBClassifier,
+    feature_names: list,
+    y_train: np.ndarray,
+    y_train_proba: np.ndarray,
+    y_val: np.ndarray,
+    y_val_proba: np.ndarray
+):
+    """Print and return metrics from the labels and predicted probabilities."""
     print("\n📊 Evaluating model performance...\n")
     
-    # Predictions
-    y_train_pred = model.predict(X_train)
-    y_val_pred = model.predict(X_val)
-    
-    # Probabilities for ROC-AUC
-    y_train_proba = model.predict_proba(X_train)[:, 1]
-    y_val_proba = model.predict_proba(X_val)[:, 1]
+    # Predictions (same 0.5 threshold as model.predict)
+    y_train_pred = (y_train_proba > 0.5).astype(int)
+    y_val_pred = (y_val_proba > 0.5).astype(int)
     
     # Calculate metrics
     train_metrics = {
@@ -213,7 +580,7 @@ def evaluate_model(
     print("🔝 Top 10 Most Important Features:")
     print("=" * 60)
     feature_importance = pd.DataFrame({
-        'feature': X_train.columns,
+        'feature': feature_names,
         'importance': model.feature_importances_
     }).sort_values('importance', ascending=False)
     
@@ -223,11 +590,60 @@ def evaluate_model(
     return train_metrics, val_metrics
 
 
+# Fixed bins for the reference feature histograms (all features live in [0,1])
+HISTOGRAM_BINS = 10
+HISTOGRAM_RANGE = (0.0, 1.0)
+
+
+def compute_feature_histograms(features: pd.DataFrame) -> dict:
+    """
+    Compute fixed-bin histograms of the training features.
+    
+    Saved next to the model so the ML server can compare live request
+    distributions against them (drift monitoring). Values outside the
+    range are counted in the first/last bin.
+    """
+    bin_idx = histogram_bins(features.to_numpy(dtype=np.float32), HISTOGRAM_BINS, HISTOGRAM_RANGE)
+    
+    histograms = {}
+    for col, name in enumerate(features.columns):
+        counts = np.bincount(bin_idx[:, col], minlength=HISTOGRAM_BINS)
+        histograms[name] = counts.tolist()
+    
+    return {
+        'bins': HISTOGRAM_BINS,
+        'range': list(HISTOGRAM_RANGE),
+        'rows': len(features),
+        'histograms': histograms
+    }
+
+
+def add_feature_histograms(total: dict, batch: dict) -> dict:
+    """Combine the feature histograms of two batches (counts add up)."""
+    if total is None:
+        return batch
+    for name, counts in batch['histograms'].items():
+        total['histograms'][name] = [a + b for a, b in zip(total['histograms'][name], counts)]
+    total['rows'] += batch['rows']
+    return total
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process in MB (None where unsupported)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
 def save_model(
     model: xgb.XGBClassifier,
     feature_names: list,
     output_dir: str = "models",
-    metrics: dict = None
+    metrics: dict = None,
+    feature_histograms: dict = None,
+    training_info: dict = None
 ):
     """Save trained model and metadata."""
     output_path = Path(output_dir)
@@ -252,10 +668,19 @@ def save_model(
             'metrics': metrics,
             'feature_count': len(feature_names)
         }
+        if training_info:
+            metadata['training'] = training_info
         metadata_path = output_path / "model_metadata.json"
         with open(metadata_path, 'w') as f:
             json.dump(metadata, f, indent=2)
         print(f"💾 Metadata saved: {metadata_path}")
+    
+    # Save reference histograms for drift monitoring
+    if feature_histograms:
+        histograms_path = output_path / "feature_histograms.json"
+        with open(histograms_path, 'w') as f:
+            json.dump(feature_histograms, f, indent=2)
+        print(f"💾 Feature histograms saved: {histograms_path}")
 
 
 def main():
@@ -264,16 +689,18 @@ def main():
         description="Train ML model for match compatibility prediction"
     )
     parser.add_argument(
-        "--train-csv",
+        "--train", "--train-csv",
+        dest="train_path",
         type=str,
-        default="datasets/train.csv",
-        help="Path to training CSV file (default: datasets/train.csv)"
+        default=default_dataset_path("train"),
+        help="Path to training dataset, Parquet or CSV (default: datasets/train.parquet)"
     )
     parser.add_argument(
-        "--val-csv",
+        "--val", "--val-csv",
+        dest="val_path",
         type=str,
-        default="datasets/val.csv",
-        help="Path to validation CSV file (default: datasets/val.csv)"
+        default=default_dataset_path("val"),
+        help="Path to validation dataset, Parquet or CSV (default: datasets/val.parquet)"
     )
     parser.add_argument(
         "--output-dir",
@@ -281,45 +708,164 @@ def main():
         default="models",
         help="Output directory for saved model (default: models)"
     )
+    parser.add_argument(
+        "--memory-mode",
+        choices=MEMORY_MODES,
+        default="in-memory",
+        help="in-memory: pandas + XGBClassifier.fit; quantile: stream batches into a QuantileDMatrix; "
+             "external: stream into on-disk pages (ExtMemQuantileDMatrix) (default: in-memory)"
+    )
+    parser.add_argument(
+        "--batch-rows",
+        type=int,
+        default=TRAIN_BATCH_ROWS,
+        help=f"Rows per batch in the streaming modes (default: {TRAIN_BATCH_ROWS:,})"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=CACHE_DIR,
+        help=f"Prepared matrix cache, keyed by dataset content hash (default: {CACHE_DIR}, env ML_MATRIX_CACHE_DIR)"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always read and prepare the datasets; do not use or write the cache"
+    )
+    parser.add_argument(
+        "--cache-max-gb",
+        type=float,
+        default=CACHE_MAX_BYTES / 1024 ** 3,
+        help=f"Evict least recently used cache entries above this size (default: {CACHE_MAX_BYTES / 1024 ** 3:g})"
+    )
+    parser.add_argument(
+        "--cache-max-age-days",
+        type=float,
+        default=CACHE_MAX_AGE_DAYS,
+        help=f"Evict cache entries unused for this long (default: {CACHE_MAX_AGE_DAYS})"
+    )
+    parser.add_argument(
+        "--search",
+        choices=SEARCH_STRATEGIES,
+        default=None,
+        help="Hyperparameter search over SEARCH_SPACE instead of the fixed parameters; "
+             "writes leaderboard.json and saves the best trial's model"
+    )
+    parser.add_argument(
+        "--trials",
+        type=int,
+        default=SEARCH_TRIALS,
+        help=f"Trials sampled by random/halving search (default: {SEARCH_TRIALS})"
+    )
+    parser.add_argument(
+        "--parallel-trials",
+        type=int,
+        default=None,
+        help="Trials run at once; each gets CPU count / parallel threads (default: CPU count; "
+             "always 1 with --memory-mode external)"
+    )
     
     args = parser.parse_args()
     
     # Validate input files
-    if not Path(args.train_csv).exists():
-        print(f"❌ Error: Training CSV not found: {args.train_csv}")
+    if not Path(args.train_path).exists():
+        print(f"❌ Error: Training dataset not found: {args.train_path}")
         sys.exit(1)
     
-    if not Path(args.val_csv).exists():
-        print(f"❌ Error: Validation CSV not found: {args.val_csv}")
+    if not Path(args.val_path).exists():
+        print(f"❌ Error: Validation dataset not found: {args.val_path}")
         sys.exit(1)
     
     try:
-        # Load datasets
-        train_df, val_df = load_datasets(args.train_csv, args.val_csv)
-        
-        # Prepare features and labels
-        print("\n🔧 Preparing features...")
-        X_train, y_train = prepare_features(train_df)
-        X_val, y_val = prepare_features(val_df)
+        cache = None
+        if not args.no_cache:
+            cache = MatrixCache(args.cache_dir, int(args.cache_max_gb * 1024 ** 3), args.cache_max_age_days)
+            cache.evict()
         
-        print(f"✅ Features prepared: {len(X_train.columns)} features")
-        print(f"   Training samples: {len(X_train)}")
-        print(f"   Validation samples: {len(X_val)}")
+        print("📂 Loading datasets...")
+        train_data = PreparedDataset(args.train_path, args.batch_rows, cache)
+        val_data = PreparedDataset(args.val_path, args.batch_rows, cache)
+        for name, data in (("Training", train_data), ("Validation", val_data)):
+            if data.cached is not None:
+                print(f"♻️  {name} set: prepared matrix from cache ({data.rows} samples, {data.key[:12]})")
         
-        # Train model
-        model = train_model(X_train, y_train, X_val, y_val, args.output_dir)
+        training_info = {'memory_mode': args.memory_mode}
+        if args.search:
+            # Build the matrices once; every trial trains on them
+            Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+            with tempfile.TemporaryDirectory(prefix=".xgb-pages-", dir=args.output_dir) as pages_dir:
+                dtrain, dval = training_matrices(train_data, val_data, args.memory_mode, pages_dir)
+                latency_rows = next(iter(val_data.batches()))[0].to_numpy(dtype=np.float32)[:LATENCY_CALLS]
+                leaderboard = hyperparameter_search(
+                    dtrain, dval, latency_rows, args.search, args.trials, args.parallel_trials,
+                    memory_mode=args.memory_mode
+                )
+            print_leaderboard(leaderboard)
+            print(f"\n💾 Leaderboard saved: {write_leaderboard(leaderboard, args.output_dir, args.search)}")
+            
+            best = leaderboard[0]
+            model = classifier_from_booster(best['booster'], {**TRAINING_PARAMS, **best['params']})
+            training_info['search'] = {
+                'strategy': args.search,
+                'trials': len(leaderboard),
+                'best_trial': best['trial'],
+                'params': best['params']
+            }
+            
+            # Evaluate the best trial (scored batch by batch)
+            y_train, y_train_proba = predict_dataset(model, train_data)
+            y_val, y_val_proba = predict_dataset(model, val_data)
+            feature_names = model.get_booster().feature_names
+            train_metrics, val_metrics = evaluate_predictions(
+                model, feature_names, y_train, y_train_proba, y_val, y_val_proba
+            )
+        elif args.memory_mode == "in-memory":
+            # Prepare features and labels
+            print("\n🔧 Preparing features...")
+            X_train, y_train = train_data.load()
+            X_val, y_val = val_data.load()
+            
+            print(f"✅ Features prepared: {len(X_train.columns)} features")
+            print(f"   Training samples: {len(X_train)}")
+            print(f"   Validation samples: {len(X_val)}")
+            
+            # Train model
+            model = train_model(X_train, y_train, X_val, y_val, args.output_dir)
+            
+            # Evaluate model
+            train_metrics, val_metrics = evaluate_model(
+                model, X_train, y_train, X_val, y_val
+            )
+            feature_names = list(X_train.columns)
+        else:
+            # Stream the datasets; external memory pages live next to the model until training ends
+            Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+            with tempfile.TemporaryDirectory(prefix=".xgb-pages-", dir=args.output_dir) as pages_dir:
+                model = train_model_streaming(train_data, val_data, args.memory_mode, pages_dir)
+            print(f"   Training samples: {train_data.rows}")
+            
+            # Evaluate model (scored batch by batch)
+            y_train, y_train_proba = predict_dataset(model, train_data)
+            y_val, y_val_proba = predict_dataset(model, val_data)
+            feature_names = model.get_booster().feature_names
+            train_metrics, val_metrics = evaluate_predictions(
+                model, feature_names, y_train, y_train_proba, y_val, y_val_proba
+            )
+        feature_histograms = train_data.histograms
         
-        # Evaluate model
-        train_metrics, val_metrics = evaluate_model(
-            model, X_train, y_train, X_val, y_val
-        )
+        peak_rss = peak_rss_mb()
+        training_info['peak_rss_mb'] = peak_rss
+        if peak_rss is not None:
+            print(f"\n🧠 Peak memory (RSS): {peak_rss:.0f} MB ({args.memory_mode} mode)")
         
         # Save model
         save_model(
             model,
-            list(X_train.columns),
+            feature_names,
             args.output_dir,
-            {'train': train_metrics, 'validation': val_metrics}
+            {'train': train_metrics, 'validation': val_metrics},
+            feature_histograms,
+            training_info
         )
         
         print("\n" + "=" * 60)
@@ -329,6 +875,7 @@ def main():
         print("   - match_compatibility_model.pkl (trained model)")
         print("   - model_features.json (feature names)")
         print("   - model_metadata.json (training metadata)")
+        print("   - feature_histograms.json (reference distributions for drift monitoring)")
         
     except Exception as e:
         print(f"\n❌ Error during training: {e}", file=sys.stderr)
@@ -4,114 +4,344 @@ Dataset Verification Script
 Verifies that generated datasets meet all quality requirements.
 
 Usage:
-    python verify_dataset.py [train_csv] [val_csv]
+    python verify_dataset.py [train_path] [val_path] [--fail-fast] [--workers N] [--stats]
+
+Parquet and CSV datasets (and partitioned dataset directories) are both
+accepted. Files are checked in chunks (Parquet row groups, one task per
+column) across worker processes. Numeric ranges, missing values and
+timestamps come from the row group statistics in the file footer, so only
+matchType/label (and columns without statistics) are read. The time split
+is checked from per-chunk min/max timestamps.
+
+With --fail-fast the run stops at the first hard violation (feature
+outside [0,1] or missing, label not 0/1, val timestamp before a train
+timestamp) and exits with status 1. --stats also computes the full
+statistics (dataset_stats.py) and writes a JSON report next to each dataset.
 """
 
+import os
 import sys
-import pandas as pd
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from pathlib import Path
 import io
 
+import pandas as pd
+
+from dataset_io import (
+    METADATA_COLUMNS, dataset_files, dataset_format, default_dataset_path, iter_dataset_batches, pa, pq
+)
+from dataset_stats import compute_dataset_stats, write_stats_report
+
 # Fix Windows console encoding for emojis
 if sys.platform == 'win32':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
-def check_feature_ranges(df, feature_cols):
+# Columns whose values are counted (always read; everything else can come
+# from the Parquet row group statistics)
+COUNTED_COLUMNS = ['matchType', 'label']
+LABEL_VALUES = ['0', '1']
+CSV_CHUNK_ROWS = 1_000_000
+
+
+def column_summary(values):
+    """Rows, missing values, min/max and (for COUNTED_COLUMNS) value counts of a column chunk."""
+    numeric = pd.api.types.is_numeric_dtype(values)
+    summary = {"rows": len(values), "missing": int(values.isna().sum()), "numeric": numeric,
+               "min": None, "max": None, "counts": None}
+    if numeric and summary["missing"] < len(values):
+        summary["min"] = float(values.min())
+        summary["max"] = float(values.max())
+    if values.name in COUNTED_COLUMNS:
+        summary["counts"] = {str(k): int(v) for k, v in values.value_counts().items()}
+    return summary
+
+
+def footer_summary(parquet_file, row_group, column):
+    """
+    Column chunk summary from the row group statistics, without reading data.
+
+    Returns:
+        Summary dict, or None if the statistics are missing
+    """
+    index = parquet_file.schema_arrow.get_field_index(column)
+    arrow_type = parquet_file.schema_arrow.field(index).type
+    numeric = pa.types.is_integer(arrow_type) or pa.types.is_floating(arrow_type)
+    metadata = parquet_file.metadata.row_group(row_group)
+    stats = metadata.column(index).statistics
+    if stats is None or not stats.has_null_count:
+        return None
+    summary = {"rows": metadata.num_rows, "missing": int(stats.null_count), "numeric": numeric,
+               "min": None, "max": None, "counts": None}
+    if numeric and stats.null_count < metadata.num_rows:
+        if not stats.has_min_max:
+            return None
+        summary["min"] = float(stats.min)
+        summary["max"] = float(stats.max)
+    return summary
+
+
+def merge_summaries(a, b):
+    """Combine two summaries of the same column."""
+    if a is None:
+        return dict(b)
+    mins = [v for v in (a["min"], b["min"]) if v is not None]
+    maxs = [v for v in (a["max"], b["max"]) if v is not None]
+    merged = {
+        "rows": a["rows"] + b["rows"],
+        "missing": a["missing"] + b["missing"],
+        "numeric": a["numeric"] and b["numeric"],
+        "min": min(mins) if mins else None,
+        "max": max(maxs) if maxs else None,
+        "counts": None,
+    }
+    if a["counts"] is not None or b["counts"] is not None:
+        counts = dict(a["counts"] or {})
+        for value, count in (b["counts"] or {}).items():
+            counts[value] = counts.get(value, 0) + count
+        merged["counts"] = counts
+    return merged
+
+
+def scan_chunk(task):
+    """
+    Worker: summarize one chunk of a dataset.
+
+    Args:
+        task: (side, file, row group, column) for Parquet files; a CSV file
+            is one task (row group and column None) streamed in batches
+
+    Returns:
+        Tuple of (task, {column: summary})
+    """
+    side, path, row_group, column = task
+    if row_group is None:
+        summaries = {}
+        for batch in iter_dataset_batches(path, batch_size=CSV_CHUNK_ROWS):
+            for col in batch.columns:
+                summaries[col] = merge_summaries(summaries.get(col), column_summary(batch[col]))
+        return task, summaries
+
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    summary = None if column in COUNTED_COLUMNS else footer_summary(parquet_file, row_group, column)
+    if summary is None:
+        values = parquet_file.read_row_group(row_group, columns=[column]).column(0).to_pandas()
+        summary = column_summary(values.rename(column))
+    return task, {column: summary}
+
+
+def chunk_tasks(path, side):
+    """One task per (Parquet file, row group, column); one per CSV file."""
+    tasks = []
+    for file in dataset_files(path):
+        if dataset_format(file) == "csv":
+            tasks.append((side, str(file), None, None))
+            continue
+        parquet_file = pq.ParquetFile(file)
+        for row_group in range(parquet_file.metadata.num_row_groups):
+            for column in parquet_file.schema_arrow.names:
+                tasks.append((side, str(file), row_group, column))
+    return tasks
+
+
+def hard_violations(column, summary):
+    """Violations that fail verification outright (checked per chunk)."""
+    issues = []
+    if column == 'label':
+        bad = sorted(value for value in (summary["counts"] or {}) if value not in LABEL_VALUES)
+        if summary["missing"]:
+            issues.append(f"label: {summary['missing']} missing values")
+        if bad:
+            issues.append(f"label: values {bad} outside {{0, 1}}")
+    elif column not in METADATA_COLUMNS and summary["numeric"]:
+        if summary["missing"]:
+            issues.append(f"{column}: contains NaN values")
+        elif summary["min"] is not None and (summary["min"] < 0 or summary["max"] > 1):
+            issues.append(f"{column}: range [{summary['min']:.4f}, {summary['max']:.4f}] outside [0,1]")
+    return issues
+
+
+def verify_chunks(train_path, val_path, workers=None, fail_fast=False):
+    """
+    Summarize both datasets chunk by chunk across worker processes.
+
+    Hard violations and the time split are checked as chunks complete
+    (the split from the running max train / min val timestamp). With
+    fail_fast, pending chunks are cancelled at the first violation.
+
+    Returns:
+        Tuple of ({"train"/"val": {column: summary}}, hard violations, stopped early)
+    """
+    tasks = chunk_tasks(train_path, "train") + chunk_tasks(val_path, "val")
+    summaries = {"train": {}, "val": {}}
+    violations = []
+
+    def collect(result):
+        (side, path, row_group, _), columns = result
+        where = Path(path).name + (f", row group {row_group}" if row_group is not None else "")
+        for column, summary in columns.items():
+            summaries[side][column] = merge_summaries(summaries[side].get(column), summary)
+            violations.extend(f"{side} {issue} ({where})" for issue in hard_violations(column, summary))
+        if "timestamp" in columns:
+            split_ok, max_train_time, min_val_time = check_time_based_split(summaries["train"], summaries["val"])
+            if not split_ok and not any(issue.startswith("time split") for issue in violations):
+                violations.append(f"time split: val timestamp {min_val_time:.0f} before train timestamp {max_train_time:.0f}")
+        return fail_fast and bool(violations)
+
+    workers = min(workers or os.cpu_count() or 1, max(len(tasks), 1))
+    stopped = False
+    if workers <= 1:
+        for task in tasks:
+            if collect(scan_chunk(task)):
+                stopped = True
+                break
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = {pool.submit(scan_chunk, task) for task in tasks}
+            while pending and not stopped:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stopped = collect(future.result()) or stopped
+            for future in pending:
+                future.cancel()
+    return summaries, violations, stopped
+
+
+def dataset_rows(summaries):
+    """Row count of a dataset from its column summaries."""
+    return max((summary["rows"] for summary in summaries.values()), default=0)
+
+
+def check_feature_ranges(summaries, feature_cols):
     """Check that all feature columns are in [0,1] range."""
     issues = []
     for col in feature_cols:
+        summary = summaries.get(col)
         # Skip non-numeric columns
-        if not pd.api.types.is_numeric_dtype(df[col]):
+        if summary is None or not summary.get("numeric", True):
             continue
-        min_val = df[col].min()
-        max_val = df[col].max()
-        if pd.isna(min_val) or pd.isna(max_val):
+        if summary["missing"]:
             issues.append(f"{col}: contains NaN values")
-        elif min_val < 0 or max_val > 1:
-            issues.append(f"{col}: range [{min_val:.4f}, {max_val:.4f}] outside [0,1]")
+        elif summary["min"] is not None and (summary["min"] < 0 or summary["max"] > 1):
+            issues.append(f"{col}: range [{summary['min']:.4f}, {summary['max']:.4f}] outside [0,1]")
     return issues
 
-def check_time_based_split(train_df, val_df):
+
+def check_time_based_split(train_summaries, val_summaries):
     """Verify that validation timestamps are all after training timestamps."""
-    if 'timestamp' not in train_df.columns or 'timestamp' not in val_df.columns:
+    train_time = train_summaries.get('timestamp')
+    val_time = val_summaries.get('timestamp')
+    if not train_time or not val_time or train_time["max"] is None or val_time["min"] is None:
         return True, 0, 0
-    max_train_time = train_df['timestamp'].max()
-    min_val_time = val_df['timestamp'].min()
+    max_train_time = train_time["max"]
+    min_val_time = val_time["min"]
     return min_val_time >= max_train_time, max_train_time, min_val_time
 
+
 def main():
-    train_csv = sys.argv[1] if len(sys.argv) > 1 else "datasets/train.csv"
-    val_csv = sys.argv[2] if len(sys.argv) > 2 else "datasets/val.csv"
-    
-    if not Path(train_csv).exists():
-        print(f"❌ Error: Training CSV file '{train_csv}' not found!")
+    parser = argparse.ArgumentParser(description="Verify train/val dataset quality")
+    parser.add_argument("train_path", nargs="?", default=default_dataset_path("train"),
+                        help="Training dataset (default: datasets/train.parquet)")
+    parser.add_argument("val_path", nargs="?", default=default_dataset_path("val"),
+                        help="Validation dataset (default: datasets/val.parquet)")
+    parser.add_argument("--fail-fast", action="store_true",
+                        help="Stop at the first hard violation (exit status 1)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes (default: CPU count)")
+    parser.add_argument("--stats", action="store_true",
+                        help="Also compute full statistics and write JSON reports next to the datasets")
+    args = parser.parse_args()
+    train_path, val_path = args.train_path, args.val_path
+
+    if not Path(train_path).exists():
+        print(f"❌ Error: Training dataset '{train_path}' not found!")
         sys.exit(1)
-    
-    if not Path(val_csv).exists():
-        print(f"❌ Error: Validation CSV file '{val_csv}' not found!")
+
+    if not Path(val_path).exists():
+        print(f"❌ Error: Validation dataset '{val_path}' not found!")
         sys.exit(1)
-    
+
     print("🔍 Verifying dataset quality...\n")
-    
-    # Load datasets
-    train_df = pd.read_csv(train_csv)
-    val_df = pd.read_csv(val_csv)
-    
+
+    summaries, violations, stopped = verify_chunks(train_path, val_path, args.workers, args.fail_fast)
+    if stopped:
+        print("❌ Hard violation found, stopping early:")
+        for issue in violations:
+            print(f"  {issue}")
+        sys.exit(1)
+    train_summaries, val_summaries = summaries["train"], summaries["val"]
+    rows = {side: dataset_rows(summaries[side]) for side in summaries}
+
     print(f"📊 Basic Statistics:")
-    print(f"  Train samples: {len(train_df)}")
-    print(f"  Val samples: {len(val_df)}")
-    print(f"  Total samples: {len(train_df) + len(val_df)}\n")
-    
+    print(f"  Train samples: {rows['train']}")
+    print(f"  Val samples: {rows['val']}")
+    print(f"  Total samples: {rows['train'] + rows['val']}\n")
+
     # Identify feature columns (exclude metadata)
-    metadata_cols = ['matchType', 'preset', 'timestamp', 'label']
-    feature_cols = [c for c in train_df.columns if c not in metadata_cols]
-    
+    metadata_cols = METADATA_COLUMNS
+    feature_cols = [c for c in train_summaries if c not in metadata_cols]
+
     print(f"📈 Dataset Columns:")
     print(f"  Feature columns: {len(feature_cols)}")
     print(f"  Metadata columns: {len(metadata_cols)}\n")
-    
+
     # Check 1: Match types
     print("📈 Match Types:")
-    train_types = train_df['matchType'].value_counts()
-    val_types = val_df['matchType'].value_counts()
-    
+    train_types = (train_summaries.get('matchType') or {}).get('counts') or {}
+    val_types = (val_summaries.get('matchType') or {}).get('counts') or {}
+
     for match_type in ['user_user', 'user_group']:
         train_count = train_types.get(match_type, 0)
         val_count = val_types.get(match_type, 0)
         print(f"  {match_type}: train={train_count}, val={val_count}")
-    
+
     # Check 2: Labels
     print("📊 Labels:")
-    train_labels = train_df['label'].value_counts().sort_index()
-    val_labels = val_df['label'].value_counts().sort_index()
-    
+    train_labels = (train_summaries.get('label') or {}).get('counts') or {}
+    val_labels = (val_summaries.get('label') or {}).get('counts') or {}
+
     for label in [0, 1]:
-        train_count = train_labels.get(label, 0)
-        val_count = val_labels.get(label, 0)
-        train_pct = (train_count / len(train_df) * 100) if len(train_df) > 0 else 0
-        val_pct = (val_count / len(val_df) * 100) if len(val_df) > 0 else 0
+        train_count = train_labels.get(str(label), 0)
+        val_count = val_labels.get(str(label), 0)
+        train_pct = (train_count / rows['train'] * 100) if rows['train'] else 0
+        val_pct = (val_count / rows['val'] * 100) if rows['val'] else 0
         print(f"  Label {label}: train={train_count} ({train_pct:.1f}%), val={val_count} ({val_pct:.1f}%)")
-    
+    for issue in violations:
+        if issue.startswith(("train label", "val label")):
+            print(f"  ❌ {issue}")
+
     # Check 3: Feature ranges
     print("🔍 Feature Ranges [0,1]:")
-    train_issues = check_feature_ranges(train_df, feature_cols)
-    val_issues = check_feature_ranges(val_df, feature_cols)
-    
+    train_issues = check_feature_ranges(train_summaries, feature_cols)
+    val_issues = check_feature_ranges(val_summaries, feature_cols)
+
     if not train_issues and not val_issues:
         print("  ✅ All feature columns are in [0,1] range\n")
     else:
         print("  ❌ Feature range issues found\n")
-    
+        for issue in train_issues:
+            print(f"    train: {issue}")
+        for issue in val_issues:
+            print(f"    val: {issue}")
+
     # Check 4: Time-based split
     print("⏰ Time-Based Split:")
-    split_ok, max_train_time, min_val_time = check_time_based_split(train_df, val_df)
-    
+    split_ok, max_train_time, min_val_time = check_time_based_split(train_summaries, val_summaries)
+
     if split_ok:
         print(f"  ✅ Time-based split respected\n")
     else:
         print(f"  ❌ Time-based split violated!\n")
-    
+
+    if args.stats:
+        # Machine-readable reports next to the datasets
+        checks = {"violations": violations, "time_split_ok": bool(split_ok)}
+        print("📝 Stats reports:")
+        for path in (train_path, val_path):
+            print(f"  {write_stats_report(compute_dataset_stats(path, args.workers), path, {'checks': checks})}")
+        print()
+
     # Summary
     print("=" * 60)
     print("\n✅ Verification complete!")
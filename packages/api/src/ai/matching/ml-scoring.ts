@@ -10,6 +10,7 @@ import { extractCompatibilityFeatures } from "../features/compatibility-features
 import { CompatibilityFeatures } from "../utils/ml-types";
 import { spawn } from "child_process";
 import { join } from "path";
+import { gzipSync } from "zlib";
 
 interface MLPredictionResult {
   success: boolean;
@@ -17,6 +18,8 @@ interface MLPredictionResult {
   prediction?: number;
   score?: number;
   error?: string;
+  /** True when the ML server had no model and used its rule-based fallback */
+  fallback?: boolean;
 }
 
 interface MLScoringOptions {
@@ -135,13 +138,19 @@ export async function executeMLPredictionBatch(
   }));
 
   try {
+    const body = JSON.stringify({
+      features_list: featuresPayloadList,
+      model_dir: options.modelDir || "models",
+    });
+    // Batch payloads repeat every feature name and compress very well
+    const compress = process.env.ML_SERVER_COMPRESSION === "gzip";
     const response = await fetch(`${serverUrl}/predict/batch`, {
       method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({
-        features_list: featuresPayloadList,
-        model_dir: options.modelDir || "models",
-      }),
+      headers: {
+        "Content-Type": "application/json",
+        ...(compress ? { "Content-Encoding": "gzip" } : {}),
+      },
+      body: compress ? gzipSync(body) : body,
       signal: AbortSignal.timeout(10000),
     });
 